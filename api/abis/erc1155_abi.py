@@ -358,6 +358,30 @@ erc1155_abi = json.loads("""
       ],
       "stateMutability":"view",
       "type":"function"
+   },
+   {
+      "inputs":[
+         {
+            "internalType":"address[]",
+            "name":"accounts",
+            "type":"address[]"
+         },
+         {
+            "internalType":"uint256[]",
+            "name":"ids",
+            "type":"uint256[]"
+         }
+      ],
+      "name":"balanceOfBatch",
+      "outputs":[
+         {
+            "internalType":"uint256[]",
+            "name":"",
+            "type":"uint256[]"
+         }
+      ],
+      "stateMutability":"view",
+      "type":"function"
    }
 ]
 """)
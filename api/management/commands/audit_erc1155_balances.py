@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from api.models import CollectionType, Erc721Token, Erc1155Transfer
+
+# Overlaps the hourly schedule so a slow run doesn't leave gaps
+AUDIT_LOOKBACK = timedelta(hours=2)
+
+
+class Command(BaseCommand):
+    help = "Check ERC-1155 ledger balances against balanceOfBatch and fix drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("address", nargs="?", type=str)
+
+    def handle(self, address=None, *args, **kwargs):
+        if address:
+            tokens = Erc721Token.objects.filter(
+                smart_contract__address=address,
+                smart_contract__type=CollectionType.ERC1155,
+            )
+        else:
+            since = datetime.now(tz=timezone.utc) - AUDIT_LOOKBACK
+            token_ids = (
+                Erc1155Transfer.objects.filter(created_at__gte=since)
+                .values_list("token_id", flat=True)
+                .distinct()
+            )
+            tokens = Erc721Token.objects.filter(id__in=token_ids)
+
+        tokens = tokens.select_related("smart_contract__network")
+        print(f"Auditing balances for {len(tokens)} tokens")
+
+        num_drifted = 0
+        for token in tokens:
+            try:
+                num_drifted += token.audit_erc1155_balances()
+            except Exception as e:
+                print(f"Error auditing {token}: {e}")
+
+        print(f"Corrected {num_drifted} balances")
@@ -0,0 +1,58 @@
+from datetime import timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+
+from api.models import CollectionDailyStats, CollectionHourlyStats, Sale
+
+
+class Command(BaseCommand):
+    help = "Rebuild collection hourly and daily stats from sales"
+
+    def add_arguments(self, parser):
+        parser.add_argument("address", nargs="?", type=str)
+
+    def handle(self, address=None, *args, **kwargs):
+        sales = Sale.objects.filter(collection__isnull=False)
+        if address:
+            sales = sales.filter(collection__address=address)
+
+        for model, field, trunc in (
+            (CollectionDailyStats, "date", TruncDate),
+            (CollectionHourlyStats, "hour", TruncHour),
+        ):
+            existing = model.objects.all()
+            if address:
+                existing = existing.filter(collection__address=address)
+
+            rows = (
+                sales.annotate(period=trunc("timestamp", tzinfo=timezone.utc))
+                .values("collection_id", "period")
+                .annotate(
+                    num_sales=Count("id"),
+                    volume=Sum("price_eth"),
+                    min_price=Min("price_eth"),
+                    max_price=Max("price_eth"),
+                )
+                .order_by()
+            )
+            stats = [
+                model(
+                    collection_id=row["collection_id"],
+                    sales=row["num_sales"],
+                    volume=max(row["volume"] or 0, 0),
+                    min_price=row["min_price"],
+                    max_price=row["max_price"],
+                    **{field: row["period"]},
+                )
+                for row in rows
+            ]
+
+            # Floor snapshots can't be rebuilt, so they're lost for these periods
+            with transaction.atomic():
+                existing.delete()
+                model.objects.bulk_create(stats, batch_size=1000)
+
+            print(f"Wrote {len(stats)} {model._meta.verbose_name_plural}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.models import (
+    Erc721BuyOrder,
+    Erc721DutchAuction,
+    Erc721SellOrder,
+    Sale,
+)
+from api.utils.sales import sale_from_order
+
+
+class Command(BaseCommand):
+    help = "Create the missing Sale rows for fulfilled orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("address", nargs="?", type=str)
+
+    def handle(self, address=None, *args, **kwargs):
+        # Historical prices aren't stored, so older sales use the current rates
+        for model in (Erc721SellOrder, Erc721BuyOrder, Erc721DutchAuction):
+            orders = model.objects.filter(
+                fulfilled=True, time_sold__isnull=False, sale__isnull=True
+            ).select_related("token", "payment_token")
+            if address:
+                orders = orders.filter(token__collection__address=address)
+
+            sales = [sale_from_order(order) for order in orders.iterator()]
+            Sale.objects.bulk_create(sales, batch_size=1000, ignore_conflicts=True)
+            print(f"Wrote {len(sales)} sales for {model.__name__}")
@@ -1,6 +1,8 @@
 from api.models import Contract, Erc721Token
+from api.utils.metadata_utils import refresh_tokens_metadata
 from django.core.management.base import BaseCommand
-from django.db import transaction
+
+BATCH_SIZE = 500
 
 
 class Command(BaseCommand):
@@ -11,17 +13,20 @@ class Command(BaseCommand):
 
     def handle(self, address, *args, **kwargs):
         smart_contract = Contract.objects.get(address=address[0])
-        tokens = Erc721Token.objects.filter(smart_contract=smart_contract)
-        print(f"Refreshing metadata for {len(tokens)} tokens in {smart_contract}")
-
-        i = 0
-        for t in tokens:
-            with transaction.atomic():
-                token = Erc721Token.objects.select_for_update().get(id=t.id)
-                token.refresh_metadata()
+        token_ids = list(
+            Erc721Token.objects.filter(smart_contract=smart_contract).values_list(
+                "id", flat=True
+            )
+        )
+        print(f"Refreshing metadata for {len(token_ids)} tokens in {smart_contract}")
 
-            if i % 100 == 0:
-                print(f"====> {i}", t)
-            i += 1
+        # Each batch fetches its metadata concurrently
+        for i in range(0, len(token_ids), BATCH_SIZE):
+            refresh_tokens_metadata(
+                Erc721Token.objects.filter(
+                    id__in=token_ids[i : i + BATCH_SIZE]
+                ).select_related("smart_contract__network", "collection")
+            )
+            print(f"====> {i + BATCH_SIZE}")
 
         print(f"Finished refreshing metadata for {smart_contract}")
@@ -1,14 +1,8 @@
 import json
-import os
 
-from api.utils.process_transfer_ws import handle_transfer_event
-from batch_processing.tasks.token.tasks import process_erc721_transfer_event
+from api.utils.transfer_pipeline import process_transfer_txn_event
 from django.core.management.base import BaseCommand
 
-erc721_safe_transfer_from_topic = (
-    "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
-)
-
 
 class Command(BaseCommand):
     help = "Update the backend system to take into account a particular txn."
@@ -18,13 +12,4 @@ class Command(BaseCommand):
 
     def handle(self, transfer_txn_ids, *args, **kwargs):
         json_event = json.loads(transfer_txn_ids[0])
-        is_erc721_transfer = json_event["topics"][0] == erc721_safe_transfer_from_topic
-        if os.environ.get("USE_CELERY_PROCESS_TXN") and is_erc721_transfer:
-            address = json_event["address"]
-            topics = tuple(json_event["topics"])
-            transactionHash = json_event["transactionHash"]
-            process_erc721_transfer_event.apply_async(
-                (transactionHash, address, topics), queue="process_txn"
-            )
-        else:
-            handle_transfer_event(json_event)
+        process_transfer_txn_event(json_event)
@@ -7,13 +7,27 @@ from django.core.management.base import BaseCommand
 from api.models import BlockchainState, CollectionType, Contract
 from api.utils.constants import ALCHEMY_URL, NETWORK, w3
 from api.utils.process_transfer_ws import handle_transfer_event
-from batch_processing.tasks.token.tasks import queue_handle_transfer_event
+from api.utils.process_transfer_bulk import (
+    DEFAULT_CHUNK_SIZE,
+    handle_transfer_events_bulk,
+)
+from batch_processing.tasks.token.tasks import (
+    queue_handle_transfer_event,
+    queue_handle_transfer_events_bulk,
+)
 
 
 class Command(BaseCommand):
     help = "Pull new transfers for all ERC-721 contracts"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Ingest each block range with set-based writes",
+        )
+
+    def handle(self, *args, bulk=False, **kwargs):
         block, _created = BlockchainState.objects.get_or_create(
             key="transfer_filter_block_erc1155"
         )
@@ -30,13 +44,7 @@ class Command(BaseCommand):
 
         if "result" in events:
             print(f'Found {len(events["result"])} events.')
-            for event in events["result"]:
-                if os.environ.get("USE_CELERY_PROCESS_TXN"):
-                    txn = queue_handle_transfer_event.apply_async(
-                        (event,), queue="process_txn_backfill"
-                    )
-                else:
-                    handle_transfer_event(event)
+            self.process_events(events["result"], bulk)
 
             block.value = hex(latest_block)
             block.save()
@@ -50,13 +58,7 @@ class Command(BaseCommand):
 
             if "result" in events:
                 print(f'Found {len(events["result"])} events.')
-                for event in events["result"]:
-                    if os.environ.get("USE_CELERY_PROCESS_TXN"):
-                        txn = queue_handle_transfer_event.apply_async(
-                            (event,), queue="process_txn_backfill"
-                        )
-                    else:
-                        handle_transfer_event(event)
+                self.process_events(events["result"], bulk)
 
                 block.value = end_block
                 block.save()
@@ -93,6 +95,26 @@ class Command(BaseCommand):
         print(r_json)
         return r_json["result"]
 
+    def process_events(self, events, bulk=False):
+        if bulk:
+            if os.environ.get("USE_CELERY_PROCESS_TXN"):
+                for i in range(0, len(events), DEFAULT_CHUNK_SIZE):
+                    queue_handle_transfer_events_bulk.apply_async(
+                        (events[i : i + DEFAULT_CHUNK_SIZE],),
+                        queue="process_txn_backfill",
+                    )
+            else:
+                handle_transfer_events_bulk(events)
+            return
+
+        for event in events:
+            if os.environ.get("USE_CELERY_PROCESS_TXN"):
+                queue_handle_transfer_event.apply_async(
+                    (event,), queue="process_txn_backfill"
+                )
+            else:
+                handle_transfer_event(event)
+
     def get_events(self, filter_id):
         data = {
             "jsonrpc": "2.0",
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Erc721Collection
+from api.utils.collection_stats import mark_stats_dirty, rebuild_holders
+
+
+class Command(BaseCommand):
+    help = "Recount collection holders from token owners"
+
+    def add_arguments(self, parser):
+        parser.add_argument("address", nargs="?", type=str)
+
+    def handle(self, address=None, *args, **kwargs):
+        collections = Erc721Collection.objects.all()
+        if address:
+            collections = collections.filter(address=address)
+
+        collection_ids = list(collections.order_by("id").values_list("id", flat=True))
+        num_holders = 0
+        for collection_id in collection_ids:
+            num_holders += rebuild_holders([collection_id])
+        # Owners in the collection stats are counted from the holders
+        mark_stats_dirty(collection_ids)
+
+        print(f"Wrote {num_holders} holders for {len(collection_ids)} collections")
@@ -1,25 +1,39 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
 import os
+import time
+
+from django.core.management.base import BaseCommand
 
 from api.models import Erc721Collection
-from batch_processing.tasks.collection.tasks import refresh_collection_stats
-from django.core.cache import cache
+from api.utils.collection_stats import (
+    refresh_collections_stats,
+    refresh_dirty_collections_stats,
+)
+
+BATCH_SIZE = 2000
 
-CACHE_KEY = "SKIP_REFRESH_STATS"
 
 class Command(BaseCommand):
-    help = "Refresh stats for all collections"
+    help = "Refresh stats for collections that changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Refresh every approved collection"
+        )
 
     def handle(self, *args, **kwargs):
-        if cache.get(CACHE_KEY):
-            print("Cache says to skip refreshing stats.")
-            return
-
-        for col in Erc721Collection.objects.filter(approved=True):
-            # self.stdout.write(f"Refreshing stats for: {col}")
-            if os.environ.get("USE_CELERY"):
-                refresh_collection_stats.apply_async((col.id,), queue="stats")
-                cache.set(CACHE_KEY, True, 60 * 15)  # Skip refresh stats for the next 15 minutes since it just ran.
-            else:
-                col.refresh_stats()
+        using = "default"
+        if os.environ.get("DATABASE_FOLLOWER_CONNECTION_POOL_URL"):
+            using = "follower"
+
+        start = time.time()
+        if kwargs["all"]:
+            collections = list(
+                Erc721Collection.objects.filter(approved=True).order_by("id")
+            )
+            for i in range(0, len(collections), BATCH_SIZE):
+                refresh_collections_stats(collections[i : i + BATCH_SIZE], using)
+        else:
+            collections = refresh_dirty_collections_stats(using, BATCH_SIZE)
+
+        elapsed = time.time() - start
+        print(f"Refreshed stats for {len(collections)} collections in {elapsed:.1f}s")
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.models import Profile
+from api.utils.ens_utils import ENS_BATCH_SIZE, refresh_ens_for_profiles
+
+MAX_PROFILES_PER_RUN = 5000
+# Re-check profiles that have a name once a week in case it moved or expired
+RECHECK_NAMED_AFTER = timedelta(days=7)
+# Most addresses never set a name, so check those less often for one set later
+RECHECK_UNNAMED_AFTER = timedelta(days=30)
+
+
+class Command(BaseCommand):
+    help = "Resolve reverse ENS names for new and stale profiles"
+
+    def handle(self, *args, **kwargs):
+        now = datetime.now(tz=timezone.utc)
+        profile_ids = list(
+            Profile.objects.filter(
+                Q(ens_checked_at=None)
+                | Q(
+                    reverse_ens__isnull=False,
+                    ens_checked_at__lt=now - RECHECK_NAMED_AFTER,
+                )
+                | Q(reverse_ens=None, ens_checked_at__lt=now - RECHECK_UNNAMED_AFTER)
+            )
+            .order_by("-id")
+            .values_list("id", flat=True)[:MAX_PROFILES_PER_RUN]
+        )
+
+        print(f"Resolving ENS for {len(profile_ids)} profiles")
+        for i in range(0, len(profile_ids), ENS_BATCH_SIZE):
+            refresh_ens_for_profiles(profile_ids[i : i + ENS_BATCH_SIZE])
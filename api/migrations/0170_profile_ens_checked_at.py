@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2022-12-12 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0169_publicapikeyaccesslog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='ens_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.1 on 2022-12-14 15:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0170_profile_ens_checked_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Erc1155Transfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txn_id', models.TextField()),
+                ('log_index', models.PositiveIntegerField()),
+                ('batch_index', models.PositiveIntegerField(default=0)),
+                ('block_number', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('quantity', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('from_profile', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.profile')),
+                ('to_profile', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.profile')),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.erc721token')),
+            ],
+            options={
+                'unique_together': {('txn_id', 'log_index', 'batch_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.1 on 2022-12-15 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0171_erc1155transfer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadataCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.TextField(unique=True)),
+                ('data', models.BinaryField()),
+                ('etag', models.TextField(blank=True, null=True)),
+                ('last_modified', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Metadata cache entries',
+            },
+        ),
+    ]
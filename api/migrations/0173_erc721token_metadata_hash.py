@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2022-12-16 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0172_metadatacacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erc721token',
+            name='metadata_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.1 on 2022-12-17 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0173_erc721token_metadata_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=64)),
+                ('variant', models.CharField(max_length=32)),
+                ('source_path', models.TextField(blank=True, db_index=True, null=True)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('url', models.URLField(max_length=10000)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('source_hash', 'variant')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.1 on 2022-12-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0174_mediaobject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erc721collection',
+            name='profile_image_variants',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='erc721token',
+            name='image_variants',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.1 on 2022-12-19 10:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0175_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('volume', models.PositiveBigIntegerField(default=0)),
+                ('volume_op', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.erc721collection')),
+            ],
+            options={
+                'verbose_name_plural': 'Collection daily stats',
+                'unique_together': {('collection', 'date')},
+            },
+        ),
+    ]
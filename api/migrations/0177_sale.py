@@ -0,0 +1,47 @@
+# Generated by Django 4.0.1 on 2022-12-20 14:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0176_collectiondailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('txn_id', models.TextField(blank=True, null=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('price', models.BigIntegerField()),
+                ('price_eth', models.BigIntegerField(blank=True, null=True)),
+                ('price_usd', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('buy_order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.erc721buyorder')),
+                ('buyer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='api.profile')),
+                ('collection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.erc721collection')),
+                ('dutch_auction', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.erc721dutchauction')),
+                ('payment_token', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='api.paymenttoken')),
+                ('sell_order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.erc721sellorder')),
+                ('seller', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sales', to='api.profile')),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.erc721token')),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='collectiondailystats',
+            name='volume_op',
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['collection', 'timestamp'], include=('price_eth',), name='sale_collection_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['token', 'timestamp'], include=('price_eth',), name='sale_token_time_idx'),
+        ),
+    ]
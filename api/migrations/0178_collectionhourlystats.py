@@ -0,0 +1,47 @@
+# Generated by Django 4.0.1 on 2022-12-21 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0177_sale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('volume', models.PositiveBigIntegerField(default=0)),
+                ('min_price', models.BigIntegerField(blank=True, null=True)),
+                ('max_price', models.BigIntegerField(blank=True, null=True)),
+                ('floor', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.erc721collection')),
+            ],
+            options={
+                'verbose_name_plural': 'Collection hourly stats',
+                'unique_together': {('collection', 'hour')},
+            },
+        ),
+        migrations.AddField(
+            model_name='collectiondailystats',
+            name='floor',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='collectiondailystats',
+            name='max_price',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='collectiondailystats',
+            name='min_price',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
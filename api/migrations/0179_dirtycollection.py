@@ -0,0 +1,21 @@
+# Generated by Django 4.0.1 on 2022-12-22 11:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0178_collectionhourlystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyCollection',
+            fields=[
+                ('collection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.erc721collection')),
+                ('marked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
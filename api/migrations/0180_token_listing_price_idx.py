@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2022-12-22 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0179_dirtycollection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='erc721token',
+            index=models.Index(condition=models.Q(('for_sale', True)), fields=['collection', 'price_eth', 'id'], name='token_listing_price_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.1 on 2022-12-23 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0180_token_listing_price_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionHolder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='erc721token',
+            index=models.Index(fields=['collection', 'owner'], name='token_collection_owner_idx'),
+        ),
+        migrations.AddField(
+            model_name='collectionholder',
+            name='collection',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.erc721collection'),
+        ),
+        migrations.AddField(
+            model_name='collectionholder',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holdings', to='api.profile'),
+        ),
+        migrations.AddIndex(
+            model_name='collectionholder',
+            index=models.Index(fields=['collection', '-quantity', 'owner'], name='holder_collection_qty_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='collectionholder',
+            unique_together={('collection', 'owner')},
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.0.1 on 2022-12-23 15:40
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0181_collectionholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erc721collection',
+            name='volume_change_24h',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='erc721collection',
+            name='volume_change_30d',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='erc721collection',
+            name='volume_change_7d',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(condition=models.Q(('approved', True), ('delisted', False), ('volume__gt', 0)), fields=['-volume'], name='collection_volume_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(condition=models.Q(('approved', True), ('delisted', False), ('volume_24h__gt', 0)), fields=['-volume_24h'], name='collection_volume_24h_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(condition=models.Q(('approved', True), ('delisted', False), ('volume_7d__gt', 0)), fields=['-volume_7d'], name='collection_volume_7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(condition=models.Q(('approved', True), ('delisted', False), ('volume_30d__gt', 0)), fields=['-volume_30d'], name='collection_volume_30d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(django.db.models.expressions.OrderBy(django.db.models.expressions.F('volume_change_24h'), descending=True, nulls_last=True), condition=models.Q(('approved', True), ('delisted', False), ('volume_24h__gt', 0)), name='collection_change_24h_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(django.db.models.expressions.OrderBy(django.db.models.expressions.F('volume_change_7d'), descending=True, nulls_last=True), condition=models.Q(('approved', True), ('delisted', False), ('volume_7d__gt', 0)), name='collection_change_7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erc721collection',
+            index=models.Index(condition=models.Q(('approved', True), ('delisted', False), ('is_spam', False), models.Q(('volume__gt', 0), ('verified', True), _connector='OR')), fields=['-volume_30d'], name='collection_explore_idx'),
+        ),
+    ]
@@ -4,14 +4,15 @@ import time
 import uuid
 from collections import defaultdict
 from datetime import datetime, timezone
+from itertools import chain
 from random import shuffle
 from time import sleep
 
 import requests
 from django.core.cache import cache
-from django.db import models
-from django.db.models import Avg, Count, Q, Sum
-from django.db.models.functions import Coalesce, TruncDate
+from django.db import models, transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import TruncDate
 from django.utils.translation import gettext_lazy as _
 from web3 import Web3
 
@@ -34,7 +35,7 @@ from api.utils.email_utils import (
     send_email_about_campaign_budget,
     send_email_about_campaign_distribution,
 )
-from api.utils.ens_utils import get_address_for_ens, get_ens_for_address
+from api.utils.ens_utils import get_ens_for_address
 from api.utils.Erc20Contract import Erc20Contract
 from api.utils.Erc721Contract import Erc721Contract
 from api.utils.Erc1155Contract import Erc1155Contract
@@ -68,6 +69,7 @@ class Profile(models.Model):
     minimum_offer = models.PositiveBigIntegerField(blank=True, null=True)
 
     reverse_ens = models.TextField(null=True, blank=True, unique=True)
+    ens_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     # Internal flags
     notifications_read = models.BooleanField(default=True)
@@ -214,20 +216,17 @@ class Profile(models.Model):
         return Profile.objects.filter(id__in=profile_ids[:12])
 
     def refresh_ens(self, should_save=True):
+        # get_ens_for_address already checks the name resolves back to this address
         ens = get_ens_for_address(self.address)
-        address = get_address_for_ens(ens)
 
-        if address == self.address and not is_restricted(ens):
-            try:
-                existing_profile = Profile.objects.get(reverse_ens=ens)
-                if self != existing_profile:
-                    existing_profile.reverse_ens = None
-                    existing_profile.save()
-                    self.reverse_ens = ens
-            except Exception:
-                self.reverse_ens = ens
+        if ens and not is_restricted(ens):
+            Profile.objects.filter(reverse_ens=ens).exclude(id=self.id).update(
+                reverse_ens=None
+            )
+            self.reverse_ens = ens
         else:
             self.reverse_ens = None
+        self.ens_checked_at = datetime.now(tz=timezone.utc)
 
         if should_save:
             self.save()
@@ -238,8 +237,17 @@ class Profile(models.Model):
         ), f"Profile address must be a checksum address: {self.address}"
         if self.username == "":
             self.username = None
-        self.refresh_ens(should_save=False)
-        return super(Profile, self).save(*args, **kwargs)
+        is_new = self._state.adding
+        res = super(Profile, self).save(*args, **kwargs)
+
+        # Resolve ENS in the background so saving never waits on mainnet RPCs
+        if is_new and os.environ.get("USE_CELERY"):
+            from batch_processing.tasks.profile.tasks import refresh_profile_ens
+
+            transaction.on_commit(
+                lambda: refresh_profile_ens.apply_async(([self.id],), queue="celery")
+            )
+        return res
 
     def pull_tokens_for_profile_for_collection(self, collection_address):
         from batch_processing.tasks.token.tasks import (
@@ -366,63 +374,32 @@ class Contract(models.Model):
         return self.network.chain_id in ("0x1", "0x5")
 
     def pull_new_tokens(self):
+        from .utils.process_transfer_bulk import discover_minted_tokens
+
         token_count = Erc721Token.objects.filter(smart_contract=self).count()
 
         if self.total_supply and token_count < self.total_supply:
-            import concurrent.futures
-
             print(f"Pulling new tokens for {self.name} ({self.address})")
             if self.type == CollectionType.ERC721:
                 contract = Erc721Contract(self.address, self.network.network_id)
-                events = contract.transfer_events_from_address(
+                events = contract.iter_transfer_events(
                     address="0x0000000000000000000000000000000000000000"
                 )
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as pool:
-                    token_ids = set(
-                        Erc721Token.objects.filter(smart_contract=self).values_list(
-                            "token_id", flat=True
-                        )
-                    )
-                    events = [
-                        e for e in events if str(e["args"]["tokenId"]) not in token_ids
-                    ]
-                    for event in events:
-                        token_id = event["args"]["tokenId"]
-                        if not Erc721Token.objects.filter(
-                                smart_contract=self, token_id=token_id
-                        ).exists():
-                            sleep(0.01)
-                            future = pool.submit(self.pull_erc721_token, token_id)
-                        else:
-                            print(f"Skipping: {token_id}")
-
             elif self.type == CollectionType.ERC1155:
                 contract = Erc1155Contract(self.address, self.network.network_id)
-                single_events = contract.single_transfer_events_from_address(
-                    address="0x0000000000000000000000000000000000000000"
-                )
-                batch_events = contract.batch_transfer_events_from_address(
-                    address="0x0000000000000000000000000000000000000000"
+                events = chain(
+                    contract.iter_single_transfer_events(
+                        address="0x0000000000000000000000000000000000000000"
+                    ),
+                    contract.iter_batch_transfer_events(
+                        address="0x0000000000000000000000000000000000000000"
+                    ),
                 )
-                events = single_events + batch_events
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as pool:
-                    token_ids = set(
-                        Erc721Token.objects.filter(smart_contract=self).values_list(
-                            "token_id", flat=True
-                        )
-                    )
-                    events = [
-                        e for e in events if str(e["args"]["id"]) not in token_ids
-                    ]
-                    for event in events:
-                        token_id = event["args"]["id"]
-                        if not Erc721Token.objects.filter(
-                                smart_contract=self, token_id=token_id
-                        ).exists():
-                            sleep(0.01)
-                            future = pool.submit(self.pull_erc1155_token, token_id)
-                        else:
-                            print(f"Skipping: {token_id}")
+            else:
+                return
+
+            # Tokens and owners come straight from the mint events, metadata is queued
+            discover_minted_tokens(self, events)
 
     def pull_erc721_token(self, token_id, queue=True):
         print(f"Starting to pull token index: {token_id}")
@@ -579,6 +556,46 @@ class Erc721Collection(models.Model):
     class Meta:
         verbose_name = "Collection"
         unique_together = ("address", "network")
+        # One partial index per stats leaderboard, each holding only the
+        # collections that leaderboard can show
+        indexes = [
+            models.Index(
+                fields=["-volume"],
+                condition=Q(approved=True, delisted=False, volume__gt=0),
+                name="collection_volume_idx",
+            ),
+            models.Index(
+                fields=["-volume_24h"],
+                condition=Q(approved=True, delisted=False, volume_24h__gt=0),
+                name="collection_volume_24h_idx",
+            ),
+            models.Index(
+                fields=["-volume_7d"],
+                condition=Q(approved=True, delisted=False, volume_7d__gt=0),
+                name="collection_volume_7d_idx",
+            ),
+            models.Index(
+                fields=["-volume_30d"],
+                condition=Q(approved=True, delisted=False, volume_30d__gt=0),
+                name="collection_volume_30d_idx",
+            ),
+            models.Index(
+                F("volume_change_24h").desc(nulls_last=True),
+                condition=Q(approved=True, delisted=False, volume_24h__gt=0),
+                name="collection_change_24h_idx",
+            ),
+            models.Index(
+                F("volume_change_7d").desc(nulls_last=True),
+                condition=Q(approved=True, delisted=False, volume_7d__gt=0),
+                name="collection_change_7d_idx",
+            ),
+            models.Index(
+                fields=["-volume_30d"],
+                condition=Q(approved=True, delisted=False, is_spam=False)
+                & (Q(volume__gt=0) | Q(verified=True)),
+                name="collection_explore_idx",
+            ),
+        ]
 
     primary_contract = models.OneToOneField(
         Contract,
@@ -608,6 +625,8 @@ class Erc721Collection(models.Model):
     )
     profile_image_url = models.URLField(null=True, blank=True, max_length=750)
     profile_image_hash = models.CharField(null=True, blank=True, max_length=750)
+    # {"thumbnail_200_webp": url, ...} for the pulled profile image
+    profile_image_variants = models.JSONField(null=True, blank=True)
     cover_image = models.ImageField(
         upload_to="quixotic-collection-cover/", max_length=512, null=True, blank=True
     )
@@ -652,6 +671,10 @@ class Erc721Collection(models.Model):
     volume_prev_24h = models.PositiveBigIntegerField(blank=True, null=True, default=0)
     volume_prev_7d = models.PositiveBigIntegerField(blank=True, null=True, default=0)
     volume_prev_30d = models.PositiveBigIntegerField(blank=True, null=True, default=0)
+    # Change in volume from the previous window, None without previous volume
+    volume_change_24h = models.FloatField(blank=True, null=True)
+    volume_change_7d = models.FloatField(blank=True, null=True)
+    volume_change_30d = models.FloatField(blank=True, null=True)
     sales = models.PositiveIntegerField(blank=True, null=True, default=0)
     sales_24h = models.PositiveIntegerField(blank=True, null=True, default=0)
     sales_7d = models.PositiveIntegerField(blank=True, null=True, default=0)
@@ -676,44 +699,13 @@ class Erc721Collection(models.Model):
 
     # NOTE: This is dependent on the Collection <> Token model relationship
     def refresh_stats(self):
-        from .utils.collection_stats import (
-            collection_24h_sales,
-            collection_24h_volume,
-            collection_floor_price,
-            collection_listed_count,
-            collection_prev_24h_volume,
-            collection_prev_Xd_volume,
-            collection_sales,
-            collection_supply,
-            collection_unique_owners,
-            collection_volume,
-            collection_Xd_sales,
-            collection_Xd_volume,
-        )
+        from .utils.collection_stats import refresh_collections_stats
 
         using = "default"
         if os.environ.get("DATABASE_FOLLOWER_CONNECTION_POOL_URL"):
             using = "follower"
 
-        self.floor = collection_floor_price(self, using)
-        self.volume = collection_volume(self, using)
-        self.volume_24h = collection_24h_volume(self, using)
-        self.volume_7d = collection_Xd_volume(self, 7, using)
-        self.volume_30d = collection_Xd_volume(self, 30, using)
-
-        self.volume_prev_24h = collection_prev_24h_volume(self, using)
-        self.volume_prev_7d = collection_prev_Xd_volume(self, 7, using)
-        self.volume_prev_30d = collection_prev_Xd_volume(self, 30, using)
-
-        self.sales = collection_sales(self, using)
-        self.sales_24h = collection_24h_sales(self, using)
-        self.sales_7d = collection_Xd_sales(self, 7, using)
-        self.sales_30d = collection_Xd_sales(self, 30, using)
-
-        self.supply = collection_supply(self, using)
-        self.listed = collection_listed_count(self, using)
-        self.owners = collection_unique_owners(self, using)
-        self.save()
+        refresh_collections_stats([self], using)
 
     def __str__(self):
         if self.address and len(self.address) > 4:
@@ -781,30 +773,27 @@ class Erc721Collection(models.Model):
         except Exception:
             return None
 
-    def volume_change_24h(self):
-        if self.volume_prev_24h > 0:
-            return (self.volume_24h - self.volume_prev_24h) / self.volume_prev_24h
-        else:
-            return None
-
-    def volume_change_7d(self):
-        if self.volume_prev_7d > 0:
-            return (self.volume_7d - self.volume_prev_7d) / self.volume_prev_7d
-        else:
-            return None
-
-    def volume_change_30d(self):
-        if self.volume_prev_30d > 0:
-            return (self.volume_30d - self.volume_prev_30d) / self.volume_prev_30d
-        else:
-            return None
-
     # NOTE: This is dependent on the Collection <> Token model relationship
     def daily_stats(self):
         from .utils.collection_stats import collection_daily_stats
 
         return collection_daily_stats(self)
 
+    def hourly_stats(self, hours=24 * 7):
+        from .utils.collection_stats import collection_hourly_stats
+
+        return collection_hourly_stats(self, hours)
+
+    def holder_distribution(self):
+        from .utils.collection_stats import collection_holder_distribution
+
+        return collection_holder_distribution(self)
+
+    def top_holders(self, limit=20, cursor=None):
+        from .utils.collection_stats import collection_top_holders
+
+        return collection_top_holders(self, limit, cursor)
+
     # NOTE: This is dependent on the Collection <> Token model relationship
     def activity(self):
         on_chain_activity = Erc721Activity.objects.filter(token__collection=self)
@@ -1005,6 +994,16 @@ class Erc721Token(models.Model):
         indexes = [
             models.Index(fields=["id", "approved", "collection", "owner"]),
             models.Index(fields=["approved"]),
+            # Holder counts recount one owner's tokens in a collection
+            models.Index(
+                fields=["collection", "owner"], name="token_collection_owner_idx"
+            ),
+            # Floor and cheapest listings are the first entries for the collection
+            models.Index(
+                fields=["collection", "price_eth", "id"],
+                condition=Q(for_sale=True),
+                name="token_listing_price_idx",
+            ),
         ]
 
     # Token details
@@ -1021,8 +1020,12 @@ class Erc721Token(models.Model):
     background_color = models.CharField(null=True, blank=True, max_length=7)
     image = models.URLField(null=True, blank=True, max_length=10000)
     image_src = models.CharField(null=True, blank=True, max_length=10000)
+    # {"thumbnail_200_webp": url, ...}, image is the 1000px JPEG or PNG
+    image_variants = models.JSONField(null=True, blank=True)
     animation_url = models.URLField(null=True, blank=True, max_length=10000)
     animation_url_src = models.CharField(null=True, blank=True, max_length=750)
+    # md5 of the metadata the attributes were last written from
+    metadata_hash = models.CharField(null=True, blank=True, max_length=32)
     rank = models.PositiveIntegerField(null=True, blank=True)
 
     # Listing details
@@ -1166,47 +1169,13 @@ class Erc721Token(models.Model):
             return res
 
         raw_daily_stats = (
-            Erc721Activity.objects.annotate(
-                coalesce_payment_token=Coalesce(
-                    "sell_order__payment_token__symbol",
-                    "buy_order__payment_token__symbol",
-                    "dutch_auction__payment_token__symbol",
-                )
-            )
-            .filter(
-                token=self,
-                event_type_short="SA",
-            )
-            .filter(Q(coalesce_payment_token="ETH") | Q(coalesce_payment_token="WETH"))
-            .annotate(
-                date_sold=TruncDate(
-                    Coalesce(
-                        "sell_order__time_sold",
-                        "buy_order__time_sold",
-                        "dutch_auction__time_sold",
-                    )
-                )
-            )
+            Sale.objects.filter(token=self, price_eth__isnull=False)
+            .annotate(date_sold=TruncDate("timestamp"))
             .values("date_sold")
-            .annotate(
-                volume=Sum(
-                    Coalesce(
-                        "sell_order__price", "buy_order__price", "dutch_auction__price"
-                    )
-                )
-            )
-            .annotate(
-                avg_price=Avg(
-                    Coalesce(
-                        "sell_order__price", "buy_order__price", "dutch_auction__price"
-                    )
-                )
-            )
-            .annotate(num_traded=Count("id"))
+            .annotate(avg_price=Avg("price_eth"))
             .order_by("date_sold")
         )
 
-        i = 0
         daily_stats = []
         for stat in raw_daily_stats:
             stat_json = {
@@ -1214,7 +1183,6 @@ class Erc721Token(models.Model):
                 "avg_price": int(stat["avg_price"]) / (10 ** 9),
             }
             daily_stats.append(stat_json)
-            i += 1
 
         cache.set(sales_key, daily_stats, 60)
         return daily_stats
@@ -1252,9 +1220,27 @@ class Erc721Token(models.Model):
         elif self.smart_contract.type == CollectionType.ERC1155:
             return Erc1155TokenOwner.objects.filter(token=self).count()
 
+    def save(self, *args, **kwargs):
+        from .utils.collection_stats import refresh_holders, update_floor
+
+        super().save(*args, **kwargs)
+        listing_before = self.__dict__.pop("_listing_before", None)
+        if listing_before:
+            update_floor(
+                self.collection_id, listing_before, (self.for_sale, self.price_eth)
+            )
+        if "_owner_before" in self.__dict__:
+            owner_before = self.__dict__.pop("_owner_before")
+            refresh_holders(
+                [(self.collection_id, owner_before), (self.collection_id, self.owner_id)]
+            )
+
     def set_for_sale_info(self, should_save=True):
+        from .utils.collection_stats import mark_stats_dirty
+
         sell_order = self.sell_order()
         dutch_auction = self.dutch_auction()
+        listing_before = (self.for_sale, self.price_eth)
 
         self.for_sale = bool(sell_order or dutch_auction)
         self.price = None
@@ -1277,6 +1263,12 @@ class Erc721Token(models.Model):
             self.listed_timestamp = dutch_auction.created_at
             self.expiration_timestamp = dutch_auction.end_time
 
+        if (self.for_sale, self.price_eth) != listing_before:
+            mark_stats_dirty([self.collection_id])
+            # The collection floor is updated once the listing is saved
+            if not hasattr(self, "_listing_before"):
+                self._listing_before = listing_before
+
         if should_save:
             self.save()
 
@@ -1341,14 +1333,15 @@ class Erc721Token(models.Model):
                 self.smart_contract.address,
                 self.smart_contract.network.network_id,
             )
-            events = contract.transfer_events_for_token(self.token_id)
+            events = contract.iter_transfer_events(token=int(self.token_id))
         elif self.smart_contract.type == CollectionType.ERC1155:
             contract = Erc1155Contract(
                 self.smart_contract.address, self.smart_contract.network.network_id
             )
-            single_events = contract.single_transfer_events_for_token(self.token_id)
-            batch_events = contract.batch_transfer_events_for_token(self.token_id)
-            events = single_events + batch_events
+            events = chain(
+                contract.iter_single_transfer_events(token=int(self.token_id)),
+                contract.iter_batch_transfer_events(token=int(self.token_id)),
+            )
 
         for event in events:
             txn_id = event["transactionHash"].hex()
@@ -1383,6 +1376,8 @@ class Erc721Token(models.Model):
         )
 
     def refresh_owner(self, from_profile=None, to_profile=None, should_save=True):
+        from .utils.collection_stats import mark_stats_dirty, refresh_holders
+
         if self.smart_contract.type == CollectionType.ERC721:
             contract = Erc721Contract(
                 self.smart_contract.address,
@@ -1394,6 +1389,11 @@ class Erc721Token(models.Model):
             if not owner_address:
                 owner_address = "0x0000000000000000000000000000000000000000"
             profile, created = Profile.objects.get_or_create(address=owner_address)
+            if self.owner_id != profile.id:
+                mark_stats_dirty([self.collection_id])
+                # Holder counts are updated once the new owner is saved
+                if not hasattr(self, "_owner_before"):
+                    self._owner_before = self.owner_id
             self.owner = profile
 
             if should_save:
@@ -1420,29 +1420,220 @@ class Erc721Token(models.Model):
                 print(e)
 
             self.refresh_quantity()
+            mark_stats_dirty([self.collection_id])
+            refresh_holders(
+                [(self.collection_id, from_profile.id), (self.collection_id, to_profile.id)]
+            )
 
     def refresh_erc1155_owners(self):
-        if self.smart_contract.type == CollectionType.ERC1155:
-            contract = Erc1155Contract(
-                self.smart_contract.address, self.smart_contract.network.network_id
+        """
+        Rebuild holder balances by replaying every transfer of this token.
+        """
+        from .utils.collection_stats import refresh_holders
+
+        if self.smart_contract.type != CollectionType.ERC1155:
+            return
+
+        contract = Erc1155Contract(
+            self.smart_contract.address, self.smart_contract.network.network_id
+        )
+        events = chain(
+            contract.iter_single_transfer_events(token=int(self.token_id)),
+            contract.iter_batch_transfer_events(token=int(self.token_id)),
+        )
+
+        balances = defaultdict(int)
+        transfers = []
+        for event in events:
+            from_address = event["args"]["from"]
+            to_address = event["args"]["to"]
+            quantity = event["args"]["value"]
+            if int(from_address, 16) != 0:
+                balances[from_address] -= quantity
+            if int(to_address, 16) != 0:
+                balances[to_address] += quantity
+            transfers.append((event, from_address, to_address, quantity))
+
+        addresses = {a for _e, f, t, _q in transfers for a in (f, t)}
+        profiles = {p.address: p for p in Profile.objects.filter(address__in=addresses)}
+        missing = addresses - profiles.keys()
+        if missing:
+            Profile.objects.bulk_create(
+                [Profile(address=address) for address in missing], ignore_conflicts=True
+            )
+            profiles.update(
+                {p.address: p for p in Profile.objects.filter(address__in=missing)}
             )
-            single_events = contract.single_transfer_events_for_token(self.token_id)
-            batch_events = contract.batch_transfer_events_for_token(self.token_id)
-            events = single_events + batch_events
-
-            from_addresses = [e["args"]["from"] for e in events]
-            to_addresses = [e["args"]["to"] for e in events]
-            addresses = list(set(from_addresses + to_addresses))
-
-            for address in addresses:
-                if address != "0x0000000000000000000000000000000000000000":
-                    profile, created = Profile.objects.get_or_create(address=address)
-                    erc1155_owner, created = Erc1155TokenOwner.objects.get_or_create(
-                        token=self, owner=profile
+
+        with transaction.atomic():
+            existing = {
+                o.owner_id: o
+                for o in Erc1155TokenOwner.objects.select_for_update().filter(token=self)
+            }
+            owner_ids = set(existing) | {p.id for p in profiles.values()}
+            to_create, to_update = [], []
+            for address, balance in balances.items():
+                if balance <= 0:
+                    continue
+                owner_id = profiles[address].id
+                token_owner = existing.pop(owner_id, None)
+                if not token_owner:
+                    to_create.append(
+                        Erc1155TokenOwner(token=self, owner_id=owner_id, quantity=balance)
                     )
-                    erc1155_owner.refresh_quantity()
+                elif token_owner.quantity != balance:
+                    token_owner.quantity = balance
+                    to_update.append(token_owner)
+
+            # Anyone left over no longer holds the token
+            Erc1155TokenOwner.objects.filter(
+                id__in=[o.id for o in existing.values()]
+            ).delete()
+            Erc1155TokenOwner.objects.bulk_update(to_update, ["quantity"])
+            Erc1155TokenOwner.objects.bulk_create(to_create)
+
+            Erc1155Transfer.objects.bulk_create(
+                [
+                    Erc1155Transfer(
+                        token=self,
+                        txn_id=event["transactionHash"].hex(),
+                        log_index=event["logIndex"],
+                        batch_index=event.get("batchIndex", 0),
+                        block_number=event["blockNumber"],
+                        from_profile=profiles[from_address],
+                        to_profile=profiles[to_address],
+                        quantity=quantity,
+                    )
+                    for event, from_address, to_address, quantity in transfers
+                ],
+                ignore_conflicts=True,
+            )
 
             self.refresh_quantity()
+            refresh_holders((self.collection_id, owner_id) for owner_id in owner_ids)
+
+    def apply_erc1155_transfer(
+        self,
+        from_profile,
+        to_profile,
+        quantity,
+        txn_id,
+        log_index,
+        batch_index=0,
+        block_number=None,
+    ):
+        """
+        Apply one ERC-1155 transfer to holder balances without any RPCs. Each log is
+        recorded in the Erc1155Transfer ledger, so a log delivered twice is only
+        applied once. Returns True if the transfer was applied.
+        """
+        from .utils.collection_stats import mark_stats_dirty, refresh_holders
+
+        with transaction.atomic():
+            _entry, created = Erc1155Transfer.objects.get_or_create(
+                txn_id=txn_id,
+                log_index=log_index,
+                batch_index=batch_index,
+                defaults={
+                    "token": self,
+                    "from_profile": from_profile,
+                    "to_profile": to_profile,
+                    "quantity": quantity,
+                    "block_number": block_number,
+                },
+            )
+            if not created:
+                return False
+
+            mark_stats_dirty([self.collection_id])
+
+            if int(from_profile.address, 16) != 0:
+                from_owner = (
+                    Erc1155TokenOwner.objects.select_for_update()
+                    .filter(token=self, owner=from_profile)
+                    .first()
+                )
+                if from_owner and from_owner.quantity > quantity:
+                    from_owner.quantity -= quantity
+                    from_owner.save()
+                elif from_owner:
+                    # Anything below zero is drift that the next audit will correct
+                    from_owner.delete()
+
+            if int(to_profile.address, 16) != 0:
+                to_owner, _created = Erc1155TokenOwner.objects.select_for_update().get_or_create(
+                    token=self, owner=to_profile
+                )
+                to_owner.quantity += quantity
+                to_owner.save()
+
+            self.refresh_quantity()
+            refresh_holders(
+                [(self.collection_id, from_profile.id), (self.collection_id, to_profile.id)]
+            )
+        return True
+
+    def audit_erc1155_balances(self):
+        """
+        Compare ledger balances against balanceOfBatch and fix any drift.
+        Returns the number of holders that were corrected.
+        """
+        from .utils.collection_stats import refresh_holders
+
+        if self.smart_contract.type != CollectionType.ERC1155:
+            return 0
+
+        token_owners = list(
+            Erc1155TokenOwner.objects.filter(token=self).select_related("owner")
+        )
+        # Recent receivers may be missing from the holder table if a transfer was dropped
+        recent_receiver_ids = set(
+            Erc1155Transfer.objects.filter(token=self)
+            .order_by("-id")
+            .values_list("to_profile_id", flat=True)[:500]
+        ) - {o.owner_id for o in token_owners}
+        token_owners += [
+            Erc1155TokenOwner(token=self, owner=profile, quantity=0)
+            for profile in Profile.objects.filter(id__in=recent_receiver_ids).exclude(
+                address="0x0000000000000000000000000000000000000000"
+            )
+        ]
+        if not token_owners:
+            return 0
+
+        contract = Erc1155Contract(
+            self.smart_contract.address, self.smart_contract.network.network_id
+        )
+        balances = contract.balance_of_batch(
+            [(o.owner.address, self.token_id) for o in token_owners]
+        )
+
+        to_create, to_update, to_delete = [], [], []
+        drifted_owner_ids = []
+        for token_owner, balance in zip(token_owners, balances):
+            # A failed read says nothing about the balance, so leave it alone
+            if balance is None or token_owner.quantity == balance:
+                continue
+            drifted_owner_ids.append(token_owner.owner_id)
+            if not token_owner.id:
+                to_create.append(token_owner)
+            elif balance == 0:
+                to_delete.append(token_owner.id)
+            else:
+                to_update.append(token_owner)
+            token_owner.quantity = balance
+
+        with transaction.atomic():
+            Erc1155TokenOwner.objects.filter(id__in=to_delete).delete()
+            Erc1155TokenOwner.objects.bulk_update(to_update, ["quantity"])
+            Erc1155TokenOwner.objects.bulk_create(to_create, ignore_conflicts=True)
+            self.refresh_quantity()
+            refresh_holders((self.collection_id, i) for i in drifted_owner_ids)
+
+        num_drifted = len(to_create) + len(to_update) + len(to_delete)
+        if num_drifted:
+            print(f"Corrected {num_drifted} ERC-1155 balances for {self}")
+        return num_drifted
 
     def refresh_orders(self, should_save=True):
         # Update sell orders
@@ -1611,6 +1802,29 @@ class Erc1155TokenOwner(models.Model):
             pass
 
 
+class Erc1155Transfer(models.Model):
+    """
+    Ledger of ERC-1155 transfers already applied to Erc1155TokenOwner balances.
+    """
+
+    class Meta:
+        unique_together = ("txn_id", "log_index", "batch_index")
+
+    token = models.ForeignKey(Erc721Token, on_delete=models.CASCADE)
+    txn_id = models.TextField()
+    log_index = models.PositiveIntegerField()
+    # Position within a TransferBatch log, 0 for TransferSingle
+    batch_index = models.PositiveIntegerField(default=0)
+    block_number = models.PositiveBigIntegerField(null=True, blank=True)
+    from_profile = models.ForeignKey(
+        Profile, on_delete=models.PROTECT, related_name="+"
+    )
+    to_profile = models.ForeignKey(Profile, on_delete=models.PROTECT, related_name="+")
+    quantity = models.PositiveBigIntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class HiddenToken(models.Model):
     user = models.ForeignKey(Profile, on_delete=models.PROTECT)
     token = models.ForeignKey(Erc721Token, on_delete=models.PROTECT)
@@ -1637,6 +1851,134 @@ class Erc721TokenAttribute(models.Model):
     value = models.TextField()
 
 
+class MetadataCacheEntry(models.Model):
+    """
+    Parsed metadata documents keyed by IPFS path (CID plus path) or HTTP URL.
+    IPFS entries never go stale; HTTP entries are revalidated with their validators.
+    """
+
+    class Meta:
+        verbose_name_plural = "Metadata cache entries"
+
+    key = models.TextField(unique=True)
+    # zlib-compressed JSON
+    data = models.BinaryField()
+    etag = models.TextField(blank=True, null=True)
+    last_modified = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class MediaObject(models.Model):
+    """
+    Media stored in S3 under its content hash, so identical images are uploaded
+    once and shared by every token that uses them.
+    """
+
+    class Meta:
+        unique_together = ("source_hash", "variant")
+
+    # SHA-256 of the downloaded (or decoded data: URI) bytes
+    source_hash = models.CharField(max_length=64)
+    # How the source was processed, e.g. "thumbnail_1000" or "original"
+    variant = models.CharField(max_length=32)
+    # IPFS path of the source, so repeat pulls of immutable content skip the download
+    source_path = models.TextField(blank=True, null=True, db_index=True)
+    # SHA-256 of the stored bytes
+    content_hash = models.CharField(max_length=64, db_index=True)
+    url = models.URLField(max_length=10000)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class CollectionDailyStats(models.Model):
+    """
+    Sales for a collection on one UTC day. A row is updated as each sale is
+    processed, and collection stats and charts are read from these instead of
+    the sales.
+    """
+
+    class Meta:
+        verbose_name_plural = "Collection daily stats"
+        unique_together = ("collection", "date")
+
+    collection = models.ForeignKey(Erc721Collection, on_delete=models.CASCADE)
+    date = models.DateField()
+    sales = models.PositiveIntegerField(default=0)
+    # gwei, sum of Sale.price_eth
+    volume = models.PositiveBigIntegerField(default=0)
+    min_price = models.BigIntegerField(blank=True, null=True)
+    max_price = models.BigIntegerField(blank=True, null=True)
+    # Floor at the last stats refresh of the day
+    floor = models.BigIntegerField(blank=True, null=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def avg_price(self):
+        return self.volume / self.sales if self.sales else None
+
+
+class DirtyCollection(models.Model):
+    """
+    Collections with sales, transfers or listing changes since their stats were
+    last refreshed. The stats refresh only recomputes these.
+    """
+
+    collection = models.OneToOneField(
+        Erc721Collection, on_delete=models.CASCADE, primary_key=True
+    )
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+
+class CollectionHourlyStats(models.Model):
+    """
+    Same as CollectionDailyStats for one hour, for the hourly charts.
+    """
+
+    class Meta:
+        verbose_name_plural = "Collection hourly stats"
+        unique_together = ("collection", "hour")
+
+    collection = models.ForeignKey(Erc721Collection, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    sales = models.PositiveIntegerField(default=0)
+    volume = models.PositiveBigIntegerField(default=0)
+    min_price = models.BigIntegerField(blank=True, null=True)
+    max_price = models.BigIntegerField(blank=True, null=True)
+    floor = models.BigIntegerField(blank=True, null=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def avg_price(self):
+        return self.volume / self.sales if self.sales else None
+
+
+class CollectionHolder(models.Model):
+    """
+    Number of tokens each owner holds in a collection, kept up to date as owners
+    change. Only owners holding at least one token have a row, and the burn
+    address and bridge never do, so the row count is the number of owners.
+    """
+
+    class Meta:
+        unique_together = ("collection", "owner")
+        indexes = [
+            models.Index(
+                fields=["collection", "-quantity", "owner"],
+                name="holder_collection_qty_idx",
+            ),
+        ]
+
+    collection = models.ForeignKey(Erc721Collection, on_delete=models.CASCADE)
+    owner = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, related_name="holdings"
+    )
+    # Tokens held, or the summed balance of all token ids for ERC-1155
+    quantity = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 # TODO: Rename to generic 'SellOrder'
 class Erc721SellOrder(models.Model):
     class Meta:
@@ -2078,6 +2420,69 @@ class Erc721BuyOrder(models.Model):
         return super().save(*args, **kwargs)
 
 
+class Sale(models.Model):
+    """
+    One row per fulfilled sell order, buy order or dutch auction, written when
+    the sale is processed. Prices are converted to ETH and USD at that time, so
+    stats and charts read this table instead of joining the three order tables.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["collection", "timestamp"],
+                include=["price_eth"],
+                name="sale_collection_time_idx",
+            ),
+            models.Index(
+                fields=["token", "timestamp"],
+                include=["price_eth"],
+                name="sale_token_time_idx",
+            ),
+        ]
+
+    token = models.ForeignKey(Erc721Token, on_delete=models.PROTECT)
+    collection = models.ForeignKey(
+        Erc721Collection, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    buyer = models.ForeignKey(
+        Profile,
+        on_delete=models.PROTECT,
+        related_name="purchases",
+        null=True,
+        blank=True,
+    )
+    seller = models.ForeignKey(
+        Profile,
+        on_delete=models.PROTECT,
+        related_name="sales",
+        null=True,
+        blank=True,
+    )
+    timestamp = models.DateTimeField()
+    txn_id = models.TextField(blank=True, null=True)
+    quantity = models.PositiveIntegerField(default=1)
+    payment_token = models.ForeignKey(
+        PaymentToken, on_delete=models.PROTECT, blank=True, null=True
+    )
+    price = models.BigIntegerField()  # gwei, in payment_token
+    price_eth = models.BigIntegerField(blank=True, null=True)  # gwei
+    price_usd = models.FloatField(blank=True, null=True)
+
+    # The order that was filled, exactly one is set
+    sell_order = models.OneToOneField(
+        Erc721SellOrder, on_delete=models.CASCADE, null=True, blank=True
+    )
+    buy_order = models.OneToOneField(
+        Erc721BuyOrder, on_delete=models.CASCADE, null=True, blank=True
+    )
+    dutch_auction = models.OneToOneField(
+        Erc721DutchAuction, on_delete=models.CASCADE, null=True, blank=True
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class ActivityType(models.TextChoices):
     MINT = "MI", _("Mint")
     SALE = "SA", _("Sale")
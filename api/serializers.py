@@ -115,6 +115,14 @@ class CollectionSerializerForStats30D(CollectionSerializerForStats):
     sales = serializers.IntegerField(source="sales_30d")
 
 
+class CollectionHolderSerializer(serializers.ModelSerializer):
+    owner = ProfileSerializerShort()
+
+    class Meta:
+        model = models.CollectionHolder
+        fields = ["owner", "quantity"]
+
+
 class CollectionSerializerShort(serializers.ModelSerializer):
     class Meta:
         model = models.Erc721Collection
@@ -222,6 +230,7 @@ class CollectionSerializerMedium(serializers.ModelSerializer):
             "display_theme",
             "contract_type",
             "image_url",
+            "profile_image_variants",
             "cover_image",
             "ranking_enabled",
             "volume_change_7d",
@@ -313,6 +322,7 @@ class TokenSerializerForCollectionTokens(serializers.ModelSerializer):
             "owner",
             "description",
             "image",
+            "image_variants",
             "animation_url",
             "sell_order",
             "dutch_auction",
@@ -381,6 +391,7 @@ class CollectionSerializerForTokenCard(serializers.ModelSerializer):
             "animation_url_type",
             "contract_type",
             "image_url",
+            "profile_image_variants",
             "ranking_enabled",
         ]
 
@@ -402,6 +413,7 @@ class TokenSerializerForProfile(serializers.ModelSerializer):
             "owner",
             "description",
             "image",
+            "image_variants",
             "animation_url",
             "sell_order",
             "dutch_auction",
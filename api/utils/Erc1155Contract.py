@@ -1,10 +1,11 @@
-import json
 from datetime import datetime, timedelta, timezone
 
 from web3 import Web3
 
 from ..abis.erc1155_abi import erc1155_abi
 from .constants import ALCHEMY_API_KEY, NETWORK, w3
+from .log_fetcher import BlockRangeLogFetcher
+from .multicall import batch_call
 
 
 class Erc1155Contract:
@@ -40,6 +41,28 @@ class Erc1155Contract:
         except Exception:
             return 0
 
+    def balance_of_batch(self, address_id_pairs, batch_size=300):
+        """
+        Returns one balance per (address, id) pair using balanceOfBatch. Chunks the
+        contract rejects are retried through multicall, where failed calls are None.
+        """
+        pairs = [(Web3.toChecksumAddress(a), int(id)) for a, id in address_id_pairs]
+        balances = []
+        for i in range(0, len(pairs), batch_size):
+            chunk = pairs[i : i + batch_size]
+            try:
+                balances += self.contract.functions.balanceOfBatch(
+                    [address for address, _id in chunk], [id for _address, id in chunk]
+                ).call()
+            except Exception as e:
+                print(e)
+                results = batch_call(
+                    self.w3,
+                    [self.contract.functions.balanceOf(a, id) for a, id in chunk],
+                )
+                balances += [balance if success else None for success, balance in results]
+        return balances
+
     def total_supply(self, last_supply_pull):
         try:
             supply = self.contract.functions.totalSupply().call()
@@ -75,6 +98,13 @@ class Erc1155Contract:
         i = int(i)
         return self.contract.functions.uri(i).call()
 
+    def token_uri_batch(self, token_ids):
+        token_ids = list(token_ids)
+        results = batch_call(
+            self.w3, [self.contract.functions.uri(int(i)) for i in token_ids]
+        )
+        return {i: uri for i, (success, uri) in zip(token_ids, results)}
+
     def owner(self):
         return self.contract.functions.owner().call()
 
@@ -112,221 +142,82 @@ class Erc1155Contract:
         events = filter.get_all_entries()
         return events
 
+    def iter_single_transfer_events(
+        self, from_block="0x1", to_block="latest", address=None, token=None
+    ):
+        """
+        Stream TransferSingle events, splitting the block range as the provider requires.
+        """
+        fetcher = BlockRangeLogFetcher(
+            self.w3,
+            lambda start, end: self.fetch_single_events(
+                from_block=start, to_block=end, address=address, token=token
+            ),
+            cache_key=f"LOG_CHUNK_SIZE_{self.contract.address}_TransferSingle",
+        )
+        return fetcher.fetch(from_block, to_block)
+
+    def iter_batch_transfer_events(
+        self, from_block="0x1", to_block="latest", address=None, token=None
+    ):
+        """
+        Stream TransferBatch events flattened into one event per token id.
+        """
+        fetcher = BlockRangeLogFetcher(
+            self.w3,
+            lambda start, end: self.fetch_batch_events(
+                from_block=start, to_block=end, address=address
+            ),
+            cache_key=f"LOG_CHUNK_SIZE_{self.contract.address}_TransferBatch",
+        )
+        for event in fetcher.fetch(from_block, to_block):
+            for index, id in enumerate(event["args"]["ids"]):
+                if token is not None and id != token:
+                    continue
+                yield {
+                    "args": {
+                        "from": event["args"]["from"],
+                        "to": event["args"]["to"],
+                        "id": id,
+                        "value": event["args"]["values"][index],
+                    },
+                    "transactionHash": event["transactionHash"],
+                    "address": event["address"],
+                    "blockNumber": event["blockNumber"],
+                    "logIndex": event["logIndex"],
+                    "batchIndex": index,
+                }
+
     def single_transfer_events(self, last_block_checked="0x1"):
-        try:
-            events = self.fetch_single_events(
-                from_block=last_block_checked, to_block="latest"
-            )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_single_events(
-                    from_block=from_block, to_block=to_block
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_single_events(
-                        from_block=from_block, to_block="latest"
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-        return events
+        return list(self.iter_single_transfer_events(from_block=last_block_checked))
 
     def single_transfer_events_from_address(self, address, last_block_checked="0x1"):
         address = Web3.toChecksumAddress(address)
-        try:
-            events = self.fetch_single_events(
-                from_block=last_block_checked, to_block="latest", address=address
+        return list(
+            self.iter_single_transfer_events(
+                from_block=last_block_checked, address=address
             )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-
-            # Very ugly fix for when Alchemy API can't return results due to 10k tx's in 1 block
-            if int(to_block, 16) <= int(from_block, 16):
-                return []
-
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_single_events(
-                    from_block=from_block, to_block=to_block, address=address
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_single_events(
-                        from_block=from_block, to_block="latest", address=address
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-
-                    # Very ugly fix for when Alchemy API can't return results due to 10k tx's in 1 block
-                    if int(to_block, 16) <= int(from_block, 16):
-                        return []
-        return events
+        )
 
     def single_transfer_events_for_token(self, i, last_block_checked="0x1"):
         i = int(i)
-        try:
-            events = self.fetch_single_events(
-                from_block=last_block_checked, to_block="latest", token=i
-            )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_single_events(
-                    from_block=from_block, to_block=to_block, token=i
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_single_events(
-                        from_block=from_block, to_block="latest", token=i
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-        return events
+        return list(
+            self.iter_single_transfer_events(from_block=last_block_checked, token=i)
+        )
 
     def batch_transfer_events(self, last_block_checked="0x1"):
-        try:
-            events = self.fetch_batch_events(
-                from_block=last_block_checked, to_block="latest"
-            )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_batch_events(
-                    from_block=from_block, to_block=to_block
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_batch_events(
-                        from_block=from_block, to_block="latest"
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-
-        single_events = []
-
-        for event in events:
-            for index, token in enumerate(event["args"]["ids"]):
-                new_event = {
-                    "args": {
-                        "from": event["args"]["from"],
-                        "to": event["args"]["to"],
-                        "id": token,
-                        "value": event["args"]["values"][index],
-                    },
-                    "transactionHash": event["transactionHash"],
-                    "address": event["address"],
-                }
-                single_events.append(new_event)
-        return single_events
+        return list(self.iter_batch_transfer_events(from_block=last_block_checked))
 
     def batch_transfer_events_from_address(self, address, last_block_checked="0x1"):
         address = Web3.toChecksumAddress(address)
-        try:
-            events = self.fetch_batch_events(
-                from_block=last_block_checked, to_block="latest", address=address
+        return list(
+            self.iter_batch_transfer_events(
+                from_block=last_block_checked, address=address
             )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_batch_events(
-                    from_block=from_block, to_block=to_block, address=address
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_batch_events(
-                        from_block=from_block, to_block="latest", address=address
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-
-        single_events = []
-
-        for event in events:
-            for index, token in enumerate(event["args"]["ids"]):
-                new_event = {
-                    "args": {
-                        "from": event["args"]["from"],
-                        "to": event["args"]["to"],
-                        "id": token,
-                        "value": event["args"]["values"][index],
-                    },
-                    "transactionHash": event["transactionHash"],
-                    "address": event["address"],
-                }
-                single_events.append(new_event)
-        return single_events
+        )
 
     def batch_transfer_events_for_token(self, i, last_block_checked="0x1"):
         i = int(i)
-        try:
-            events = self.fetch_batch_events(
-                from_block=last_block_checked, to_block="latest"
-            )
-        except Exception as e:
-            e = json.loads(str(e).replace("'", '"'))
-            from_block = last_block_checked
-            to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            latest_block = hex(self.w3.eth.block_number)
-            events = []
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_batch_events(
-                    from_block=from_block, to_block=to_block
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_batch_events(
-                        from_block=from_block, to_block="latest"
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-
-        events_with_token = []
-        for event in events:
-            try:
-                index = event["args"]["ids"].index(i)
-                new_event = {
-                    "args": {
-                        "from": event["args"]["from"],
-                        "to": event["args"]["to"],
-                        "id": i,
-                        "value": event["args"]["values"][index],
-                    },
-                    "transactionHash": event["transactionHash"],
-                    "address": event["address"],
-                }
-                events_with_token.append(new_event)
-            except Exception as e:
-                pass
-        return events_with_token
+        return list(
+            self.iter_batch_transfer_events(from_block=last_block_checked, token=i)
+        )
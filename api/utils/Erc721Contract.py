@@ -1,4 +1,3 @@
-import json
 from datetime import datetime, timedelta, timezone
 from time import sleep
 
@@ -7,6 +6,8 @@ from web3.exceptions import ContractLogicError
 
 from ..abis.erc721_abi import erc721_abi
 from .constants import ALCHEMY_API_KEY, NETWORK, w3
+from .log_fetcher import BlockRangeLogFetcher
+from .multicall import batch_call
 
 
 class Erc721Contract:
@@ -129,6 +130,42 @@ class Erc721Contract:
                 print("Error calling contract ownerOf function")
                 return None
 
+    def owner_of_batch(self, token_ids):
+        """
+        Returns {token_id: owner address or None} using one multicall per few hundred tokens.
+        ownerOf reverts for burned tokens, which are owned by the zero address.
+        None means the owner couldn't be read.
+        """
+        token_ids = list(token_ids)
+        results = batch_call(
+            self.w3, [self.contract.functions.ownerOf(int(i)) for i in token_ids]
+        )
+        burned = "0x0000000000000000000000000000000000000000"
+        return {
+            i: burned if success is False else owner
+            for i, (success, owner) in zip(token_ids, results)
+        }
+
+    def token_uri_batch(self, token_ids):
+        token_ids = list(token_ids)
+        results = batch_call(
+            self.w3, [self.contract.functions.tokenURI(int(i)) for i in token_ids]
+        )
+        return {i: uri for i, (success, uri) in zip(token_ids, results)}
+
+    def is_approved_for_all_batch(self, owner_operator_pairs):
+        """
+        Returns one bool per (owner, operator) pair; failed calls count as not approved.
+        """
+        results = batch_call(
+            self.w3,
+            [
+                self.contract.functions.isApprovedForAll(owner, operator)
+                for owner, operator in owner_operator_pairs
+            ],
+        )
+        return [bool(success and approved) for success, approved in results]
+
     def owner(self):
         return self.contract.functions.owner().call()
 
@@ -153,90 +190,28 @@ class Erc721Contract:
         events = filter.get_all_entries()
         return events
 
+    def iter_transfer_events(
+        self, from_block="0x1", to_block="latest", address=None, token=None
+    ):
+        """
+        Stream Transfer events, splitting the block range as the provider requires.
+        """
+        fetcher = BlockRangeLogFetcher(
+            self.w3,
+            lambda start, end: self.fetch_single_events(
+                from_block=start, to_block=end, address=address, token=token
+            ),
+            cache_key=f"LOG_CHUNK_SIZE_{self.contract_address}_Transfer",
+        )
+        return fetcher.fetch(from_block, to_block)
+
     def transfer_events_from_address(self, address):
         address = Web3.toChecksumAddress(address)
-        try:
-            events = self.fetch_single_events(
-                from_block="0x1", to_block="latest", address=address
-            )
-        except Exception as e:
-            print(e)
-
-            try:
-                e = json.loads(str(e).replace("'", '"'))
-                if (
-                    self.contract_address
-                    == "0xfA14e1157F35E1dAD95dC3F822A9d18c40e360E2"
-                ):
-                    from_block = "0x2CB1276"
-                    to_block = "0x2CB1278"
-                    # latest_block = "0x2996B76"
-                else:
-                    from_block = "0x1"
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-                latest_block = hex(self.w3.eth.block_number)
-                events = []
-            except Exception as e:
-                print(e)
-                return []
-
-            # Very ugly fix for when Alchemy API can't return results due to 10k tx's in 1 block
-            if int(to_block, 16) <= int(from_block, 16):
-                return []
-
-            while int(to_block, 16) < int(latest_block, 16):
-                events += self.fetch_single_events(
-                    from_block=from_block, to_block=to_block, address=address
-                )
-                from_block = to_block
-                try:
-                    events += self.fetch_single_events(
-                        from_block=from_block, to_block="latest", address=address
-                    )
-                    to_block = latest_block
-                except Exception as e:
-                    print(e)
-                    e = json.loads(str(e).replace("'", '"'))
-                    to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-
-                    # Very ugly fix for when Alchemy API can't return results due to 10k tx's in 1 block
-                    if int(to_block, 16) <= int(from_block, 16):
-                        return []
-        return events
+        return list(self.iter_transfer_events(address=address))
 
     def transfer_events_for_token(self, token):
         token = int(token)
-        try:
-            events = self.fetch_single_events(
-                from_block="0x1", to_block="latest", token=token
-            )
-        except Exception as e:
-            print(e)
-
-            try:
-                e = json.loads(str(e).replace("'", '"'))
-                from_block = "0x1"
-                to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-                latest_block = hex(self.w3.eth.block_number)
-                events = []
-
-                while int(to_block, 16) < int(latest_block, 16):
-                    events += self.fetch_single_events(
-                        from_block=from_block, to_block=to_block, token=token
-                    )
-                    from_block = to_block
-                    try:
-                        events += self.fetch_single_events(
-                            from_block=from_block, to_block="latest", token=token
-                        )
-                        to_block = latest_block
-                    except Exception as e:
-                        e = json.loads(str(e).replace("'", '"'))
-                        to_block = e["message"].split("[")[1].split(",")[1][:-1].strip()
-            except Exception as e:
-                print(e)
-                return []
-        return events
+        return list(self.iter_transfer_events(token=token))
 
     def is_erc721(self):
         try:
@@ -1,631 +1,591 @@
 from datetime import datetime, timedelta, timezone
 
 from api.models import (
-    BlockchainState,
+    CollectionDailyStats,
+    CollectionHolder,
+    CollectionHourlyStats,
     CollectionType,
-    Erc721Activity,
-    Erc721BuyOrder,
-    Erc721DutchAuction,
-    Erc721SellOrder,
+    DirtyCollection,
+    Erc721Collection,
     Erc721Token,
     Erc1155TokenOwner,
+    Profile,
 )
 from api.utils.constants import NETWORK
-from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Avg, Count, Min, Q, Sum
-from django.db.models.functions import Coalesce, TruncDate
-
-
-def collection_supply(collection, using='default'):
-    tokens = collection.erc721token_set.using(using).filter(approved=True).exclude(
-        owner__address="0x0000000000000000000000000000000000000000"
-    )
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
 
+STATS_FIELDS = [
+    "floor",
+    "listed",
+    "supply",
+    "owners",
+    "sales",
+    "sales_24h",
+    "sales_7d",
+    "sales_30d",
+    "volume",
+    "volume_24h",
+    "volume_7d",
+    "volume_30d",
+    "volume_prev_24h",
+    "volume_prev_7d",
+    "volume_prev_30d",
+    "volume_change_24h",
+    "volume_change_7d",
+    "volume_change_30d",
+]
+WINDOWS = [
+    ("24h", timedelta(hours=24)),
+    ("7d", timedelta(days=7)),
+    ("30d", timedelta(days=30)),
+]
+# Tokens-per-holder histogram buckets, (min, max) inclusive, None is unbounded
+HOLDER_BUCKETS = [(1, 1), (2, 3), (4, 10), (11, 25), (26, 50), (51, None)]
+TOP_HOLDERS_SHARE = 10
+
+
+def excluded_owner_addresses():
+    # Tokens held by the burn address or the bridge don't count towards supply
+    addresses = ["0x0000000000000000000000000000000000000000"]
     if NETWORK == "opt-mainnet":
-        tokens = tokens.exclude(
-            owner__address="0x5a7749f83b81B301cAb5f48EB8516B986DAef23D"
-        )
+        addresses.append("0x5a7749f83b81B301cAb5f48EB8516B986DAef23D")
     elif NETWORK == "opt-goerli":
-        tokens = tokens.exclude(
-            owner__address="0x8DD330DdE8D9898d43b4dc840Da27A07dF91b3c9"
-        )
-    return tokens.count()
-
-
-def collection_floor_price(collection, using='default'):
-    floor_price = (
-        Erc721Token.objects.using(using).filter(collection=collection, for_sale=True)
-        .aggregate(Min("price_eth"))
-        .get("price_eth__min")
+        addresses.append("0x8DD330DdE8D9898d43b4dc840Da27A07dF91b3c9")
+    return addresses
+
+
+def mark_stats_dirty(collection_ids):
+    """
+    Queue collections for the next stats refresh. Marking a collection that is
+    already queued does nothing, so callers don't need to check first.
+    """
+    DirtyCollection.objects.bulk_create(
+        [DirtyCollection(collection_id=i) for i in set(collection_ids) if i],
+        ignore_conflicts=True,
     )
-    if floor_price:
-        return int(floor_price)
-    else:
-        return None
 
 
-def collection_unique_owners(collection, using='default'):
+def update_floor(collection_id, listing_before, listing_after):
+    """
+    Keep Erc721Collection.floor exact as a token's (for_sale, price_eth) changes.
+    A cheaper listing lowers the floor directly. When the floor listing goes
+    away or gets more expensive, the next cheapest one is read from the
+    partial listing index, so no aggregate over the collection is needed.
+    """
+    was_listed, price_before = listing_before
+    is_listed, price_after = listing_after
+    collections = Erc721Collection.objects.filter(id=collection_id)
+
+    if is_listed and price_after is not None:
+        collections.filter(Q(floor__isnull=True) | Q(floor__gt=price_after)).update(
+            floor=price_after
+        )
+
     if (
-        settings.DATABASES["default"]["ENGINE"]
-        == "django.db.backends.postgresql_psycopg2"
+        was_listed
+        and price_before is not None
+        and (not is_listed or price_after is None or price_after > price_before)
     ):
-        if collection.type == CollectionType.ERC721:
-            unique_owners = Erc721Token.objects.using(using).filter(
-                collection=collection, approved=True
-            ).exclude(owner__address="0x0000000000000000000000000000000000000000")
-        elif collection.type == CollectionType.ERC1155:
-            unique_owners = Erc1155TokenOwner.objects.using(using).filter(
-                token__collection=collection
-            ).exclude(owner__address="0x0000000000000000000000000000000000000000")
-
-        if NETWORK == "opt-mainnet":
-            unique_owners = unique_owners.exclude(
-                owner__address="0x5a7749f83b81B301cAb5f48EB8516B986DAef23D"
-            )
-        elif NETWORK == "opt-goerli":
-            unique_owners = unique_owners.exclude(
-                owner__address="0x8DD330DdE8D9898d43b4dc840Da27A07dF91b3c9"
+        cheapest = (
+            Erc721Token.objects.filter(
+                collection_id=OuterRef("id"), for_sale=True, price_eth__isnull=False
             )
-
-        return unique_owners.distinct("owner").count()
-    else:
-        return 0
-
-
-def collection_listed_count(collection, using='default'):
-    listed_count = Erc721Token.objects.using(using).filter(
-        collection=collection, for_sale=True
-    ).count()
-    return listed_count
-
-
-def collection_sales(collection, using='default'):
-    sell_order_count = Erc721SellOrder.objects.using(using).filter(
-        token__collection=collection, fulfilled=True
-    ).count()
-    buy_order_count = Erc721BuyOrder.objects.using(using).filter(
-        token__collection=collection, fulfilled=True
-    ).count()
-    dutch_auction_count = Erc721DutchAuction.objects.using(using).filter(
-        token__collection=collection, fulfilled=True
-    ).count()
-
-    sales = sell_order_count + buy_order_count + dutch_auction_count
-    return sales
-
-
-def collection_24h_sales(collection, using='default'):
-    sales_key = f"collection_24h_sales__{collection.address}"
-    if res := cache.get(sales_key):
-        return res
-    else:
-        time_delta = datetime.now(timezone.utc) - timedelta(hours=24)
-
-        sell_order_count = Erc721SellOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-        buy_order_count = Erc721BuyOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-        dutch_auction_count = Erc721DutchAuction.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-
-        sales = sell_order_count + buy_order_count + dutch_auction_count
-        cache.set(sales_key, sales, 60 * 30)
-        return sales
-
-
-def collection_Xd_sales(collection, days, using='default'):
-    sales_key = f"collection_{str(days)}d_sales__{collection.address}"
-    if res := cache.get(sales_key):
-        return res
-    else:
-        time_delta = datetime.now(timezone.utc) - timedelta(days=days)
-
-        sell_order_count = Erc721SellOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-        buy_order_count = Erc721BuyOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-        dutch_auction_count = Erc721DutchAuction.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, time_sold__gte=time_delta
-        ).count()
-
-        sales = sell_order_count + buy_order_count + dutch_auction_count
-        cache.set(sales_key, sales, 60 * 60)
-        return sales
-
-
-def collection_volume(collection, using='default'):
-    sell_order_volume = (
-        Erc721SellOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, payment_token__symbol="ETH"
-        )
-        .aggregate(Sum("price"))
-        .get("price__sum")
-    )
-    buy_order_volume = (
-        Erc721BuyOrder.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, payment_token__symbol="WETH"
-        )
-        .aggregate(Sum("price"))
-        .get("price__sum")
-    )
-    dutch_auction_volume = (
-        Erc721DutchAuction.objects.using(using).filter(
-            token__collection=collection, fulfilled=True, payment_token__symbol="ETH"
+            .order_by("price_eth")
+            .values("price_eth")[:1]
         )
-        .aggregate(Sum("price"))
-        .get("price__sum")
-    )
-    volume_traded = sum(
-        filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
-    )
-
-    try:
-        op_to_eth = BlockchainState.objects.using(using).get(key="op_eth_price").value
-        sell_order_volume = (
-            Erc721SellOrder.objects.using(using).filter(
-                token__collection=collection, fulfilled=True, payment_token__symbol="OP"
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
+        collections.filter(floor=price_before).update(floor=Subquery(cheapest))
+
+
+def refresh_holders(holders):
+    """
+    Recount the tokens held by each (collection id, owner id) pair in `holders`
+    and save them to CollectionHolder. Only those owners' tokens are counted,
+    so call this with the old and new owner whenever tokens change hands.
+
+    Each pair is locked before it's counted, so of two concurrent recounts of
+    the same owner the second one sees the first one's transfer. Token approval
+    isn't tracked, so run rebuild_collection_holders after changing it.
+    """
+    holders = sorted({(c, o) for c, o in holders if c and o})
+    if not holders:
+        return
+    collection_ids = {c for c, _o in holders}
+    owner_ids = {o for _c, o in holders}
+    excluded_ids = set(_excluded_owner_ids())
+
+    with transaction.atomic():
+        # Locks are taken in a fixed order, to avoid deadlocks, and held until commit
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT pg_advisory_xact_lock(c, o)
+                FROM (
+                    SELECT c, o FROM unnest(%s::int[], %s::int[]) AS pairs(c, o)
+                    ORDER BY c, o
+                ) AS ordered_pairs
+                """,
+                [
+                    [c % 2**31 for c, _o in holders],
+                    [o % 2**31 for _c, o in holders],
+                ],
+            )
+        counts = _holder_counts(
+            collection_ids,
+            {"owner_id__in": owner_ids},
+            {"owner_id__in": owner_ids},
+            'default',
         )
-        buy_order_volume = (
-            Erc721BuyOrder.objects.using(using).filter(
-                token__collection=collection, fulfilled=True, payment_token__symbol="OP"
+        existing = {
+            (h.collection_id, h.owner_id): h
+            for h in CollectionHolder.objects.select_for_update().filter(
+                collection_id__in=collection_ids, owner_id__in=owner_ids
             )
-            .aggregate(Sum("price"))
-            .get("price__sum")
+        }
+        now = datetime.now(timezone.utc)
+        to_create, to_update, to_delete = [], [], []
+        for collection_id, owner_id in holders:
+            quantity = counts.get((collection_id, owner_id), 0)
+            if owner_id in excluded_ids:
+                quantity = 0
+            holder = existing.get((collection_id, owner_id))
+            if not holder:
+                if quantity:
+                    to_create.append(
+                        CollectionHolder(
+                            collection_id=collection_id,
+                            owner_id=owner_id,
+                            quantity=quantity,
+                        )
+                    )
+            elif not quantity:
+                to_delete.append(holder.id)
+            elif holder.quantity != quantity:
+                holder.quantity = quantity
+                holder.updated_at = now
+                to_update.append(holder)
+
+        CollectionHolder.objects.filter(id__in=to_delete).delete()
+        CollectionHolder.objects.bulk_update(to_update, ["quantity", "updated_at"])
+        CollectionHolder.objects.bulk_create(to_create, ignore_conflicts=True)
+
+
+def rebuild_holders(collection_ids, using='default'):
+    """
+    Recount every holder of `collection_ids` from scratch, e.g. to backfill the
+    table or after changing which tokens are approved.
+    """
+    counts = _holder_counts(set(collection_ids), {}, {}, using)
+    excluded_ids = set(_excluded_owner_ids(using))
+    holders = [
+        CollectionHolder(collection_id=collection_id, owner_id=owner_id, quantity=n)
+        for (collection_id, owner_id), n in counts.items()
+        if n and owner_id not in excluded_ids
+    ]
+    with transaction.atomic():
+        CollectionHolder.objects.filter(collection_id__in=collection_ids).delete()
+        CollectionHolder.objects.bulk_create(holders, batch_size=1000)
+    return len(holders)
+
+
+def _holder_counts(collection_ids, erc721_filters, erc1155_filters, using):
+    """
+    Returns {(collection id, owner id): tokens held}. ERC-721 tokens count once
+    each while they're approved, ERC-1155 holders count their whole balance.
+    """
+    erc1155_ids = set(
+        Erc721Collection.objects.using(using)
+        .filter(id__in=collection_ids, type=CollectionType.ERC1155)
+        .values_list("id", flat=True)
+    )
+    counts = {}
+    erc721_ids = collection_ids - erc1155_ids
+    if erc721_ids:
+        rows = (
+            Erc721Token.objects.using(using)
+            .filter(
+                collection_id__in=erc721_ids,
+                owner_id__isnull=False,
+                approved=True,
+                **erc721_filters,
+            )
+            .values("collection_id", "owner_id")
+            .annotate(quantity=Count("id"))
+            .values_list("collection_id", "owner_id", "quantity")
+            .order_by()
         )
-        dutch_auction_volume = (
-            Erc721DutchAuction.objects.using(using).filter(
-                token__collection=collection, fulfilled=True, payment_token__symbol="OP"
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
+        counts.update({(c, o): n for c, o, n in rows})
+    if erc1155_ids:
+        rows = (
+            Erc1155TokenOwner.objects.using(using)
+            .filter(token__collection_id__in=erc1155_ids, **erc1155_filters)
+            .values("token__collection_id", "owner_id")
+            .annotate(quantity=Sum("quantity"))
+            .values_list("token__collection_id", "owner_id", "quantity")
+            .order_by()
         )
-        volume_traded += sum(
-            filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
-        ) * float(op_to_eth)
-    except Exception as e:
-        pass
+        counts.update({(c, o): n for c, o, n in rows})
+    return counts
 
-    return volume_traded
 
+def _excluded_owner_ids(using='default'):
+    return list(
+        Profile.objects.using(using)
+        .filter(address__in=excluded_owner_addresses())
+        .values_list("id", flat=True)
+    )
 
-def collection_24h_volume(collection, using='default'):
-    volume_traded_key = f"collection_24h_volume__{collection.address}"
-    if res := cache.get(volume_traded_key):
-        return res
-    else:
-        time_delta = datetime.now(timezone.utc) - timedelta(hours=24)
-
-        sell_order_volume = (
-            Erc721SellOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        buy_order_volume = (
-            Erc721BuyOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="WETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        dutch_auction_volume = (
-            Erc721DutchAuction.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        volume_traded = sum(
-            filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
-        )
-
-        try:
-            op_to_eth = BlockchainState.objects.using(using).get(key="op_eth_price").value
-            sell_order_volume = (
-                Erc721SellOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            buy_order_volume = (
-                Erc721BuyOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            dutch_auction_volume = (
-                Erc721DutchAuction.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            volume_traded += sum(
-                filter(
-                    None, [sell_order_volume, buy_order_volume, dutch_auction_volume]
-                )
-            ) * float(op_to_eth)
-        except Exception as e:
-            pass
-
-        cache.set(volume_traded_key, volume_traded, 60 * 30)
-        return volume_traded
 
+def refresh_dirty_collections_stats(using='default', batch_size=2000):
+    """
+    Refresh the collections marked dirty since the last run, plus those with
+    recent sales, whose rolling windows move even when nothing happens.
+    """
+    # Claim the current marks first, so marks made during the refresh are kept
+    dirty_ids = list(DirtyCollection.objects.values_list("collection_id", flat=True))
+    DirtyCollection.objects.filter(collection_id__in=dirty_ids).delete()
+
+    # A day ago the previous 30 day window still reached back 61 days
+    since = (datetime.now(timezone.utc) - timedelta(days=62)).date()
+    recent_ids = CollectionDailyStats.objects.filter(
+        date__gte=since, sales__gt=0
+    ).values("collection_id")
+    collections = list(
+        Erc721Collection.objects.filter(approved=True)
+        .filter(Q(id__in=dirty_ids) | Q(id__in=recent_ids))
+        .order_by("id")
+    )
 
-def collection_prev_24h_volume(collection, using='default'):
-    volume_traded_key = f"collection_prev_24h_volume__{collection.address}"
-    if res := cache.get(volume_traded_key):
-        return res
-    else:
-        time_delta_1 = datetime.now(timezone.utc) - timedelta(hours=48)
-        time_delta_2 = datetime.now(timezone.utc) - timedelta(hours=24)
-
-        sell_order_volume = (
-            Erc721SellOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        buy_order_volume = (
-            Erc721BuyOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="WETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        dutch_auction_volume = (
-            Erc721DutchAuction.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        volume_traded = sum(
-            filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
-        )
+    # A lagging follower may not have the writes that marked a collection yet,
+    # and its mark is gone, so dirty collections are read from the primary
+    dirty_id_set = set(dirty_ids)
+    dirty = [c for c in collections if c.id in dirty_id_set]
+    recent = [c for c in collections if c.id not in dirty_id_set]
 
-        try:
-            op_to_eth = BlockchainState.objects.using(using).get(key="op_eth_price").value
-            sell_order_volume = (
-                Erc721SellOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            buy_order_volume = (
-                Erc721BuyOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            dutch_auction_volume = (
-                Erc721DutchAuction.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            volume_traded += sum(
-                filter(
-                    None, [sell_order_volume, buy_order_volume, dutch_auction_volume]
+    try:
+        for batch_collections, batch_using in ((dirty, 'default'), (recent, using)):
+            for i in range(0, len(batch_collections), batch_size):
+                refresh_collections_stats(
+                    batch_collections[i : i + batch_size], batch_using
                 )
-            ) * float(op_to_eth)
-        except Exception as e:
-            pass
-
-        cache.set(volume_traded_key, volume_traded, 60 * 30)
-        return volume_traded
-
-
-def collection_24h_volume_change(collection, using='default'):
-    new = collection_24h_volume(collection, using)
-    old = collection_prev_24h_volume(collection, using)
-    if old > 0:
-        return (new - old) / old
-    else:
-        return None
+    except Exception:
+        mark_stats_dirty(dirty_ids)
+        raise
+    return collections
+
+
+def refresh_collections_stats(collections, using='default'):
+    """
+    Recompute the stats fields of `collections` with one grouped query per
+    table, using FILTER and CASE aggregates so every metric comes out of the
+    same scan, then save them with one bulk_update.
+    """
+    collections = list(collections)
+    collection_ids = [c.id for c in collections]
+    excluded_owner_ids = _excluded_owner_ids(using)
+    held = Q(approved=True) & ~Q(owner_id__in=excluded_owner_ids)
+
+    token_stats = {
+        row["collection_id"]: row
+        for row in Erc721Token.objects.using(using)
+        .filter(collection_id__in=collection_ids)
+        .values("collection_id")
+        .annotate(
+            listed=Count("id", filter=Q(for_sale=True)),
+            supply=Count("id", filter=held),
+        )
+        .order_by()
+    }
+    # Floors are kept up to date by update_floor, so don't overwrite them with
+    # a lagging follower. This only reads the partial listing index.
+    floors = dict(
+        Erc721Token.objects.filter(collection_id__in=collection_ids, for_sale=True)
+        .values("collection_id")
+        .annotate(floor=Min("price_eth"))
+        .values_list("collection_id", "floor")
+        .order_by()
+    )
 
+    # Maintained by refresh_holders, so owners is a count over a small table
+    owners = dict(
+        CollectionHolder.objects.using(using)
+        .filter(collection_id__in=collection_ids)
+        .values("collection_id")
+        .annotate(owners=Count("id"))
+        .values_list("collection_id", "owners")
+        .order_by()
+    )
 
-def collection_Xd_volume(collection, days, using='default'):
-    volume_traded_key = f"collection_{str(days)}d_volume__{collection.address}"
-    if res := cache.get(volume_traded_key):
-        return res
-    else:
-        time_delta = datetime.now(timezone.utc) - timedelta(days=days)
-
-        sell_order_volume = (
-            Erc721SellOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        buy_order_volume = (
-            Erc721BuyOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="WETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        dutch_auction_volume = (
-            Erc721DutchAuction.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        volume_traded = sum(
-            filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
+    sales_stats = collections_sales_stats(collection_ids, using)
+
+    for collection in collections:
+        tokens = token_stats.get(collection.id, {})
+        collection.floor = floors.get(collection.id)
+        collection.listed = tokens.get("listed", 0)
+        collection.supply = tokens.get("supply", 0)
+        collection.owners = owners.get(collection.id, 0)
+        for field, value in sales_stats[collection.id].items():
+            setattr(collection, field, value)
+        # Stored so the leaderboards can sort on them in the database
+        for name, _window in WINDOWS:
+            setattr(
+                collection,
+                f"volume_change_{name}",
+                _volume_change(
+                    getattr(collection, f"volume_{name}"),
+                    getattr(collection, f"volume_prev_{name}"),
+                ),
+            )
+
+    Erc721Collection.objects.bulk_update(collections, STATS_FIELDS, batch_size=500)
+    snapshot_floors(collections)
+    return collections
+
+
+def collections_sales_stats(collection_ids, using='default'):
+    """
+    Returns {collection id: sales and volume fields}, summed from the daily
+    stats in one grouped query. Windows are rolling: a day that is partly inside
+    a window counts in proportion to the overlap, as if its sales were spread
+    evenly over the day.
+    """
+    now = datetime.now(timezone.utc)
+    aggregates = {
+        "sales": Sum("sales"),
+        "volume": Sum("volume"),
+    }
+    for name, window in WINDOWS:
+        aggregates[f"sales_{name}"] = _window_sum("sales", now - window, now, now)
+        aggregates[f"volume_{name}"] = _window_sum("volume", now - window, now, now)
+        aggregates[f"volume_prev_{name}"] = _window_sum(
+            "volume", now - 2 * window, now - window, now
         )
 
-        try:
-            op_to_eth = BlockchainState.objects.using(using).get(key="op_eth_price").value
-            sell_order_volume = (
-                Erc721SellOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            buy_order_volume = (
-                Erc721BuyOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            dutch_auction_volume = (
-                Erc721DutchAuction.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            volume_traded += sum(
-                filter(
-                    None, [sell_order_volume, buy_order_volume, dutch_auction_volume]
-                )
-            ) * float(op_to_eth)
-        except Exception as e:
-            pass
+    rows = {
+        row.pop("collection_id"): row
+        for row in CollectionDailyStats.objects.using(using)
+        .filter(collection_id__in=collection_ids)
+        .values("collection_id")
+        .annotate(**aggregates)
+        .order_by()
+    }
+    return {
+        collection_id: {
+            field: round(rows.get(collection_id, {}).get(field) or 0)
+            for field in aggregates
+        }
+        for collection_id in collection_ids
+    }
+
+
+def _volume_change(volume, previous_volume):
+    if previous_volume:
+        return (volume - previous_volume) / previous_volume
+    return None
+
+
+def _window_sum(field, start, end, now):
+    first_day, last_day = start.date(), end.date()
+    first_weight = _day_weight(first_day, start, end, now)
+    last_weight = _day_weight(last_day, start, end, now)
+    return Sum(
+        Case(
+            When(date=first_day, then=F(field) * Value(first_weight)),
+            When(date=last_day, then=F(field) * Value(last_weight)),
+            default=F(field) * Value(1.0),
+            output_field=FloatField(),
+        ),
+        filter=Q(date__gte=first_day, date__lte=last_day),
+    )
 
-        cache.set(volume_traded_key, volume_traded, 60 * 60)
-        return volume_traded
 
+def _day_weight(date, start, end, now):
+    """
+    The share of a day's sales that fall between start and end.
+    """
+    day_start = datetime(date.year, date.month, date.day, tzinfo=timezone.utc)
+    # Today's sales all happened before now
+    day_end = min(day_start + timedelta(days=1), now)
+    if day_end <= day_start:
+        return 0.0
+    overlap = min(end, day_end) - max(start, day_start)
+    return max(overlap / (day_end - day_start), 0.0)
 
-def collection_prev_Xd_volume(collection, days, using='default'):
-    volume_traded_key = f"collection_prev_{str(days)}d_volume__{collection.address}"
-    if res := cache.get(volume_traded_key):
-        return res
-    else:
-        time_delta_1 = datetime.now(timezone.utc) - timedelta(days=days * 2)
-        time_delta_2 = datetime.now(timezone.utc) - timedelta(days=days)
-
-        sell_order_volume = (
-            Erc721SellOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        buy_order_volume = (
-            Erc721BuyOrder.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="WETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        dutch_auction_volume = (
-            Erc721DutchAuction.objects.using(using).filter(
-                token__collection=collection,
-                fulfilled=True,
-                time_sold__gte=time_delta_1,
-                time_sold__lt=time_delta_2,
-                payment_token__symbol="ETH",
-            )
-            .aggregate(Sum("price"))
-            .get("price__sum")
-        )
-        volume_traded = sum(
-            filter(None, [sell_order_volume, buy_order_volume, dutch_auction_volume])
-        )
 
-        try:
-            op_to_eth = BlockchainState.objects.using(using).get(key="op_eth_price").value
-            sell_order_volume = (
-                Erc721SellOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            buy_order_volume = (
-                Erc721BuyOrder.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            dutch_auction_volume = (
-                Erc721DutchAuction.objects.using(using).filter(
-                    token__collection=collection,
-                    fulfilled=True,
-                    time_sold__gte=time_delta_1,
-                    time_sold__lt=time_delta_2,
-                    payment_token__symbol="OP",
-                )
-                .aggregate(Sum("price"))
-                .get("price__sum")
-            )
-            volume_traded += sum(
-                filter(
-                    None, [sell_order_volume, buy_order_volume, dutch_auction_volume]
-                )
-            ) * float(op_to_eth)
-        except Exception as e:
-            pass
+def collection_daily_stats(collection, using='default'):
+    daily_stats_key = f"collection_daily_stats__{collection.address}"
+    if res := cache.get(daily_stats_key):
+        return res
 
-        cache.set(volume_traded_key, volume_traded, 60 * 60)
-        return volume_traded
+    daily_stats = [
+        {"date": stats.date, **_chart_point(stats)}
+        for stats in CollectionDailyStats.objects.using(using)
+        .filter(collection_id=collection.id, sales__gt=0)
+        .order_by("-date")
+    ]
 
+    cache.set(daily_stats_key, daily_stats, 60 * 10)
+    return daily_stats
 
-def collection_Xd_volume_change(collection, days, using='default'):
-    new = collection_Xd_volume(collection, days, using)
-    old = collection_prev_Xd_volume(collection, days, using)
-    if old > 0:
-        return (new - old) / old
-    else:
-        return None
 
+def collection_hourly_stats(collection, hours, using='default'):
+    """
+    Hourly chart for the last `hours` hours, oldest first. Hours without sales
+    or a floor change are left out.
+    """
+    hourly_stats_key = f"collection_hourly_stats__{collection.address}__{hours}"
+    if res := cache.get(hourly_stats_key):
+        return res
 
-def collection_daily_stats(collection, using='default'):
-    daily_stats_key = f"collection_daily_stats__{collection.address}"
-    if res := cache.get(daily_stats_key):
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    hourly_stats = [
+        {"time": int(stats.hour.timestamp()), **_chart_point(stats)}
+        for stats in CollectionHourlyStats.objects.using(using)
+        .filter(collection_id=collection.id, hour__gte=since)
+        .order_by("hour")
+    ]
+
+    cache.set(hourly_stats_key, hourly_stats, 60)
+    return hourly_stats
+
+
+def collection_holder_distribution(collection, using='default'):
+    """
+    Returns the number of holders, the tokens they hold, the percent held by the
+    TOP_HOLDERS_SHARE largest holders and a histogram of tokens per holder,
+    all read from CollectionHolder.
+    """
+    holder_distribution_key = f"collection_holder_distribution__{collection.address}"
+    if res := cache.get(holder_distribution_key):
         return res
 
-    raw_daily_stats = (
-        Erc721Activity.objects.using(using).annotate(
-            coalesce_payment_token=Coalesce(
-                "sell_order__payment_token__symbol",
-                "buy_order__payment_token__symbol",
-                "dutch_auction__payment_token__symbol",
-            )
+    holders = CollectionHolder.objects.using(using).filter(collection_id=collection.id)
+    buckets = {
+        f"bucket_{i}": Count(
+            "id",
+            filter=Q(quantity__gte=low)
+            & (Q(quantity__lte=high) if high is not None else Q()),
         )
-        .filter(
-            token__collection_id=collection.id,
-            event_type_short="SA",
+        for i, (low, high) in enumerate(HOLDER_BUCKETS)
+    }
+    totals = holders.aggregate(owners=Count("id"), held=Sum("quantity"), **buckets)
+    held = totals["held"] or 0
+    # Reads the first entries of the holder index
+    top_held = sum(
+        holders.order_by("-quantity", "owner_id").values_list("quantity", flat=True)[
+            :TOP_HOLDERS_SHARE
+        ]
+    )
+
+    distribution = {
+        "num_owners": totals["owners"],
+        "total_held": held,
+        "top_holders_percent": round(top_held / held * 100, 2) if held else None,
+        "histogram": [
+            {"min": low, "max": high, "owners": totals[f"bucket_{i}"]}
+            for i, (low, high) in enumerate(HOLDER_BUCKETS)
+        ],
+    }
+
+    cache.set(holder_distribution_key, distribution, 60)
+    return distribution
+
+
+def collection_top_holders(collection, limit=20, cursor=None, using='default'):
+    """
+    Returns a page of holders, largest first, and the cursor for the next page
+    or None. Pages are keyset paginated on (quantity, owner id), so any page is
+    a range read of the holder index. Raises ValueError for a bad cursor.
+    """
+    holders = (
+        CollectionHolder.objects.using(using)
+        .filter(collection_id=collection.id)
+        .select_related("owner")
+        .order_by("-quantity", "owner_id")
+    )
+    if cursor:
+        quantity, owner_id = (int(part) for part in cursor.split("_"))
+        holders = holders.filter(
+            Q(quantity__lt=quantity) | Q(quantity=quantity, owner_id__gt=owner_id)
         )
-        .filter(Q(coalesce_payment_token="ETH") | Q(coalesce_payment_token="WETH"))
-        .annotate(
-            date_sold=TruncDate(
-                Coalesce(
-                    "sell_order__time_sold",
-                    "buy_order__time_sold",
-                    "dutch_auction__time_sold",
-                )
-            )
+
+    page = list(holders[: limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = f"{page[-1].quantity}_{page[-1].owner_id}"
+    return page, next_cursor
+
+
+def snapshot_floors(collections):
+    """
+    Store each collection's current floor in this hour's and today's stats.
+    Rows are only written when the floor differs from the last stored one, so
+    quiet collections don't get a row every refresh.
+    """
+    now = datetime.now(timezone.utc)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    floors = {c.id: c.floor for c in collections}
+    for model, field, bucket in (
+        (CollectionHourlyStats, "hour", hour),
+        (CollectionDailyStats, "date", now.date()),
+    ):
+        existing = list(
+            model.objects.filter(collection_id__in=floors, **{field: bucket})
         )
-        .values("date_sold")
-        .annotate(
-            volume=Sum(
-                Coalesce(
-                    "sell_order__price", "buy_order__price", "dutch_auction__price"
-                )
-            )
+        changed = [
+            stats for stats in existing if stats.floor != floors[stats.collection_id]
+        ]
+        for stats in changed:
+            stats.floor = floors[stats.collection_id]
+        model.objects.bulk_update(changed, ["floor"], batch_size=1000)
+
+        missing = set(floors) - {stats.collection_id for stats in existing}
+        last_floors = dict(
+            model.objects.filter(
+                collection_id__in=missing, **{f"{field}__lt": bucket}
+            )
+            .order_by("collection_id", f"-{field}")
+            .distinct("collection_id")
+            .values_list("collection_id", "floor")
         )
-        .annotate(
-            avg_price=Avg(
-                Coalesce(
-                    "sell_order__price", "buy_order__price", "dutch_auction__price"
+        model.objects.bulk_create(
+            [
+                model(
+                    collection_id=collection_id,
+                    floor=floors[collection_id],
+                    **{field: bucket},
                 )
-            )
+                for collection_id in missing
+                if floors[collection_id] != last_floors.get(collection_id)
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
         )
-        .annotate(num_traded=Count("id"))
-        .order_by("-date_sold")
-    )
 
-    i = 0
-    daily_stats = []
-    for stat in raw_daily_stats:
-        stat_json = {
-            "date": stat["date_sold"],
-            "volume": int(stat["volume"]) / (10**9),
-            "avg_price": int(stat["avg_price"]) / (10**9),
-            "num_traded": stat["num_traded"],
-        }
-        daily_stats.append(stat_json)
-        i += 1
 
-    cache.set(daily_stats_key, daily_stats, 60 * 60)
-    return daily_stats
+def _chart_point(stats):
+    def eth(gwei):
+        return gwei / (10**9) if gwei is not None else None
+
+    return {
+        "volume": eth(stats.volume),
+        "avg_price": eth(stats.avg_price()),
+        "min_price": eth(stats.min_price),
+        "max_price": eth(stats.max_price),
+        "floor": eth(stats.floor),
+        "num_traded": stats.sales,
+    }
@@ -1,21 +1,113 @@
-from .constants import eth_mainnet_web3
+from datetime import datetime, timezone
 
+from django.core.cache import cache
+from django.db import transaction
 from ens import ENS
 
+from ..abis.ens_reverse_records_abi import ens_reverse_records_abi
+from .constants import eth_mainnet_web3
+
 ns = ENS.fromWeb3(eth_mainnet_web3)
 
+# ENS ReverseRecords contract: reverse lookup with forward verification for many addresses in one call
+ENS_REVERSE_RECORDS_ADDRESS = "0x3671aE578E63FdF66ad4F3E12CC0c0d71Ac7510C"
+reverse_records_contract = eth_mainnet_web3.eth.contract(
+    address=ENS_REVERSE_RECORDS_ADDRESS, abi=ens_reverse_records_abi
+)
+
+ENS_BATCH_SIZE = 100
+# Cache names for a day, and addresses without a name for 6 hours
+ENS_CACHE_SECONDS = 60 * 60 * 24
+ENS_NEGATIVE_CACHE_SECONDS = 60 * 60 * 6
+
+
+def _ens_cache_key(address):
+    return f"ENS_NAME_{address}"
+
+
+def _cache_ens(address, domain):
+    # Store misses as "" so they are cached too
+    cache.set(
+        _ens_cache_key(address),
+        domain or "",
+        ENS_CACHE_SECONDS if domain else ENS_NEGATIVE_CACHE_SECONDS,
+    )
+
 
 def get_ens_for_address(address):
+    cached = cache.get(_ens_cache_key(address))
+    if cached is not None:
+        return cached or None
+
     try:
         domain = ns.name(address)
-        if ns.address(domain) == address:
-            return domain
-        else:
-            return None
+        if not domain or ns.address(domain) != address:
+            domain = None
     except Exception as e:
         print(e)
         return None
 
+    _cache_ens(address, domain)
+    return domain
+
+
+def get_ens_for_addresses(addresses):
+    """
+    Resolve reverse ENS names for many addresses, returning {address: name or None}.
+    Addresses in a batch that failed to resolve are left out.
+    """
+    names = {}
+    cached = cache.get_many([_ens_cache_key(address) for address in addresses])
+    missing = []
+    for address in addresses:
+        domain = cached.get(_ens_cache_key(address))
+        if domain is None:
+            missing.append(address)
+        else:
+            names[address] = domain or None
+
+    for i in range(0, len(missing), ENS_BATCH_SIZE):
+        batch = missing[i : i + ENS_BATCH_SIZE]
+        try:
+            domains = reverse_records_contract.functions.getNames(batch).call()
+        except Exception as e:
+            print(e)
+            continue
+        for address, domain in zip(batch, domains):
+            names[address] = domain or None
+            _cache_ens(address, domain)
+
+    return names
+
+
+def refresh_ens_for_profiles(profile_ids):
+    """
+    Batch version of Profile.refresh_ens.
+    """
+    from .. import models
+    from .restricted_usernames import is_restricted
+
+    profiles = list(models.Profile.objects.filter(id__in=profile_ids))
+    names = get_ens_for_addresses([p.address for p in profiles])
+    now = datetime.now(tz=timezone.utc)
+
+    # Profiles whose lookup failed keep their name and are retried next run
+    profiles = [p for p in profiles if p.address in names]
+    for profile in profiles:
+        ens = names[profile.address]
+        profile.reverse_ens = ens if ens and not is_restricted(ens) else None
+        profile.ens_checked_at = now
+
+    with transaction.atomic():
+        # A name can only belong to one profile, so take it from whoever had it before
+        claimed = [p.reverse_ens for p in profiles if p.reverse_ens]
+        models.Profile.objects.filter(reverse_ens__in=claimed).update(
+            reverse_ens=None
+        )
+        models.Profile.objects.bulk_update(profiles, ["reverse_ens", "ens_checked_at"])
+
+    return len(profiles)
+
 
 def get_address_for_ens(ens):
     address = ns.address(ens)
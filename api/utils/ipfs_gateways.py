@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_GATEWAYS = "https://quixotic.infura-ipfs.io,https://quixotic.mypinata.cloud"
+STATS_WINDOW = 200
+MIN_SAMPLES = 10
+# Assumed latency for a gateway we don't have enough samples for yet
+DEFAULT_LATENCY_SECONDS = 1.0
+# Send the hedged request once the first one is slower than this percentile
+HEDGE_PERCENTILE = 90
+MIN_HEDGE_DELAY_SECONDS = 0.25
+MAX_HEDGE_DELAY_SECONDS = 4.0
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 30)
+
+CID_RE = r"(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})"
+IPFS_PATH_RE = re.compile(r"^/ipfs/" + CID_RE + r"(/.*)?$")
+SUBDOMAIN_GATEWAY_RE = re.compile(r"^" + CID_RE + r"\.ipfs\.")
+
+
+def ipfs_path(uri):
+    """
+    Returns "<cid>/<path>" for ipfs:// URIs and IPFS gateway URLs, else None.
+    """
+    if uri.startswith("ipfs://"):
+        path = "/" + uri[len("ipfs://") :]
+        if not path.startswith("/ipfs/"):
+            path = "/ipfs" + path
+    else:
+        parsed = urlparse(uri)
+        if parsed.scheme not in ("http", "https") or parsed.query:
+            return None
+        if match := SUBDOMAIN_GATEWAY_RE.match(parsed.netloc):
+            path = f"/ipfs/{match.group(1)}{parsed.path}"
+        else:
+            path = parsed.path
+
+    match = IPFS_PATH_RE.match(path)
+    if not match:
+        return None
+    cid, rest = match.group(1), match.group(2) or ""
+    rest = "/".join(part for part in rest.split("/") if part)
+    return f"{cid}/{rest}" if rest else cid
+
+
+class GatewayPool:
+    """
+    Tracks recent latency and error rate for each IPFS gateway.
+
+    Gateways are ranked by expected time to a successful response, i.e. median
+    latency divided by success rate. The hedge delay for a gateway is its
+    HEDGE_PERCENTILE latency: a request still running after that long is
+    probably stuck, so a second one is sent to the next gateway.
+    """
+
+    def __init__(self, gateways):
+        self.gateways = gateways
+        self.latencies = {g: deque(maxlen=STATS_WINDOW) for g in gateways}
+        self.outcomes = {g: deque(maxlen=STATS_WINDOW) for g in gateways}
+        self.lock = threading.Lock()
+
+    def record(self, gateway, latency, ok=None):
+        # ok=None records a lower bound on latency for a cancelled hedge loser
+        with self.lock:
+            self.latencies[gateway].append(latency)
+            if ok is not None:
+                self.outcomes[gateway].append(ok)
+
+    def ranked(self):
+        with self.lock:
+            return sorted(self.gateways, key=self._score)
+
+    def hedge_delay(self, gateway):
+        with self.lock:
+            latency = self._percentile(gateway, HEDGE_PERCENTILE)
+        if latency is None:
+            latency = DEFAULT_LATENCY_SECONDS
+        return min(max(latency, MIN_HEDGE_DELAY_SECONDS), MAX_HEDGE_DELAY_SECONDS)
+
+    def url(self, gateway, path):
+        return f"{gateway}/ipfs/{path}"
+
+    def stats(self):
+        with self.lock:
+            return {
+                g: {
+                    "p50": self._percentile(g, 50),
+                    "p90": self._percentile(g, 90),
+                    "error_rate": self._error_rate(g),
+                }
+                for g in self.gateways
+            }
+
+    def _score(self, gateway):
+        latency = self._percentile(gateway, 50)
+        if latency is None:
+            latency = DEFAULT_LATENCY_SECONDS
+        return latency / max(1 - self._error_rate(gateway), 0.05)
+
+    def _percentile(self, gateway, percentile):
+        latencies = sorted(self.latencies[gateway])
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) * percentile // 100, len(latencies) - 1)]
+
+    def _error_rate(self, gateway):
+        outcomes = self.outcomes[gateway]
+        if not outcomes:
+            return 0
+        return outcomes.count(False) / len(outcomes)
+
+
+gateway_pool = GatewayPool(
+    [
+        g.strip().rstrip("/")
+        for g in os.environ.get("IPFS_GATEWAYS", DEFAULT_GATEWAYS).split(",")
+        if g.strip()
+    ]
+)
+
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=50))
+hedge_executor = ThreadPoolExecutor(max_workers=32)
+
+
+def get(url, timeout=REQUEST_TIMEOUT, stream=False):
+    """
+    Drop-in for requests.get. IPFS URLs are served by the best gateway in the
+    pool, with a hedged request to the next one if the first is slow. Gateway
+    responses are always streamed.
+    """
+    path = ipfs_path(url)
+    if not path:
+        return session.get(url, timeout=timeout, stream=stream)
+
+    gateways = gateway_pool.ranked()
+    pending = set()
+    last_response = None
+    last_error = None
+    for i, gateway in enumerate(gateways):
+        pending.add(hedge_executor.submit(_get_from_gateway, gateway, path, timeout))
+        delay = gateway_pool.hedge_delay(gateway) if i < len(gateways) - 1 else None
+        while pending:
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # The request is slow, hedge with the next gateway
+                break
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if response.status_code < 400:
+                    _cancel(pending)
+                    return response
+                last_response = response
+            if i < len(gateways) - 1:
+                # Failed fast, move straight on to the next gateway
+                break
+
+    if last_response is not None:
+        return last_response
+    raise last_error or requests.RequestException(f"No gateway could serve {url}")
+
+
+def _get_from_gateway(gateway, path, timeout):
+    start = time.monotonic()
+    try:
+        # Streamed so a cancelled loser never downloads its body
+        response = session.get(
+            gateway_pool.url(gateway, path), timeout=timeout, stream=True
+        )
+    except Exception:
+        gateway_pool.record(gateway, time.monotonic() - start, False)
+        raise
+    gateway_pool.record(gateway, time.monotonic() - start, response.status_code < 400)
+    return response
+
+
+def _cancel(futures):
+    # Requests that already started can't be interrupted, so close their responses
+    for future in futures:
+        if not future.cancel():
+            future.add_done_callback(_close_response)
+
+
+def _close_response(future):
+    try:
+        future.result().close()
+    except Exception:
+        pass
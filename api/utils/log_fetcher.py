@@ -0,0 +1,165 @@
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from django.core.cache import cache
+
+DEFAULT_MAX_WORKERS = 4
+MAX_CHUNK_SIZE = 10_000_000
+MIN_CHUNK_SIZE = 1
+FETCH_RETRIES = 2
+# Remember good chunk sizes for a day
+CHUNK_SIZE_CACHE_SECONDS = 60 * 60 * 24
+
+RANGE_ERROR_MESSAGES = (
+    "log response size exceeded",
+    "query returned more than",
+    "response size",
+    "block range",
+    "too many",
+)
+SUGGESTED_RANGE_RE = re.compile(r"\[\s*(0x[0-9a-fA-F]+)\s*,\s*(0x[0-9a-fA-F]+)\s*\]")
+
+
+class LogRangeTooLarge(Exception):
+    pass
+
+
+def to_block_number(block, w3):
+    if block == "latest":
+        return w3.eth.block_number
+    if isinstance(block, str):
+        return int(block, 16) if block.startswith("0x") else int(block)
+    return int(block)
+
+
+def is_range_error(e):
+    message = str(e).lower()
+    return any(m in message for m in RANGE_ERROR_MESSAGES)
+
+
+def suggested_range_size(e):
+    # Alchemy includes a block range that should work, e.g. "[0x1, 0x2cb1276]"
+    match = SUGGESTED_RANGE_RE.search(str(e))
+    if not match:
+        return None
+    start, end = int(match.group(1), 16), int(match.group(2), 16)
+    if end <= start:
+        return None
+    return end - start + 1
+
+
+class BlockRangeLogFetcher:
+    """
+    Fetch logs over an arbitrary block range, splitting the range whenever the
+    provider rejects it for returning too many results.
+
+    `fetch_events(from_block, to_block)` must return the logs for an inclusive
+    block range. The largest chunk size that worked is cached under `cache_key`
+    so later scans of the same contract start from it.
+    """
+
+    def __init__(self, w3, fetch_events, cache_key=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.w3 = w3
+        self.fetch_events = fetch_events
+        self.cache_key = cache_key
+        self.max_workers = max_workers
+        self.chunk_size = cache.get(cache_key) if cache_key else None
+        self.lock = threading.Lock()
+
+    def fetch(self, from_block="0x1", to_block="latest"):
+        """
+        Generator over the logs between `from_block` and `to_block`, in block order.
+        """
+        from_block = to_block_number(from_block, self.w3)
+        to_block = to_block_number(to_block, self.w3)
+        if to_block < from_block:
+            return
+
+        try:
+            if self.chunk_size is None:
+                # Nothing known about this contract yet, so try the whole range first
+                try:
+                    events = self._fetch_with_retries(from_block, to_block)
+                    self._record_success(to_block - from_block + 1)
+                    yield from events
+                    return
+                except Exception as e:
+                    if not is_range_error(e) or from_block == to_block:
+                        raise
+                    self._record_failure(to_block - from_block + 1, e)
+
+            if self.max_workers > 1:
+                yield from self._fetch_concurrently(from_block, to_block)
+            else:
+                for start, end in self._windows(from_block, to_block):
+                    yield from self._fetch_range(start, end)
+        finally:
+            if self.cache_key and self.chunk_size:
+                cache.set(self.cache_key, self.chunk_size, CHUNK_SIZE_CACHE_SECONDS)
+
+    def _windows(self, from_block, to_block):
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.chunk_size - 1, to_block)
+            yield start, end
+            start = end + 1
+
+    def _fetch_concurrently(self, from_block, to_block):
+        # Keep at most max_workers ranges in flight and yield them in order
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for start, end in self._windows(from_block, to_block):
+                pending.append(pool.submit(self._fetch_range, start, end))
+                if len(pending) >= self.max_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def _fetch_range(self, from_block, to_block):
+        try:
+            events = self._fetch_with_retries(from_block, to_block)
+        except Exception as e:
+            if not is_range_error(e):
+                raise
+            if from_block == to_block:
+                raise LogRangeTooLarge(
+                    f"Too many logs in block {from_block} to fetch in one request"
+                ) from e
+
+            span = to_block - from_block + 1
+            self._record_failure(span, e)
+            mid = from_block + span // 2 - 1
+            print(f"Splitting log range {from_block}-{to_block} at {mid}")
+            return self._fetch_range(from_block, mid) + self._fetch_range(
+                mid + 1, to_block
+            )
+
+        self._record_success(to_block - from_block + 1)
+        return events
+
+    def _fetch_with_retries(self, from_block, to_block):
+        retries = FETCH_RETRIES
+        while True:
+            try:
+                return self.fetch_events(from_block, to_block)
+            except Exception as e:
+                if is_range_error(e) or retries == 0:
+                    raise
+                retries -= 1
+                sleep(1)
+
+    def _record_success(self, span):
+        with self.lock:
+            if self.chunk_size is None or span >= self.chunk_size:
+                # Widen the window a little so quiet stretches of history are scanned faster
+                self.chunk_size = min(span + span // 4 + 1, MAX_CHUNK_SIZE)
+
+    def _record_failure(self, span, e):
+        with self.lock:
+            new_size = suggested_range_size(e) or span // 2
+            new_size = max(min(new_size, span - 1), MIN_CHUNK_SIZE)
+            if self.chunk_size is None or new_size < self.chunk_size:
+                self.chunk_size = new_size
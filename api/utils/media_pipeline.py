@@ -0,0 +1,297 @@
+import hashlib
+import os
+import tempfile
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from django.conf import settings
+from PIL import Image
+
+from api.models import MediaObject
+from api.utils import ipfs_gateways
+
+S3_BASE_PATH = "https://fanbase-1.s3.amazonaws.com"
+# Downloads bigger than this are abandoned instead of filling the disk or memory
+MAX_MEDIA_BYTES = int(os.environ.get("MEDIA_MAX_BYTES", 64 * 1024 * 1024))
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MEDIA_MAX_CONCURRENT_DOWNLOADS", 4))
+RESIZE_WORKERS = int(os.environ.get("MEDIA_RESIZE_WORKERS", 2))
+# Refuse to decode anything bigger than this, e.g. a 20k x 20k PNG
+MAX_IMAGE_PIXELS = 64_000_000
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Largest first, each size is resized from the one before it
+THUMBNAIL_SIZES = (1000, 500, 200)
+THUMBNAIL_QUALITY = 75
+ORIGINAL_VARIANT = "original"
+# JPEG and PNG thumbnails are for clients without WebP support
+FORMATS = {
+    "JPEG": (".jpg", "image/jpeg"),
+    "PNG": (".png", "image/png"),
+    "WEBP": (".webp", "image/webp"),
+}
+# Only images are stored, so don't download videos and pages at all
+SKIPPED_CONTENT_TYPES = ("video/", "audio/", "model/", "text/html")
+
+transfer_config = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+)
+download_slots = threading.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+
+_s3_client = None
+# None until first use, False if this process can't start one
+_resize_pool = None
+_lock = threading.Lock()
+
+
+class MediaError(Exception):
+    """
+    The media URL returned an error response.
+    """
+
+
+class MediaSkipped(Exception):
+    """
+    The media was too large, not an image, or couldn't be processed.
+    """
+
+
+class MediaTooLarge(MediaSkipped):
+    pass
+
+
+def s3_client():
+    """
+    One client per process; boto3 clients are thread safe and keep a connection pool.
+    """
+    global _s3_client
+    with _lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                "s3",
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=Config(
+                    max_pool_connections=50,
+                    retries={"max_attempts": 5, "mode": "standard"},
+                ),
+            )
+        return _s3_client
+
+
+@contextmanager
+def download(url, max_bytes=MAX_MEDIA_BYTES):
+    """
+    Stream `url` to a temporary file and yield (file, content type, SHA-256).
+    Raises MediaTooLarge as soon as the response is known to be over `max_bytes`.
+    """
+    with download_slots:
+        r = ipfs_gateways.get(url, stream=True)
+        try:
+            if r.status_code >= 400:
+                raise MediaError(f"The request returned a bad status code {r}")
+
+            content_type = r.headers.get("Content-Type", "")
+            if content_type.startswith(SKIPPED_CONTENT_TYPES):
+                raise MediaSkipped(f"Not an image ({content_type}): {url}")
+            if int(r.headers.get("Content-Length") or 0) > max_bytes:
+                raise MediaTooLarge(f"Media is over {max_bytes} bytes: {url}")
+
+            file = tempfile.NamedTemporaryFile(suffix=".media")
+            sha256 = hashlib.sha256()
+            size = 0
+            for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    file.close()
+                    raise MediaTooLarge(f"Media is over {max_bytes} bytes: {url}")
+                file.write(chunk)
+                sha256.update(chunk)
+        finally:
+            r.close()
+
+    with file:
+        file.seek(0)
+        yield file, content_type, sha256.hexdigest()
+
+
+def thumbnail_variant(size, webp=False):
+    return f"thumbnail_{size}_webp" if webp else f"thumbnail_{size}"
+
+
+def resize_image(path, sizes=THUMBNAIL_SIZES):
+    """
+    Returns (format, {variant: (bytes, format)}) with a WebP and a JPEG or PNG
+    thumbnail for each size. The dict is None for formats we don't store.
+    Decoding runs in a separate process so a huge image can't take the worker down.
+    """
+    global _resize_pool
+    pool = _get_resize_pool()
+    if pool is None:
+        return _resize_image(path, sizes)
+
+    try:
+        future = pool.submit(_resize_image, path, sizes)
+    except Exception as e:
+        # e.g. running inside a daemonic worker process that can't have children
+        print(f"Resizing images in process: {e}")
+        with _lock:
+            _resize_pool = False
+        return _resize_image(path, sizes)
+
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        # The decoder was killed, most likely for using too much memory
+        with _lock:
+            _resize_pool = None
+        raise MediaSkipped(f"Resizing {path} failed: {e}")
+
+
+def upload(fileobj, key, content_type=None):
+    extra_args = {"ContentType": content_type} if content_type else None
+    # Large files go up as concurrent multipart uploads
+    s3_client().upload_fileobj(
+        fileobj,
+        settings.AWS_STORAGE_BUCKET_NAME,
+        key,
+        ExtraArgs=extra_args,
+        Config=transfer_config,
+    )
+    return f"{S3_BASE_PATH}/{key}"
+
+
+def store_image(url, sizes=THUMBNAIL_SIZES, keep_original=False):
+    """
+    Returns {variant: S3 URL} for the JPEG or PNG at `url`, with the thumbnails
+    from `resize_image` and the unmodified image if `keep_original`, or None
+    for other formats.
+
+    Media is stored under the hash of its bytes. A source that was stored before
+    is neither processed nor uploaded again, and an IPFS source isn't even
+    downloaded again.
+    """
+    variants = [
+        thumbnail_variant(size, webp) for size in sizes for webp in (False, True)
+    ]
+    if keep_original:
+        variants.append(ORIGINAL_VARIANT)
+
+    source_path = ipfs_gateways.ipfs_path(url)
+    if source_path:
+        stored = _stored_variants(variants, source_path=source_path)
+        if stored:
+            return stored
+
+    with download(url) as (file, _content_type, source_hash):
+        stored = _stored_variants(variants, source_hash=source_hash)
+        if stored:
+            return stored
+
+        format, resized = resize_image(file.name, sizes)
+        if not resized:
+            print(f"Image format: {format}, skipping")
+            return None
+
+        print(f"Image format: {format}, pulling")
+        media = []
+        for variant, (data, variant_format) in resized.items():
+            content_hash = hashlib.sha256(data).hexdigest()
+            media_url = _upload_once(
+                BytesIO(data), content_hash, *FORMATS[variant_format]
+            )
+            media.append((variant, content_hash, media_url))
+        if keep_original:
+            file.seek(0)
+            media_url = _upload_once(file, source_hash, *FORMATS[format])
+            media.append((ORIGINAL_VARIANT, source_hash, media_url))
+
+    MediaObject.objects.bulk_create(
+        [
+            MediaObject(
+                source_hash=source_hash,
+                variant=variant,
+                source_path=source_path,
+                content_hash=content_hash,
+                url=media_url,
+            )
+            for variant, content_hash, media_url in media
+        ],
+        ignore_conflicts=True,
+    )
+    return {variant: media_url for variant, _content_hash, media_url in media}
+
+
+def store_bytes(data, ext="", content_type=None):
+    """
+    Store already decoded media, e.g. from a data: URI, under its content hash.
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    media_url = _upload_once(BytesIO(data), content_hash, ext, content_type)
+    MediaObject.objects.get_or_create(
+        source_hash=content_hash,
+        variant=ORIGINAL_VARIANT,
+        defaults={"content_hash": content_hash, "url": media_url},
+    )
+    return media_url
+
+
+def _stored_variants(variants, **filters):
+    stored = {
+        media.variant: media.url
+        for media in MediaObject.objects.filter(variant__in=variants, **filters)
+    }
+    return stored if len(stored) == len(variants) else None
+
+
+def _upload_once(content, content_hash, ext, content_type):
+    media = MediaObject.objects.filter(content_hash=content_hash).first()
+    if media:
+        return media.url
+    return upload(content, f"nft_media/{content_hash}{ext}", content_type=content_type)
+
+
+def _get_resize_pool():
+    global _resize_pool
+    with _lock:
+        if _resize_pool is None and RESIZE_WORKERS > 0:
+            _resize_pool = ProcessPoolExecutor(max_workers=RESIZE_WORKERS)
+        return _resize_pool or None
+
+
+def _resize_image(path, sizes):
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    # Pillow only warns between MAX_IMAGE_PIXELS and twice that, so refuse those too
+    warnings.simplefilter("error", Image.DecompressionBombWarning)
+    with Image.open(path) as img:
+        format = img.format
+        if format not in ("JPEG", "PNG"):
+            return format, None
+        # Let the JPEG decoder downscale while decoding
+        img.draft(img.mode, (sizes[0], sizes[0]))
+        has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        # JPEG can't do transparency, so transparent images fall back to PNG
+        fallback_format = "PNG" if has_alpha else "JPEG"
+
+        resized = {}
+        for size in sizes:
+            img.thumbnail((size, size), Image.ANTIALIAS)
+            for variant_format in (fallback_format, "WEBP"):
+                output = BytesIO()
+                img.save(
+                    output,
+                    format=variant_format,
+                    optimize=True,
+                    quality=THUMBNAIL_QUALITY,
+                )
+                variant = thumbnail_variant(size, webp=variant_format == "WEBP")
+                resized[variant] = (output.getvalue(), variant_format)
+        return format, resized
@@ -0,0 +1,95 @@
+import json
+import zlib
+
+from django.utils import timezone
+
+from api.models import MetadataCacheEntry
+from api.utils.ipfs_gateways import ipfs_path
+from api.utils.metadata_fetcher import fetch_many
+
+
+def cache_key(url):
+    if path := ipfs_path(url):
+        return f"ipfs/{path}"
+    return url
+
+
+def fetch_metadata(requests, parse):
+    """
+    Fetch metadata for (key, url) pairs through the cache and return {key: metadata}.
+
+    IPFS content can't change, so cached IPFS entries are returned without a
+    request. Other URLs are revalidated with If-None-Match/If-Modified-Since and
+    only downloaded again if the server says they changed.
+    """
+    requests = list(requests)
+    keys_by_url = {url: cache_key(url) for _key, url in requests}
+    entries = {
+        e.key: e
+        for e in MetadataCacheEntry.objects.filter(key__in=set(keys_by_url.values()))
+    }
+
+    metadata = {}
+    to_fetch = []
+    for key, url in requests:
+        entry = entries.get(keys_by_url[url])
+        if entry and entry.key.startswith("ipfs/"):
+            metadata[key] = _load(entry)
+            continue
+
+        headers = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        to_fetch.append((key, url, headers))
+
+    responses = fetch_many(to_fetch) if to_fetch else {}
+    to_store = {}
+    for key, url, _headers in to_fetch:
+        response = responses.get(key)
+        if not response:
+            continue
+        entry = entries.get(keys_by_url[url])
+        if response.status == 304 and entry:
+            metadata[key] = _load(entry)
+            continue
+
+        metadata[key] = parse(response.text)
+        if not isinstance(metadata[key], dict):
+            continue
+        entry_key = keys_by_url[url]
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        # Without validators a mutable document can't be revalidated, so don't keep it
+        if entry_key.startswith("ipfs/") or etag or last_modified:
+            to_store[entry_key] = (metadata[key], etag, last_modified)
+
+    _store(to_store, entries)
+    return metadata
+
+
+def _load(entry):
+    return json.loads(zlib.decompress(entry.data))
+
+
+def _dump(metadata):
+    # default=str covers dates that YAML metadata can contain
+    data = json.dumps(metadata, separators=(",", ":"), default=str)
+    return zlib.compress(data.encode("utf-8"))
+
+
+def _store(to_store, entries):
+    to_create, to_update = [], []
+    for key, (metadata, etag, last_modified) in to_store.items():
+        entry = entries.get(key) or MetadataCacheEntry(key=key)
+        entry.data = _dump(metadata)
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.updated_at = timezone.now()
+        (to_update if entry.id else to_create).append(entry)
+
+    MetadataCacheEntry.objects.bulk_create(to_create, ignore_conflicts=True)
+    MetadataCacheEntry.objects.bulk_update(
+        to_update, ["data", "etag", "last_modified", "updated_at"]
+    )
@@ -0,0 +1,189 @@
+import asyncio
+import random
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .ipfs_gateways import MIN_HEDGE_DELAY_SECONDS, gateway_pool, ipfs_path
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_PER_HOST_CONCURRENCY = 8
+# Our dedicated gateways can take a lot more than a project's own server
+HOST_CONCURRENCY = {
+    "quixotic.mypinata.cloud": 32,
+    "quixotic.infura-ipfs.io": 32,
+}
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS = 20
+MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 10
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 522, 524}
+
+MetadataResponse = namedtuple("MetadataResponse", ["status", "text", "headers"])
+
+
+class RequestFailed(Exception):
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class MetadataFetcher:
+    """
+    Fetch many metadata documents concurrently over pooled keep-alive connections.
+
+    Requests to the same host share a semaphore so a slow project server or a
+    rate limited gateway only holds up its own requests. IPFS URLs are hedged
+    across the gateway pool. Timeouts, connection errors and retryable statuses
+    are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(
+        self,
+        concurrency=DEFAULT_CONCURRENCY,
+        per_host_concurrency=DEFAULT_PER_HOST_CONCURRENCY,
+        host_concurrency=None,
+    ):
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.host_concurrency = host_concurrency or HOST_CONCURRENCY
+        self.host_semaphores = {}
+
+    async def fetch_many(self, requests):
+        """
+        Takes (key, url) or (key, url, headers) tuples and returns
+        {key: MetadataResponse, or None if the request failed}.
+        """
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=CONNECT_TIMEOUT_SECONDS, sock_read=READ_TIMEOUT_SECONDS
+        )
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            results = await asyncio.gather(
+                *(self._fetch(session, *request[1:]) for request in requests)
+            )
+        return {request[0]: result for request, result in zip(requests, results)}
+
+    async def _fetch(self, session, url, headers=None):
+        path = ipfs_path(url)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                if path:
+                    return await self._fetch_hedged(session, path, headers)
+                return await self._fetch_once(session, url, headers)
+            except RequestFailed as e:
+                if not e.retryable or attempt == MAX_RETRIES:
+                    print(f"Metadata request failed after {attempt + 1} attempts ({e}): {url}")
+                    return None
+                # Sleep outside the semaphore so other requests to the host can go ahead
+                await asyncio.sleep(e.retry_after or _backoff(attempt))
+
+    async def _fetch_hedged(self, session, path, headers):
+        """
+        Request an IPFS path from the best gateway, and from the next best as well
+        if the first one is slower than usual. The first success wins and the other
+        requests are cancelled.
+        """
+        gateways = gateway_pool.ranked()
+        pending = set()
+        errors = []
+        try:
+            for i, gateway in enumerate(gateways):
+                pending.add(
+                    asyncio.ensure_future(
+                        self._fetch_once(
+                            session, gateway_pool.url(gateway, path), headers, gateway
+                        )
+                    )
+                )
+                is_last = i == len(gateways) - 1
+                delay = None if is_last else gateway_pool.hedge_delay(gateway)
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        break
+                    for task in done:
+                        try:
+                            return task.result()
+                        except RequestFailed as e:
+                            errors.append(e)
+                    if not is_last:
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise RequestFailed(
+            "; ".join(str(e) for e in errors),
+            retryable=any(e.retryable for e in errors),
+            retry_after=max((e.retry_after or 0 for e in errors), default=0) or None,
+        )
+
+    async def _fetch_once(self, session, url, headers=None, gateway=None):
+        async with self._semaphore(urlparse(url).netloc):
+            start = time.monotonic()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise RequestFailed(
+                            f"status {response.status}",
+                            retry_after=_retry_after(response),
+                        )
+                    if response.status >= 400:
+                        raise RequestFailed(f"status {response.status}", retryable=False)
+                    result = MetadataResponse(
+                        response.status,
+                        await response.text(errors="replace"),
+                        response.headers.copy(),
+                    )
+            except asyncio.CancelledError:
+                # A hedge loser took at least this long, unless it barely started
+                elapsed = time.monotonic() - start
+                if gateway and elapsed >= MIN_HEDGE_DELAY_SECONDS:
+                    gateway_pool.record(gateway, elapsed)
+                raise
+            except (RequestFailed, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if gateway:
+                    gateway_pool.record(gateway, time.monotonic() - start, False)
+                if isinstance(e, RequestFailed):
+                    raise
+                raise RequestFailed(repr(e)) from e
+
+        if gateway:
+            gateway_pool.record(gateway, time.monotonic() - start, True)
+        return result
+
+    def _semaphore(self, host):
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(
+                self.host_concurrency.get(host, self.per_host_concurrency)
+            )
+        return self.host_semaphores[host]
+
+
+def _backoff(attempt):
+    return random.uniform(
+        0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2**attempt)
+    )
+
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers["Retry-After"]), RETRY_MAX_DELAY_SECONDS)
+    except (KeyError, ValueError):
+        return None
+
+
+def fetch_many(requests, **kwargs):
+    """
+    Blocking wrapper around `MetadataFetcher.fetch_many` for tasks and commands.
+    """
+    return asyncio.run(MetadataFetcher(**kwargs).fetch_many(list(requests)))
@@ -1,17 +1,14 @@
 import base64
 import hashlib
 import json
-import time
 import urllib.parse
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta, timezone
-from io import BytesIO
 from pathlib import Path
-import boto3
 import requests
 from web3 import Web3
 import yaml
-from PIL import Image
-from django.conf import settings
+from django.db import transaction
 
 from api.models import (
     CollectionAnimationType,
@@ -22,8 +19,10 @@ from api.models import (
 )
 from api.utils.Erc1155Contract import Erc1155Contract
 from api.utils.Erc721Contract import Erc721Contract
+from api.utils import ipfs_gateways, media_pipeline
 from api.utils.constants import NETWORK
 from api.utils.eip681_utils import parse_eip681_uri
+from api.utils.metadata_cache import fetch_metadata
 from api.utils.text_utils import fix_smart_quotes, replace_links_with_markdown_links
 
 
@@ -48,9 +47,7 @@ def pull_collection_metadata(collection):
     ipfs_prefix = "ipfs://"
     if metadata_uri.startswith(ipfs_prefix):
         try:
-            r = requests.get(
-                f"https://quixotic.mypinata.cloud/ipfs/{metadata_uri[len(ipfs_prefix):]}"
-            )
+            r = ipfs_gateways.get(metadata_uri)
             metadata_str = r.text
             metadata = json.loads(metadata_str)
         except Exception:
@@ -63,7 +60,7 @@ def pull_collection_metadata(collection):
             metadata = {}
     else:
         try:
-            r = requests.get(metadata_uri)
+            r = ipfs_gateways.get(metadata_uri)
             metadata = json.loads(r.text)
         except Exception:
             return None
@@ -72,14 +69,7 @@ def pull_collection_metadata(collection):
 
 
 def pull_contract_image(collection, image_url, should_save=True):
-    client = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
-
-    base_path = "https://fanbase-1.s3.amazonaws.com"
-    ts = round(time.time())
+    base_path = media_pipeline.S3_BASE_PATH
 
     image_url_hash = hashlib.md5(image_url.encode("utf-8")).hexdigest()
 
@@ -88,6 +78,7 @@ def pull_contract_image(collection, image_url, should_save=True):
         and collection.profile_image_hash
         and collection.profile_image_hash == image_url_hash
         and collection.profile_image_url.startswith(base_path)
+        and (collection.profile_image_variants or image_url.startswith("data:"))
     ):
         print("Image url didn't change, so not pulling.")
     else:
@@ -97,15 +88,10 @@ def pull_contract_image(collection, image_url, should_save=True):
                 header, data = image_url.split(";base64,")
             try:
                 decoded_file = base64.b64decode(data)
-                file_name = "image"
-                aws_key = f"collection_image/{collection.address}/{ts}/{file_name}"
-                client.upload_fileobj(
-                    BytesIO(decoded_file),
-                    settings.AWS_STORAGE_BUCKET_NAME,
-                    aws_key,
-                    ExtraArgs={"ContentType": header.split("data:")[1]},
+                collection.profile_image_url = media_pipeline.store_bytes(
+                    decoded_file, content_type=header.split("data:")[1]
                 )
-                collection.profile_image_url = f"{base_path}/{aws_key}"
+                collection.profile_image_variants = None
                 collection.profile_image_hash = image_url_hash
             except TypeError:
                 TypeError("invalid_image")
@@ -116,40 +102,20 @@ def pull_contract_image(collection, image_url, should_save=True):
                 )
 
             try:
-                r = requests.get(image_url, stream=True)
-            except Exception:
+                variants = media_pipeline.store_image(image_url, keep_original=True)
+            except media_pipeline.MediaError as e:
+                return print(e)
+            except requests.RequestException:
                 return print(f"Invalid URL: {image_url}")
-
-            if r.status_code >= 400:
-                return print(f"The request returned a bad status code {r}")
-
-            try:
-                img_content = BytesIO(r.content)
-                img = Image.open(img_content)
-                format = img.format
-                if format == "JPEG" or format == "PNG":
-                    print(f"Image format: {format}, pulling")
-                    img_content = BytesIO()
-                    img.thumbnail((1000, 1000), Image.ANTIALIAS)
-                    img.save(img_content, format=format, optimize=True, quality=75)
-                    img_content.seek(0)
-
-                    # file_name = urllib.parse.quote(Path(image_url).name)
-                    if format == "JPEG":
-                        file_name = "image.jpg"
-                    elif format == "PNG":
-                        file_name = "image.png"
-                    aws_key = f"collection_image/{collection.address}/{ts}/{file_name}"
-                    client.upload_fileobj(
-                        BytesIO(r.content), settings.AWS_STORAGE_BUCKET_NAME, aws_key
-                    )
-                    collection.profile_image_url = f"{base_path}/{aws_key}"
-                    collection.profile_image_hash = image_url_hash
-                else:
-                    print(f"Image format: {format}, skipping")
-            except Exception as e:
+            except Exception:
                 collection.profile_image_url = image_url
                 collection.profile_image_hash = image_url_hash
+            else:
+                if variants:
+                    original = variants.pop(media_pipeline.ORIGINAL_VARIANT)
+                    collection.profile_image_url = original
+                    collection.profile_image_hash = image_url_hash
+                    collection.profile_image_variants = variants
 
     if should_save:
         collection.save()
@@ -239,36 +205,36 @@ def refresh_collection_animation_url_type(collection, should_save=True):
             collection.save()
 
 
-def pull_token_metadata(token):
-    if token.smart_contract.type == CollectionType.ERC721:
-        contract = Erc721Contract(
-            token.smart_contract.address,
-            token.smart_contract.network.network_id,
-        )
-    elif token.smart_contract.type == CollectionType.ERC1155:
-        contract = Erc1155Contract(
-            token.smart_contract.address,
-            token.smart_contract.network.network_id,
-        )
-    else:
-        return
-
-    try:
-        metadata_uri = contract.token_uri(token.token_id)
-    except Exception as e:
-        print(e)
-        try:
-            metadata_uri = contract.base_uri() + f"/{token.token_id}"
-        except Exception as e:
-            print(e)
+def resolve_token_metadata_uri(token, metadata_uri=None):
+    """
+    Returns the token's metadata URI, following bridged (EIP-681) redirects.
+    Pass `metadata_uri` when the tokenURI was already read in a batch.
+    """
+    if not metadata_uri:
+        if token.smart_contract.type == CollectionType.ERC721:
+            contract = Erc721Contract(
+                token.smart_contract.address,
+                token.smart_contract.network.network_id,
+            )
+        elif token.smart_contract.type == CollectionType.ERC1155:
+            contract = Erc1155Contract(
+                token.smart_contract.address,
+                token.smart_contract.network.network_id,
+            )
+        else:
             return
 
-    if not metadata_uri:
         try:
-            metadata_uri = contract.base_uri() + f"/{token.token_id}"
+            metadata_uri = contract.token_uri(token.token_id)
         except Exception as e:
             print(e)
-            return
+
+        if not metadata_uri:
+            try:
+                metadata_uri = contract.base_uri() + f"/{token.token_id}"
+            except Exception as e:
+                print(e)
+                return
 
     # Get native metadata URI if bridged NFT
     if metadata_uri.startswith("ethereum:"):
@@ -300,73 +266,139 @@ def pull_token_metadata(token):
             "{id}", str(hex(int(token.token_id))[2:].zfill(64))
         )
 
-    metadata_uri = metadata_uri.replace(" ", "")
+    return metadata_uri.replace(" ", "")
+
+
+def metadata_request_url(token, metadata_uri):
+    """
+    Returns the URL to fetch for `metadata_uri`, or None if the metadata is inline.
+    """
     ipfs_prefix = "ipfs://"
     if metadata_uri.startswith(ipfs_prefix):
-        try:
-            if token.smart_contract.network.network_id != NETWORK:
-                r = requests.get(
-                    f"https://quixotic.infura-ipfs.io/ipfs/{metadata_uri[len(ipfs_prefix):]}"
-                )
-            else:
-                r = requests.get(
-                    f"https://quixotic.mypinata.cloud/ipfs/{metadata_uri[len(ipfs_prefix):]}"
-                )
-            metadata = json.loads(r.text, strict=False)
-        except Exception as e:
-            print(e)
-            if str(e).startswith("Expecting property name enclosed in double quotes"):
-                try:
-                    metadata = yaml.safe_load(r.text)
-                except Exception as e:
-                    print(e)
-                    return None
-            else:
-                return None
+        if token.smart_contract.network.network_id != NETWORK:
+            return f"https://quixotic.infura-ipfs.io/ipfs/{metadata_uri[len(ipfs_prefix):]}"
+        return f"https://quixotic.mypinata.cloud/ipfs/{metadata_uri[len(ipfs_prefix):]}"
     elif metadata_uri.startswith("https://") or metadata_uri.startswith("http://"):
-        try:
-            if metadata_uri.startswith("https://gateway.pinata.cloud/"):
-                metadata_uri = metadata_uri.replace(
-                    "https://gateway.pinata.cloud/", "https://quixotic.infura-ipfs.io/"
-                )
-            elif metadata_uri.startswith("https://ipfs.infura.io/"):
-                metadata_uri = metadata_uri.replace(
-                    "https://ipfs.infura.io/", "https://quixotic.infura-ipfs.io/"
-                )
-            elif metadata_uri.startswith("https://ipfs.io/"):
-                metadata_uri = metadata_uri.replace(
-                    "https://ipfs.io/", "https://quixotic.infura-ipfs.io/"
-                )
-            r = requests.get(metadata_uri)
-            metadata = json.loads(r.text, strict=False)
-        except Exception as e:
-            print(e)
-            if str(e).startswith("Expecting property name enclosed in double quotes"):
-                try:
-                    metadata = yaml.safe_load(r.text)
-                except Exception as e:
-                    print(e)
-                    return None
-            else:
-                return None
-    elif metadata_uri.startswith("data:application/json;base64"):
+        if metadata_uri.startswith("https://gateway.pinata.cloud/"):
+            metadata_uri = metadata_uri.replace(
+                "https://gateway.pinata.cloud/", "https://quixotic.infura-ipfs.io/"
+            )
+        elif metadata_uri.startswith("https://ipfs.infura.io/"):
+            metadata_uri = metadata_uri.replace(
+                "https://ipfs.infura.io/", "https://quixotic.infura-ipfs.io/"
+            )
+        elif metadata_uri.startswith("https://ipfs.io/"):
+            metadata_uri = metadata_uri.replace(
+                "https://ipfs.io/", "https://quixotic.infura-ipfs.io/"
+            )
+        return metadata_uri
+    return None
+
+
+def parse_metadata(text):
+    try:
+        return json.loads(text, strict=False)
+    except Exception as e:
+        print(e)
+        if str(e).startswith("Expecting property name enclosed in double quotes"):
+            try:
+                return yaml.safe_load(text)
+            except Exception as e:
+                print(e)
+        return None
+
+
+def parse_inline_metadata(metadata_uri):
+    if metadata_uri.startswith("data:application/json;base64"):
         try:
             prefix, msg = metadata_uri.split(",", 1)
-            metadata = json.loads(base64.b64decode(msg), strict=False)
+            return json.loads(base64.b64decode(msg), strict=False)
         except Exception as e:
             print(e)
             return None
     else:
         try:
-            metadata = json.loads(metadata_uri, strict=False)
+            return json.loads(metadata_uri, strict=False)
         except Exception:
             return None
 
+
+def pull_token_metadata(token):
+    metadata_uri = resolve_token_metadata_uri(token)
+    if not metadata_uri:
+        return
+
+    url = metadata_request_url(token, metadata_uri)
+    if not url:
+        return parse_inline_metadata(metadata_uri)
+
+    return fetch_metadata([(token.id, url)], parse_metadata).get(token.id)
+
+
+def pull_tokens_metadata(tokens):
+    """
+    Returns {token id: metadata} for many tokens at once. tokenURIs are read with
+    multicall and the documents are fetched concurrently through the metadata cache.
+    """
+    tokens_by_contract = defaultdict(list)
+    for token in tokens:
+        tokens_by_contract[token.smart_contract].append(token)
+
+    metadata = {}
+    requests_to_fetch = []
+    for smart_contract, contract_tokens in tokens_by_contract.items():
+        if smart_contract.type == CollectionType.ERC721:
+            contract = Erc721Contract(
+                smart_contract.address, smart_contract.network.network_id
+            )
+        elif smart_contract.type == CollectionType.ERC1155:
+            contract = Erc1155Contract(
+                smart_contract.address, smart_contract.network.network_id
+            )
+        else:
+            continue
+
+        token_uris = contract.token_uri_batch([t.token_id for t in contract_tokens])
+        for token in contract_tokens:
+            metadata_uri = resolve_token_metadata_uri(
+                token, token_uris.get(token.token_id)
+            )
+            if not metadata_uri:
+                continue
+            if url := metadata_request_url(token, metadata_uri):
+                requests_to_fetch.append((token.id, url))
+            else:
+                metadata[token.id] = parse_inline_metadata(metadata_uri)
+
+    metadata.update(fetch_metadata(requests_to_fetch, parse_metadata))
     return metadata
 
 
-def refresh_token_metadata(token, should_save=True):
-    metadata = pull_token_metadata(token)
+def refresh_tokens_metadata(tokens, should_save=True):
+    tokens = list(tokens)
+    metadata = pull_tokens_metadata(tokens)
+    attribute_updates = {}
+    for token in tokens:
+        if token.id in metadata:
+            refresh_token_metadata(
+                token,
+                should_save=should_save,
+                metadata=metadata[token.id],
+                attribute_updates=attribute_updates,
+            )
+    # One transaction for the whole batch instead of one per token
+    write_token_attributes(attribute_updates)
+
+
+def refresh_token_metadata(
+    token, should_save=True, metadata=None, attribute_updates=None
+):
+    """
+    Pass an `attribute_updates` dict to collect attribute changes for
+    `write_token_attributes` instead of writing them immediately.
+    """
+    if metadata is None:
+        metadata = pull_token_metadata(token)
     if not metadata:
         return
 
@@ -474,26 +506,98 @@ def refresh_token_metadata(token, should_save=True):
             token.save()
 
         if attributes := metadata.get("attributes"):
-            Erc721TokenAttribute.objects.filter(token=token).delete()
-            for attribute in attributes:
-                try:
-                    if trait_type := attribute.get("trait_type"):
-                        trait_type = fix_smart_quotes(trait_type)
-                    if value := attribute.get("value"):
-                        value = fix_smart_quotes(value)
-                    else:
-                        value = ""
-                    if trait_type:
-                        Erc721TokenAttribute.objects.create(
-                            token=token, trait_type=trait_type, value=value
-                        )
-                except Exception as e:
-                    continue
+            metadata_hash = hash_metadata(metadata)
+            if metadata_hash != token.metadata_hash:
+                updates = {token: (parse_attributes(attributes), metadata_hash)}
+                if attribute_updates is None:
+                    write_token_attributes(updates)
+                else:
+                    attribute_updates.update(updates)
     except Exception as e:
         print(e)
         return
 
 
+def hash_metadata(metadata):
+    data = json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.md5(data.encode("utf-8")).hexdigest()
+
+
+def parse_attributes(attributes):
+    parsed = []
+    for attribute in attributes:
+        try:
+            if trait_type := attribute.get("trait_type"):
+                trait_type = fix_smart_quotes(trait_type)
+            if value := attribute.get("value"):
+                value = fix_smart_quotes(value)
+            else:
+                value = ""
+            if trait_type:
+                # Postgres rejects NUL in text columns
+                parsed.append(
+                    (
+                        str(trait_type).replace("\x00", ""),
+                        str(value).replace("\x00", ""),
+                    )
+                )
+        except Exception as e:
+            continue
+    return parsed
+
+
+def write_token_attributes(attribute_updates):
+    """
+    Takes {token: (attributes, metadata hash)} and applies only the difference
+    from the stored rows: one delete for removed attributes and one bulk_create
+    for new ones, for all tokens together. If the batch write fails, each token
+    is written on its own so one bad token doesn't hold back the others.
+    """
+    if not attribute_updates:
+        return
+
+    try:
+        _write_token_attributes(attribute_updates)
+    except Exception as e:
+        print(f"Writing attributes in bulk failed, writing them per token: {e}")
+        for token, update in attribute_updates.items():
+            try:
+                _write_token_attributes({token: update})
+            except Exception as e:
+                print(f"Failed to write attributes for {token}: {e}")
+
+
+def _write_token_attributes(attribute_updates):
+    tokens_by_id = {token.id: token for token in attribute_updates}
+    existing = defaultdict(list)
+    for attribute_id, token_id, trait_type, value in Erc721TokenAttribute.objects.filter(
+        token_id__in=tokens_by_id.keys()
+    ).values_list("id", "token_id", "trait_type", "value"):
+        existing[token_id].append((attribute_id, (trait_type, value)))
+
+    to_delete, to_create = [], []
+    for token, (attributes, _metadata_hash) in attribute_updates.items():
+        wanted = Counter(attributes)
+        for attribute_id, attribute in existing[token.id]:
+            if wanted[attribute] > 0:
+                wanted[attribute] -= 1
+            else:
+                to_delete.append(attribute_id)
+        to_create += [
+            Erc721TokenAttribute(token=token, trait_type=trait_type, value=value)
+            for (trait_type, value), count in wanted.items()
+            for _ in range(count)
+        ]
+
+    with transaction.atomic():
+        if to_delete:
+            Erc721TokenAttribute.objects.filter(id__in=to_delete).delete()
+        Erc721TokenAttribute.objects.bulk_create(to_create)
+        for token, (_attributes, metadata_hash) in attribute_updates.items():
+            token.metadata_hash = metadata_hash
+        Erc721Token.objects.bulk_update(attribute_updates.keys(), ["metadata_hash"])
+
+
 def pull_token_media(token, metadata=None, use_existing=False, override_cooldown=False):
     # Emergency fix for AWS errors
     emergency_exclusions = {
@@ -535,14 +639,7 @@ def pull_token_media(token, metadata=None, use_existing=False, override_cooldown
         print(f"No media to pull for {token}")
         return
 
-    client = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
-
-    base_path = "https://fanbase-1.s3.amazonaws.com"
-    ts = round(time.time())
+    base_path = media_pipeline.S3_BASE_PATH
 
     if image_url and (
         image_url.startswith("data:")
@@ -573,6 +670,7 @@ def pull_token_media(token, metadata=None, use_existing=False, override_cooldown
             and token.image_src == image_url_hash
             and token.image
             and token.image.startswith(base_path)
+            and (token.image_variants or image_url.startswith("data:"))
         ):
             print("Image url didn't change, so not pulling.")
             return
@@ -584,62 +682,38 @@ def pull_token_media(token, metadata=None, use_existing=False, override_cooldown
                 header, data = image_url.split(";base64,")
             try:
                 decoded_file = base64.b64decode(data)
-                file_name = "image"
                 file_extension = ".svg" if data[0] == "P" else ""
-                file_name += file_extension
-                aws_key = f"nft_image/{token.smart_contract.address}/{token.token_id}/{ts}/{file_name}"
-                client.upload_fileobj(
-                    BytesIO(decoded_file),
-                    settings.AWS_STORAGE_BUCKET_NAME,
-                    aws_key,
-                    ExtraArgs={"ContentType": header.split("data:")[1]},
+                # Generative collections often share artwork, so store by content hash
+                token.image = media_pipeline.store_bytes(
+                    decoded_file,
+                    ext=file_extension,
+                    content_type=header.split("data:")[1],
                 )
-                token.image = f"{base_path}/{aws_key}"
                 token.image_src = image_url_hash
+                token.image_variants = None
             except Exception as e:
                 print(e)
                 print(f"Invalid URL: {image_url}")
                 return
         else:
+            # Compress & store file if png or jpg image
             try:
-                r = requests.get(image_url)
-            except Exception:
+                variants = media_pipeline.store_image(image_url)
+            except media_pipeline.MediaError as e:
+                print(e)
+                return
+            except requests.RequestException:
                 print(f"Invalid URL: {image_url}")
                 token.image = None
                 token.save()
                 return
-
-            if r.status_code >= 400:
-                print(f"The request returned a bad status code {r}")
-                return
-
-            # Compress & store file if png or jpg image
-            try:
-                img_content = BytesIO(r.content)
-                img = Image.open(img_content)
-                format = img.format
-                if format == "JPEG" or format == "PNG":
-                    print(f"Image format: {format}, pulling")
-                    img_content = BytesIO()
-                    img.thumbnail((1000, 1000), Image.ANTIALIAS)
-                    img.save(img_content, format=format, optimize=True, quality=75)
-                    img_content.seek(0)
-
-                    # file_name = urllib.parse.quote(Path(image_url).name)
-                    if format == "JPEG":
-                        file_name = "image.jpg"
-                    elif format == "PNG":
-                        file_name = "image.png"
-                    aws_key = f"nft_image/{token.smart_contract.address}/{token.token_id}/{ts}/{file_name}"
-                    client.upload_fileobj(
-                        img_content, settings.AWS_STORAGE_BUCKET_NAME, aws_key
-                    )
-                    token.image = f"{base_path}/{aws_key}"
-                    token.image_src = image_url_hash
-                else:
-                    print(f"Image format: {format}, skipping")
             except Exception as e:
                 print(e)
+            else:
+                if variants:
+                    token.image = variants[media_pipeline.thumbnail_variant(1000)]
+                    token.image_src = image_url_hash
+                    token.image_variants = variants
 
     if animation_url and (
         animation_url.startswith("data:")
@@ -647,7 +721,8 @@ def pull_token_media(token, metadata=None, use_existing=False, override_cooldown
         or animation_url.startswith("http:")
         or animation_url.startswith("https:")
     ):
-        if animation_url.startswith("ipfs://"):
+        is_ipfs = animation_url.startswith("ipfs://")
+        if is_ipfs:
             animation_url = (
                 "https://quixotic.infura-ipfs.io/ipfs/"
                 + animation_url[len("ipfs://") :]
@@ -674,51 +749,25 @@ def pull_token_media(token, metadata=None, use_existing=False, override_cooldown
             print("Animation url didn't change, so not pulling.")
             return
 
-        if animation_url.startswith("ipfs://"):
-            try:
-                r = requests.get(
-                    f"https://quixotic.infura-ipfs.io/ipfs/{animation_url[len('ipfs://'):]}"
-                )
-            except Exception:
-                print(f"Invalid URL: {animation_url}")
-                return
-        else:
-            try:
-                r = requests.get(animation_url)
-            except Exception:
-                print(f"Invalid URL: {animation_url}")
+        # Compress & store file if png or jpg image
+        try:
+            variants = media_pipeline.store_image(animation_url, sizes=(1000,))
+        except media_pipeline.MediaError as e:
+            print(e)
+            return
+        except requests.RequestException:
+            print(f"Invalid URL: {animation_url}")
+            # IPFS gateways time out often, so keep the url for the next pull
+            if not is_ipfs:
                 token.animation_url = None
                 token.save()
-                return
-
-        if r.status_code >= 400:
-            print(f"The request returned a bad status code {r}")
             return
-
-        # Compress & store file if png or jpg image
-        try:
-            img_content = BytesIO(r.content)
-            img = Image.open(img_content)
-            format = img.format
-            if format == "JPEG" or format == "PNG":
-                img_content = BytesIO()
-                img.thumbnail((1000, 1000), Image.ANTIALIAS)
-                img.save(img_content, format=format, optimize=True, quality=75)
-                img_content.seek(0)
-
-                # file_name = urllib.parse.quote(Path(animation_url).name)
-                if format == "JPEG":
-                    file_name = "image.jpg"
-                elif format == "PNG":
-                    file_name = "image.png"
-                aws_key = f"nft_animation/{token.smart_contract.address}/{token.token_id}/{ts}/{file_name}"
-                client.upload_fileobj(
-                    img_content, settings.AWS_STORAGE_BUCKET_NAME, aws_key
-                )
-                token.animation_url = f"{base_path}/{aws_key}"
-                token.animation_url_src = animation_url_hash
         except Exception as e:
             print(e)
+        else:
+            if variants:
+                token.animation_url = variants[media_pipeline.thumbnail_variant(1000)]
+                token.animation_url_src = animation_url_hash
 
         # file_name = Path(animation_url).name
         # aws_key = f"nft_image/{token.smart_contract.address}/{token.token_id}/{ts}/{file_name}"
@@ -0,0 +1,82 @@
+import json
+
+import requests
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+from ..abis.multicall3_abi import multicall3_abi
+
+# Multicall3 is deployed at the same address on every chain we use
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+DEFAULT_BATCH_SIZE = 300
+
+
+def batch_call(w3, calls, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Run many contract view calls, e.g. `contract.functions.ownerOf(1)`, in as
+    few requests as possible.
+
+    Calls are packed into Multicall3 `aggregate3`, falling back to a JSON-RPC
+    batch of eth_calls if the multicall itself fails. Returns a
+    `(success, value)` tuple per call, in order; value is None on failure.
+    success is False if the call reverted and None if it couldn't be read,
+    e.g. a missing response or undecodable return data.
+    """
+    results = []
+    for i in range(0, len(calls), batch_size):
+        chunk = calls[i : i + batch_size]
+        try:
+            results += _aggregate3(w3, chunk)
+        except Exception as e:
+            print(f"Multicall failed, falling back to JSON-RPC batch: {e}")
+            results += _json_rpc_batch(w3, chunk)
+    return results
+
+
+def _aggregate3(w3, calls):
+    multicall = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=multicall3_abi)
+    encoded = [(call.address, True, call._encode_transaction_data()) for call in calls]
+    responses = multicall.functions.aggregate3(encoded).call()
+    return [
+        _decode(w3, call, return_data) if success else (False, None)
+        for call, (success, return_data) in zip(calls, responses)
+    ]
+
+
+def _json_rpc_batch(w3, calls):
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "eth_call",
+            "params": [
+                {"to": call.address, "data": call._encode_transaction_data()},
+                "latest",
+            ],
+        }
+        for i, call in enumerate(calls)
+    ]
+    r = requests.post(w3.provider.endpoint_uri, json=payload, timeout=30)
+    responses = {response["id"]: response for response in json.loads(r.text)}
+
+    results = []
+    for i, call in enumerate(calls):
+        response = responses.get(i, {})
+        if "result" in response and response["result"] not in ("0x", None):
+            results.append(_decode(w3, call, bytes.fromhex(response["result"][2:])))
+        elif "revert" in str(response.get("error", {}).get("message", "")):
+            results.append((False, None))
+        else:
+            results.append((None, None))
+    return results
+
+
+def _decode(w3, call, return_data):
+    output_types = get_abi_output_types(call.abi)
+    try:
+        decoded = w3.codec.decode_abi(output_types, return_data)
+    except Exception:
+        # Non-conforming contracts return data we can't decode
+        return None, None
+    decoded = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+    return True, decoded[0] if len(decoded) == 1 else decoded
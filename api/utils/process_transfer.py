@@ -22,6 +22,7 @@ from .ExchangeContract import (
     rewards_wrapper_contract,
 )
 from .hex_utils import to_checksum_address_from_bytes
+from .txn_cache import txn_cache
 
 ERC_721_SAFE_TRANSFER_TOPIC = (
     "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
@@ -30,6 +31,8 @@ OP_TOKEN_ADDRESS = "0x4200000000000000000000000000000000000042"
 
 
 def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
+    from .sales import record_sale
+
     trade_txn_id = trade_txn["hash"].hex()
     assert (
         trade_txn["to"] in exchange_addresses
@@ -70,11 +73,14 @@ def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
                 order = models.Erc721SellOrder.objects.select_for_update().get(
                     id=sell_order.id
                 )
+                was_fulfilled = order.fulfilled
                 order.fulfilled = True
                 order.txn_id = trade_txn_id
                 order.time_sold = timestamp
                 order.buyer = buyer_profile
                 order.save()
+                if not was_fulfilled:
+                    record_sale(order)
 
                 onchain_activity.sell_order = order
         except Exception as e:
@@ -91,11 +97,14 @@ def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
                     order = models.Erc721BuyOrder.objects.select_for_update().get(
                         id=buy_order.id
                     )
+                    was_fulfilled = order.fulfilled
                     order.fulfilled = True
                     order.txn_id = trade_txn_id
                     order.time_sold = timestamp
                     order.seller = seller_profile
                     order.save()
+                    if not was_fulfilled:
+                        record_sale(order)
 
                     onchain_activity.buy_order = order
             except Exception as e:
@@ -136,12 +145,15 @@ def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
                                 id=dutch_auction.id
                             )
                         )
-                        order.price = round(current_price, 5)
+                        was_fulfilled = order.fulfilled
+                        order.price = round(current_price)
                         order.fulfilled = True
                         order.txn_id = trade_txn_id
                         order.time_sold = timestamp
                         order.buyer = buyer_profile
                         order.save()
+                        if not was_fulfilled:
+                            record_sale(order)
 
                         onchain_activity.dutch_auction = order
                 except Exception as e:
@@ -160,7 +172,7 @@ def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
         if onchain_activity.to_profile == buyer_profile:
             return onchain_activity
 
-        txn_receipt = w3.eth.get_transaction_receipt(trade_txn_id)
+        txn_receipt = txn_cache.get_transaction_receipt(w3, trade_txn_id)
         for log in txn_receipt["logs"]:
             if (
                 log["topics"][0].hex()
@@ -172,11 +184,14 @@ def process_fulfilled_order(trade_txn, onchain_activity, timestamp, w3):
                         message_hash=message_hash
                     )
                     if sell_order.token == onchain_activity.token:
+                        was_fulfilled = sell_order.fulfilled
                         sell_order.fulfilled = True
                         sell_order.txn_id = trade_txn_id
                         sell_order.time_sold = timestamp
                         sell_order.buyer = buyer_profile
                         sell_order.save()
+                        if not was_fulfilled:
+                            record_sale(sell_order)
                         onchain_activity.sell_order = sell_order
                         onchain_activity.save()
                 except models.Erc721SellOrder.DoesNotExist:
@@ -216,7 +231,7 @@ def handle_transfer_event(transfer_event, network=NETWORK):
     )
 
     if from_address == REWARD_WRAPPER_ADDRESS:
-        txn_receipt = w3.eth.get_transaction_receipt(transfer_txn_id)
+        txn_receipt = txn_cache.get_transaction_receipt(w3, transfer_txn_id)
         for log in txn_receipt["logs"]:
             if (
                 log["topics"][0].hex() == ERC_721_SAFE_TRANSFER_TOPIC
@@ -299,7 +314,7 @@ def handle_transfer_event(transfer_event, network=NETWORK):
                 tok.pending_owner = None
                 tok.save()
 
-    full_txn = w3.eth.get_transaction(transfer_txn_id)
+    full_txn = txn_cache.get_transaction(w3, transfer_txn_id)
 
     try:
         timestamp = datetime.fromtimestamp(
@@ -307,11 +322,19 @@ def handle_transfer_event(transfer_event, network=NETWORK):
         )
     except Exception:
         timestamp = datetime.fromtimestamp(
-            w3.eth.getBlock(full_txn["blockNumber"]).timestamp, timezone.utc
+            txn_cache.get_block_timestamp(w3, full_txn["blockNumber"]), timezone.utc
         )
 
     if token.smart_contract.type == models.CollectionType.ERC1155:
-        token.refresh_owner(from_profile=from_profile, to_profile=to_profile)
+        token.apply_erc1155_transfer(
+            from_profile,
+            to_profile,
+            quantity,
+            transfer_txn_id,
+            log_index=transfer_event["logIndex"],
+            batch_index=transfer_event.get("batchIndex", 0),
+            block_number=transfer_event["blockNumber"],
+        )
         token.soft_refresh_orders(from_profile=from_profile, to_profile=to_profile)
     else:
         with transaction.atomic():
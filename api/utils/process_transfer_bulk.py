@@ -0,0 +1,636 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from web3 import Web3
+
+from .. import models
+from .collection_stats import mark_stats_dirty, refresh_holders
+from .constants import ALCHEMY_API_KEY, NETWORK, REWARD_WRAPPER_ADDRESS
+from .constants import w3 as primary_w3
+from .ExchangeContract import exchange_addresses
+from .hex_utils import to_checksum_address_from_bytes
+from .process_transfer_ws import (
+    ERC_721_SAFE_TRANSFER_TOPIC,
+    ERC_1155_SAFE_TRANSFER_TOPIC,
+    handle_transfer_event,
+)
+from .txn_cache import txn_cache
+
+DEFAULT_CHUNK_SIZE = 1000
+TXN_FETCH_WORKERS = 16
+METADATA_BATCH_SIZE = 50
+OWNER_CHECK_BATCH_SIZE = 500
+L1_NETWORK_IDS = ("eth-mainnet", "eth-goerli")
+
+
+def handle_transfer_events_bulk(
+    transfer_events, network=NETWORK, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """
+    Ingest many raw transfer logs at once, e.g. a block range from a backfill.
+
+    Plain transfers and mints are written with a handful of IN queries and
+    bulk writes in one transaction per chunk. Sales, bridge transfers, reward
+    wrapper transfers, batch transfers and unknown contracts fall back to
+    `handle_transfer_event`, which handles their side effects one by one.
+    """
+    transfer_events = sorted(transfer_events, key=_log_position)
+    num_bulk = 0
+    for i in range(0, len(transfer_events), chunk_size):
+        num_bulk += _handle_chunk(transfer_events[i : i + chunk_size], network)
+    print(f"Bulk processed {num_bulk} of {len(transfer_events)} transfer events")
+    return num_bulk
+
+
+def _handle_chunk(transfer_events, network):
+    w3 = _get_w3(network)
+
+    addresses = {Web3.toChecksumAddress(e["address"]) for e in transfer_events}
+    contracts = {
+        c.address: c
+        for c in models.Contract.objects.filter(
+            address__in=addresses,
+            network__network_id=network,
+            collection__approved=True,
+        ).select_related("collection", "network")
+    }
+
+    fallback_events = []
+    transfers = []
+    for transfer_event in transfer_events:
+        transfer = _parse_transfer(transfer_event)
+        smart_contract = contracts.get(Web3.toChecksumAddress(transfer_event["address"]))
+        if (
+            not transfer
+            or not smart_contract
+            or smart_contract.is_bridged
+            or smart_contract.network.network_id in L1_NETWORK_IDS
+            or REWARD_WRAPPER_ADDRESS in (transfer["from"], transfer["to"])
+        ):
+            fallback_events.append(transfer_event)
+            continue
+        transfer["contract"] = smart_contract
+        transfer["event"] = transfer_event
+        transfers.append(transfer)
+
+    full_txns = _get_transactions(w3, {t["txn_id"] for t in transfers})
+    bulk_transfers = []
+    for transfer in transfers:
+        full_txn = full_txns.get(transfer["txn_id"])
+        if not full_txn or (
+            network == NETWORK
+            and full_txn.get("to")
+            and Web3.toChecksumAddress(full_txn["to"]) in exchange_addresses
+        ):
+            fallback_events.append(transfer["event"])
+            continue
+        transfer["txn"] = full_txn
+        transfer["timestamp"] = _get_timestamp(w3, full_txn)
+        bulk_transfers.append(transfer)
+
+    if bulk_transfers:
+        tokens, pulled_token_ids = _get_tokens(bulk_transfers)
+        with transaction.atomic():
+            profiles = _get_profiles(bulk_transfers)
+            _create_activities(bulk_transfers, tokens, profiles)
+            _update_erc721_owners(bulk_transfers, tokens, profiles)
+            _update_erc1155_owners(
+                bulk_transfers, tokens, profiles, skip_token_ids=pulled_token_ids
+            )
+        _refresh_orders(tokens.values())
+
+    for transfer_event in fallback_events:
+        handle_transfer_event(transfer_event, network=network)
+
+    return len(bulk_transfers)
+
+
+def discover_minted_tokens(smart_contract, mint_events, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create every token minted by `mint_events` that isn't in the database yet.
+
+    Decoded mint events from `Erc721Contract`/`Erc1155Contract` are enough to
+    write the tokens, their owners and their mint activities in bulk, so new
+    collections show up without a per-token RPC. Metadata and current owners
+    are fetched afterwards in batches on the refresh_token queue.
+    """
+    w3 = _get_w3(smart_contract.network.network_id)
+    known_token_ids = set(
+        models.Erc721Token.objects.filter(smart_contract=smart_contract).values_list(
+            "token_id", flat=True
+        )
+    )
+
+    discovered_token_ids = set()
+    transfers = []
+    for event in mint_events:
+        transfer = _parse_decoded_transfer(event)
+        if transfer["token_id"] in known_token_ids:
+            continue
+        transfer["contract"] = smart_contract
+        transfers.append(transfer)
+        if len(transfers) >= chunk_size:
+            _discover_chunk(w3, smart_contract, transfers, discovered_token_ids)
+            transfers = []
+    if transfers:
+        _discover_chunk(w3, smart_contract, transfers, discovered_token_ids)
+
+    print(f"Discovered {len(discovered_token_ids)} new tokens for {smart_contract}")
+    return len(discovered_token_ids)
+
+
+def _discover_chunk(w3, smart_contract, transfers, discovered_token_ids):
+    full_txns = _get_transactions(w3, {t["txn_id"] for t in transfers})
+    timestamps = _get_block_timestamps(w3, {t["position"][0] for t in transfers})
+    for transfer in transfers:
+        transfer["txn"] = full_txns.get(transfer["txn_id"]) or {"from": None}
+        transfer["timestamp"] = timestamps[transfer["position"][0]]
+
+    # An 1155 id can be minted again in a later chunk, so look up all of them
+    token_ids = {t["token_id"] for t in transfers}
+    with transaction.atomic():
+        models.Erc721Token.objects.bulk_create(
+            [
+                models.Erc721Token(
+                    smart_contract=smart_contract,
+                    collection=smart_contract.collection,
+                    token_id=token_id,
+                    name=_default_token_name(smart_contract.collection, token_id),
+                )
+                for token_id in token_ids - discovered_token_ids
+            ],
+            ignore_conflicts=True,
+        )
+        tokens = {
+            (smart_contract.id, token.token_id): token
+            for token in models.Erc721Token.objects.filter(
+                smart_contract=smart_contract, token_id__in=token_ids
+            ).select_related("smart_contract")
+        }
+        profiles = _get_profiles(transfers)
+        _create_activities(transfers, tokens, profiles)
+        _update_erc721_owners(transfers, tokens, profiles)
+        _update_erc1155_owners(transfers, tokens, profiles)
+
+    new_token_ids = [
+        token.id
+        for token in tokens.values()
+        if token.token_id not in discovered_token_ids
+    ]
+    _queue_metadata(new_token_ids)
+    _queue_owner_checks(smart_contract, new_token_ids)
+    discovered_token_ids.update(token_ids)
+
+
+def _parse_decoded_transfer(event):
+    args = event["args"]
+    return {
+        "txn_id": event["transactionHash"].hex(),
+        "position": (event["blockNumber"], event["logIndex"]),
+        "batch_index": event.get("batchIndex", 0),
+        "from": Web3.toChecksumAddress(args["from"]),
+        "to": Web3.toChecksumAddress(args["to"]),
+        "token_id": str(args["tokenId"] if "tokenId" in args else args["id"]),
+        "quantity": args["value"] if "value" in args else 1,
+    }
+
+
+def _get_block_timestamps(w3, block_numbers):
+    def get_timestamp(block_number):
+        return block_number, datetime.fromtimestamp(
+            txn_cache.get_block_timestamp(w3, block_number), timezone.utc
+        )
+
+    with ThreadPoolExecutor(max_workers=TXN_FETCH_WORKERS) as pool:
+        return dict(pool.map(get_timestamp, block_numbers))
+
+
+def _default_token_name(collection, token_id):
+    # Same tentative name refresh_token gives a token before metadata is pulled
+    if collection.name and len(collection.name) > 16:
+        return f"#{token_id}"
+    return f"{collection.name} #{token_id}"
+
+
+def _queue_metadata(token_ids):
+    if not token_ids:
+        return
+
+    if os.environ.get("USE_CELERY"):
+        from batch_processing.tasks.token.tasks import refresh_token_metadata_batch
+
+        for i in range(0, len(token_ids), METADATA_BATCH_SIZE):
+            refresh_token_metadata_batch.apply_async(
+                (token_ids[i : i + METADATA_BATCH_SIZE],),
+                queue="refresh_token",
+                ignore_result=True,
+            )
+    else:
+        from .metadata_utils import refresh_tokens_metadata
+
+        for i in range(0, len(token_ids), METADATA_BATCH_SIZE):
+            refresh_tokens_metadata(
+                models.Erc721Token.objects.filter(
+                    id__in=token_ids[i : i + METADATA_BATCH_SIZE]
+                ).select_related("smart_contract__network", "collection")
+            )
+
+
+def _queue_owner_checks(smart_contract, token_ids):
+    """
+    Owners written from mint events are only right for tokens that haven't
+    moved since, so confirm new ERC-721 owners with batched ownerOf reads.
+    ERC-1155 balances need no check: every transfer of the contract is applied
+    to the Erc1155Transfer ledger as its chunk is discovered.
+    """
+    if not token_ids or smart_contract.type == models.CollectionType.ERC1155:
+        return
+
+    from batch_processing.tasks.token.tasks import refresh_token_owners_chunk
+
+    for i in range(0, len(token_ids), OWNER_CHECK_BATCH_SIZE):
+        chunk = token_ids[i : i + OWNER_CHECK_BATCH_SIZE]
+        if os.environ.get("USE_CELERY"):
+            refresh_token_owners_chunk.apply_async(
+                (chunk,), queue="refresh_token", ignore_result=True
+            )
+        else:
+            refresh_token_owners_chunk(chunk)
+
+
+def _get_w3(network):
+    if network != NETWORK:
+        return Web3(
+            Web3.HTTPProvider(
+                f"https://{network}.g.alchemy.com/v2/{ALCHEMY_API_KEY}"
+            )
+        )
+    return primary_w3
+
+
+def _log_position(transfer_event):
+    return (
+        int(transfer_event.get("blockNumber") or "0x0", 16),
+        int(transfer_event.get("logIndex") or "0x0", 16),
+    )
+
+
+def _parse_transfer(transfer_event):
+    func_hash, *other_topics = transfer_event["topics"]
+    if func_hash == ERC_721_SAFE_TRANSFER_TOPIC and len(other_topics) == 3:
+        from_bytes, to_bytes, token_id_bytes = other_topics
+        from_address = to_checksum_address_from_bytes(from_bytes)
+        to_address = to_checksum_address_from_bytes(to_bytes)
+        token_id = int(token_id_bytes, 16)
+        quantity = 1
+    elif func_hash == ERC_1155_SAFE_TRANSFER_TOPIC:
+        _operator, from_address, to_address = (
+            to_checksum_address_from_bytes(t) for t in other_topics
+        )
+        token_id, quantity = int(transfer_event["data"][:66], 16), int(
+            transfer_event["data"][66:], 16
+        )
+    else:
+        return None
+
+    return {
+        "txn_id": transfer_event["transactionHash"],
+        "position": _log_position(transfer_event),
+        "from": from_address,
+        "to": to_address,
+        "token_id": str(token_id),
+        "quantity": quantity,
+    }
+
+
+def _get_transactions(w3, txn_ids):
+    def get_transaction(txn_id):
+        try:
+            return txn_id, txn_cache.get_transaction(w3, txn_id)
+        except Exception as e:
+            print(f"Transaction {txn_id} not found: {e}")
+            return txn_id, None
+
+    with ThreadPoolExecutor(max_workers=TXN_FETCH_WORKERS) as pool:
+        return dict(pool.map(get_transaction, txn_ids))
+
+
+def _get_timestamp(w3, full_txn):
+    try:
+        return datetime.fromtimestamp(int(full_txn["l1Timestamp"], 16), timezone.utc)
+    except Exception:
+        return datetime.fromtimestamp(
+            txn_cache.get_block_timestamp(w3, full_txn["blockNumber"]), timezone.utc
+        )
+
+
+def _get_profiles(transfers):
+    addresses = {t["from"] for t in transfers} | {t["to"] for t in transfers}
+    profiles = {
+        p.address: p for p in models.Profile.objects.filter(address__in=addresses)
+    }
+    missing = addresses - profiles.keys()
+    if missing:
+        # ENS names for these are filled in later by refresh_profile_ens
+        models.Profile.objects.bulk_create(
+            [models.Profile(address=address) for address in missing],
+            ignore_conflicts=True,
+        )
+        profiles.update(
+            {p.address: p for p in models.Profile.objects.filter(address__in=missing)}
+        )
+    return profiles
+
+
+def _get_tokens(transfers):
+    token_ids_by_contract = defaultdict(set)
+    for transfer in transfers:
+        token_ids_by_contract[transfer["contract"]].add(transfer["token_id"])
+
+    tokens = {}
+    pulled_token_ids = set()
+    for smart_contract, token_ids in token_ids_by_contract.items():
+        for token in models.Erc721Token.objects.filter(
+            smart_contract=smart_contract, token_id__in=token_ids
+        ).select_related("smart_contract"):
+            tokens[(smart_contract.id, token.token_id)] = token
+
+        for token_id in token_ids:
+            if (smart_contract.id, token_id) in tokens:
+                continue
+            if smart_contract.type == models.CollectionType.ERC721:
+                token = smart_contract.pull_erc721_token(token_id, queue=False)
+            else:
+                token = smart_contract.pull_erc1155_token(token_id, queue=False)
+            if token:
+                tokens[(smart_contract.id, token_id)] = token
+                pulled_token_ids.add(token.id)
+
+    return tokens, pulled_token_ids
+
+
+def _is_airdrop(transfer):
+    # Airdrop if the receiver isn't the address that sent the transaction
+    return bool(transfer["txn"]["from"] and transfer["txn"]["from"] != transfer["to"])
+
+
+def _activity_key(txn_id, token_id, quantity, from_profile_id, to_profile_id, timestamp):
+    return (txn_id, token_id, quantity, from_profile_id, to_profile_id, timestamp)
+
+
+def _create_activities(transfers, tokens, profiles):
+    """
+    Insert activities that don't exist yet and return the transfers they belong to.
+    """
+    txn_ids = {t["txn_id"] for t in transfers}
+    existing = {
+        _activity_key(*values)
+        for values in models.Erc721Activity.objects.filter(
+            txn_id__in=txn_ids
+        ).values_list(
+            "txn_id", "token_id", "quantity", "from_profile_id", "to_profile_id", "timestamp"
+        )
+    }
+
+    new_activities = {}
+    new_transfers = []
+    for transfer in transfers:
+        token = tokens.get((transfer["contract"].id, transfer["token_id"]))
+        if not token:
+            continue
+        from_profile = profiles[transfer["from"]]
+        to_profile = profiles[transfer["to"]]
+        key = _activity_key(
+            transfer["txn_id"],
+            token.id,
+            transfer["quantity"],
+            from_profile.id,
+            to_profile.id,
+            transfer["timestamp"],
+        )
+        if key in existing or key in new_activities:
+            continue
+
+        activity = models.Erc721Activity(
+            txn_id=transfer["txn_id"],
+            token=token,
+            quantity=transfer["quantity"],
+            from_profile=from_profile,
+            to_profile=to_profile,
+            timestamp=transfer["timestamp"],
+        )
+        # Event type depends on the airdrop flag the single-event path sets on the token
+        was_airdrop = token.is_airdrop
+        token.is_airdrop = _is_airdrop(transfer)
+        activity.refresh_event_type(should_save=False)
+        token.is_airdrop = was_airdrop
+        new_activities[key] = activity
+        new_transfers.append(transfer)
+
+    if not new_activities:
+        return []
+
+    models.Erc721Activity.objects.bulk_create(
+        new_activities.values(), ignore_conflicts=True
+    )
+
+    # ignore_conflicts doesn't return ids, so look the new rows up for notifications
+    notifications = []
+    for values in models.Erc721Activity.objects.filter(
+        txn_id__in={a.txn_id for a in new_activities.values()}
+    ).values_list(
+        "id",
+        "txn_id",
+        "token_id",
+        "quantity",
+        "from_profile_id",
+        "to_profile_id",
+        "timestamp",
+    ):
+        activity = new_activities.get(_activity_key(*values[1:]))
+        if not activity:
+            continue
+        for profile in {activity.to_profile, activity.from_profile}:
+            notifications.append(
+                models.Notification(
+                    profile=profile,
+                    token=activity.token,
+                    onchain_activity_id=values[0],
+                    timestamp=activity.timestamp,
+                    event_type_short=activity.event_type_short,
+                )
+            )
+    models.Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+    to_mark_unread = {
+        p.id
+        for a in new_activities.values()
+        for p in (a.from_profile, a.to_profile)
+        if p.notifications_read
+    }
+    models.Profile.objects.filter(id__in=to_mark_unread).update(
+        notifications_read=False
+    )
+
+    print(f"Created {len(new_activities)} activities")
+    return new_transfers
+
+
+def _update_erc721_owners(transfers, tokens, profiles):
+    latest_transfers = {}
+    for transfer in transfers:
+        if transfer["contract"].type != models.CollectionType.ERC721:
+            continue
+        token = tokens.get((transfer["contract"].id, transfer["token_id"]))
+        if token:
+            # Transfers are sorted by log position, so the last one wins
+            latest_transfers[token.id] = (token, transfer)
+
+    if not latest_transfers:
+        return
+
+    # Don't let an old block range overwrite an owner set by a newer transfer
+    latest_timestamps = dict(
+        models.Erc721Activity.objects.filter(token_id__in=latest_transfers.keys())
+        .values("token_id")
+        .annotate(latest=Max("timestamp"))
+        .values_list("token_id", "latest")
+    )
+
+    updated_tokens = []
+    holders = set()
+    for token_id, (token, transfer) in latest_transfers.items():
+        latest = latest_timestamps.get(token_id)
+        if latest and latest > transfer["timestamp"]:
+            continue
+        holders.add((token.collection_id, token.owner_id))
+        token.owner = profiles[transfer["to"]]
+        token.is_airdrop = _is_airdrop(transfer)
+        holders.add((token.collection_id, token.owner_id))
+        updated_tokens.append(token)
+
+    models.Erc721Token.objects.bulk_update(updated_tokens, ["owner", "is_airdrop"])
+    mark_stats_dirty(token.collection_id for token in updated_tokens)
+    refresh_holders(holders)
+
+
+def _update_erc1155_owners(transfers, tokens, profiles, skip_token_ids=()):
+    # Newly pulled tokens already have balances read from the contract
+    ledger_entries = {}
+    for transfer in transfers:
+        if transfer["contract"].type != models.CollectionType.ERC1155:
+            continue
+        token = tokens.get((transfer["contract"].id, transfer["token_id"]))
+        if not token or token.id in skip_token_ids:
+            continue
+        block_number, log_index = transfer["position"]
+        batch_index = transfer.get("batch_index", 0)
+        ledger_entries[
+            (transfer["txn_id"], log_index, batch_index)
+        ] = models.Erc1155Transfer(
+            token=token,
+            txn_id=transfer["txn_id"],
+            log_index=log_index,
+            batch_index=batch_index,
+            block_number=block_number,
+            from_profile=profiles[transfer["from"]],
+            to_profile=profiles[transfer["to"]],
+            quantity=transfer["quantity"],
+        )
+
+    if not ledger_entries:
+        return
+
+    # Only apply transfers that haven't been applied by another listener yet
+    applied = set(
+        models.Erc1155Transfer.objects.filter(
+            txn_id__in={txn_id for txn_id, _, _ in ledger_entries}
+        ).values_list("txn_id", "log_index", "batch_index")
+    )
+    new_entries = [e for key, e in ledger_entries.items() if key not in applied]
+    models.Erc1155Transfer.objects.bulk_create(new_entries, ignore_conflicts=True)
+
+    deltas = defaultdict(int)
+    for entry in new_entries:
+        if int(entry.from_profile.address, 16) != 0:
+            deltas[(entry.token.id, entry.from_profile.id)] -= entry.quantity
+        if int(entry.to_profile.address, 16) != 0:
+            deltas[(entry.token.id, entry.to_profile.id)] += entry.quantity
+
+    if not deltas:
+        return
+
+    token_ids = {token_id for token_id, _owner_id in deltas}
+    owner_ids = {owner_id for _token_id, owner_id in deltas}
+    # Create missing receivers first, so every row the deltas touch can be
+    # locked. Quantities are written back absolute, and the locks keep
+    # concurrent apply_erc1155_transfer calls out until this chunk commits.
+    models.Erc1155TokenOwner.objects.bulk_create(
+        [
+            models.Erc1155TokenOwner(token_id=token_id, owner_id=owner_id, quantity=0)
+            for (token_id, owner_id), delta in deltas.items()
+            if delta > 0
+        ],
+        ignore_conflicts=True,
+    )
+    existing = {
+        (o.token_id, o.owner_id): o
+        for o in models.Erc1155TokenOwner.objects.select_for_update()
+        .filter(token_id__in=token_ids, owner_id__in=owner_ids)
+        .order_by("id")
+    }
+
+    to_update, to_delete = [], []
+    for (token_id, owner_id), delta in deltas.items():
+        token_owner = existing.get((token_id, owner_id))
+        if not token_owner:
+            continue
+        token_owner.quantity = max(token_owner.quantity + delta, 0)
+        if token_owner.quantity == 0:
+            to_delete.append(token_owner.id)
+        else:
+            to_update.append(token_owner)
+
+    models.Erc1155TokenOwner.objects.filter(id__in=to_delete).delete()
+    models.Erc1155TokenOwner.objects.bulk_update(to_update, ["quantity"])
+
+    quantities = dict(
+        models.Erc1155TokenOwner.objects.filter(token_id__in=token_ids)
+        .values("token_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("token_id", "total")
+    )
+    updated_tokens = []
+    for token in tokens.values():
+        if token.id in token_ids:
+            token.quantity = quantities.get(token.id) or 0
+            updated_tokens.append(token)
+    models.Erc721Token.objects.bulk_update(updated_tokens, ["quantity"])
+    mark_stats_dirty(token.collection_id for token in updated_tokens)
+
+    collection_ids = {token.id: token.collection_id for token in updated_tokens}
+    refresh_holders(
+        (collection_ids[token_id], owner_id) for token_id, owner_id in deltas
+    )
+
+
+def _refresh_orders(tokens):
+    tokens = {token.id: token for token in tokens}
+    token_ids_with_orders = set()
+    for order_model in (
+        models.Erc721SellOrder,
+        models.Erc721DutchAuction,
+        models.Erc721BuyOrder,
+    ):
+        token_ids_with_orders.update(
+            order_model.objects.filter(
+                token_id__in=tokens.keys(), active=True
+            ).values_list("token_id", flat=True)
+        )
+
+    for token_id in token_ids_with_orders:
+        tokens[token_id].soft_refresh_orders()
@@ -21,6 +21,7 @@ from api.utils.process_transfer import process_fulfilled_order
 from .. import models
 from .ExchangeContract import exchange_addresses
 from .hex_utils import to_checksum_address_from_bytes
+from .txn_cache import txn_cache
 
 ERC_721_SAFE_TRANSFER_TOPIC = (
     "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
@@ -71,7 +72,7 @@ def handle_transfer_event(transfer_event, network=NETWORK):
         if from_address == REWARD_WRAPPER_ADDRESS:
             # If the txn is from the Reward Wrapper, find who sent it to the Reward Wrapper
             # and set that address as the from_address
-            txn_receipt = w3.eth.get_transaction_receipt(transfer_txn_id)
+            txn_receipt = txn_cache.get_transaction_receipt(w3, transfer_txn_id)
             for log in txn_receipt["logs"]:
                 if (
                     log["topics"][0].hex() == ERC_721_SAFE_TRANSFER_TOPIC
@@ -168,12 +169,12 @@ def handle_transfer_event(transfer_event, network=NETWORK):
                 tok.save()
 
     try:
-        full_txn = w3.eth.get_transaction(transfer_txn_id)
+        full_txn = txn_cache.get_transaction(w3, transfer_txn_id)
     except Exception:
         print(f"Transaction {transfer_txn_id} not found, retrying")
         sleep(1)
         try:
-            full_txn = w3.eth.get_transaction(transfer_txn_id)
+            full_txn = txn_cache.get_transaction(w3, transfer_txn_id)
         except Exception:
             print(f"Transaction {transfer_txn_id} not found after retry")
             return
@@ -184,7 +185,7 @@ def handle_transfer_event(transfer_event, network=NETWORK):
         )
     except Exception:
         timestamp = datetime.fromtimestamp(
-            w3.eth.getBlock(full_txn["blockNumber"]).timestamp, timezone.utc
+            txn_cache.get_block_timestamp(w3, full_txn["blockNumber"]), timezone.utc
         )
 
     try:
@@ -209,7 +210,17 @@ def handle_transfer_event(transfer_event, network=NETWORK):
         activity = process_fulfilled_order(full_txn, activity, timestamp, w3=w3)
 
     if token.smart_contract.type == models.CollectionType.ERC1155:
-        token.refresh_owner(from_profile=from_profile, to_profile=to_profile)
+        if "logIndex" in transfer_event:
+            token.apply_erc1155_transfer(
+                from_profile,
+                to_profile,
+                quantity,
+                transfer_txn_id,
+                log_index=int(transfer_event["logIndex"], 16),
+                block_number=int(transfer_event["blockNumber"], 16),
+            )
+        else:
+            token.refresh_owner(from_profile=from_profile, to_profile=to_profile)
         token.soft_refresh_orders(from_profile=from_profile, to_profile=to_profile)
     else:
         with transaction.atomic():
@@ -329,12 +340,12 @@ def handle_transfer_event(transfer_event, network=NETWORK):
 
 def handle_safe_batch_transfer_event(txn_id, w3):
     try:
-        full_txn = w3.eth.get_transaction(txn_id)
+        full_txn = txn_cache.get_transaction(w3, txn_id)
     except Exception:
         print(f"Transaction {txn_id} not found, retrying")
         sleep(1)
         try:
-            full_txn = w3.eth.get_transaction(txn_id)
+            full_txn = txn_cache.get_transaction(w3, txn_id)
         except Exception:
             print(f"Transaction {txn_id} not found after retry")
             return
@@ -345,11 +356,11 @@ def handle_safe_batch_transfer_event(txn_id, w3):
         )
     except Exception:
         timestamp = datetime.fromtimestamp(
-            w3.eth.getBlock(full_txn["blockNumber"]).timestamp, timezone.utc
+            txn_cache.get_block_timestamp(w3, full_txn["blockNumber"]), timezone.utc
         )
 
     contract = w3.eth.contract(abi=erc1155_abi)
-    receipt = w3.eth.getTransactionReceipt(txn_id)
+    receipt = txn_cache.get_transaction_receipt(w3, txn_id)
     logs = contract.events.TransferBatch().processReceipt(receipt)
     for log_group in logs:
         if log_group["event"] != "TransferBatch":
@@ -369,7 +380,7 @@ def handle_safe_batch_transfer_event(txn_id, w3):
 
         transfers = zip(args["ids"], args["values"])
         smart_contract = models.Contract.objects.get(address=contract_address)
-        for token_id, quantity in transfers:
+        for batch_index, (token_id, quantity) in enumerate(transfers):
             try:
                 token = models.Erc721Token.objects.get(
                     smart_contract=smart_contract, token_id=token_id
@@ -377,7 +388,16 @@ def handle_safe_batch_transfer_event(txn_id, w3):
             except models.Erc721Token.DoesNotExist:
                 token = smart_contract.pull_erc1155_token(token_id)
 
-            token.refresh_owner(from_profile=from_profile, to_profile=to_profile)
+            # Balances are updated from the event itself, no balanceOf calls per holder
+            token.apply_erc1155_transfer(
+                from_profile,
+                to_profile,
+                quantity,
+                txn_id,
+                log_index=log_group["logIndex"],
+                batch_index=batch_index,
+                block_number=log_group["blockNumber"],
+            )
             token.soft_refresh_orders(from_profile=from_profile, to_profile=to_profile)
 
             try:
@@ -0,0 +1,94 @@
+from datetime import timezone
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+
+from api.models import (
+    OP_ID,
+    BlockchainState,
+    CollectionDailyStats,
+    CollectionHourlyStats,
+    Erc721BuyOrder,
+    Erc721DutchAuction,
+    Sale,
+)
+
+
+def sale_from_order(order):
+    """
+    Build the Sale for a fulfilled order, with prices as integer gwei like the
+    orders. ETH and USD values come from the order's own eth_price() and
+    usd_price(), at the current rates. eth_price() falls back to the raw OP
+    amount without an OP rate, so OP sales get no ETH price then.
+    """
+    if order.payment_token_id == OP_ID and not _has_op_eth_rate():
+        price_eth = None
+    else:
+        price_eth = order.eth_price()
+    sale = Sale(
+        token_id=order.token_id,
+        collection_id=order.token.collection_id,
+        buyer_id=order.buyer_id,
+        seller_id=order.seller_id,
+        timestamp=order.time_sold,
+        txn_id=order.txn_id,
+        quantity=order.quantity,
+        payment_token_id=order.payment_token_id,
+        price=round(order.price or 0),
+        price_eth=round(price_eth) if price_eth is not None else None,
+        price_usd=order.usd_price(),
+    )
+    if isinstance(order, Erc721BuyOrder):
+        sale.buy_order = order
+    elif isinstance(order, Erc721DutchAuction):
+        sale.dutch_auction = order
+    else:
+        sale.sell_order = order
+    return sale
+
+
+def _has_op_eth_rate():
+    try:
+        float(BlockchainState.objects.get(key="op_eth_price").value)
+        return True
+    except (BlockchainState.DoesNotExist, TypeError, ValueError):
+        return False
+
+
+def record_sale(order):
+    """
+    Write the Sale for a newly fulfilled sell order, buy order or dutch auction
+    and add it to its collection's hourly and daily stats. Call this once, when
+    the order becomes fulfilled.
+    """
+    if not order.time_sold:
+        return None
+
+    from api.utils.collection_stats import mark_stats_dirty
+
+    sale = sale_from_order(order)
+    sale.save()
+    mark_stats_dirty([sale.collection_id])
+
+    if sale.collection_id:
+        timestamp = sale.timestamp.astimezone(timezone.utc)
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        _add_to_rollup(CollectionHourlyStats, {"hour": hour}, sale)
+        _add_to_rollup(CollectionDailyStats, {"date": timestamp.date()}, sale)
+    return sale
+
+
+def _add_to_rollup(model, lookup, sale):
+    stats, _created = model.objects.get_or_create(
+        collection_id=sale.collection_id, **lookup
+    )
+    updates = {"sales": F("sales") + 1}
+    if sale.price_eth is not None:
+        price = Value(sale.price_eth)
+        # LEAST and GREATEST skip NULLs in Postgres, so the first sale sets both
+        updates.update(
+            volume=F("volume") + max(sale.price_eth, 0),
+            min_price=Least(F("min_price"), price),
+            max_price=Greatest(F("max_price"), price),
+        )
+    model.objects.filter(id=stats.id).update(**updates)
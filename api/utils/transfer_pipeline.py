@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from api.utils.constants import ERC_721_SAFE_TRANSFER_TOPIC, NETWORK
+from api.utils.txn_cache import txn_cache
+
+DEFAULT_NUM_WORKERS = 8
+DEFAULT_MAX_QUEUE_SIZE = 1000
+STATS_INTERVAL_SECONDS = 60
+
+
+def process_transfer_txn_event(json_event, network=NETWORK):
+    """
+    Process a raw transfer log, either inline or by handing it to the process_txn queue.
+    """
+    from api.utils.process_transfer_ws import handle_transfer_event
+    from batch_processing.tasks.token.tasks import process_erc721_transfer_event
+
+    is_erc721_transfer = json_event["topics"][0] == ERC_721_SAFE_TRANSFER_TOPIC
+    if os.environ.get("USE_CELERY_PROCESS_TXN") and is_erc721_transfer:
+        address = json_event["address"]
+        topics = tuple(json_event["topics"])
+        transactionHash = json_event["transactionHash"]
+        process_erc721_transfer_event.apply_async(
+            (transactionHash, address, topics, network), queue="process_txn"
+        )
+    else:
+        handle_transfer_event(json_event, network=network)
+
+
+class TransferEventPipeline:
+    """
+    Bounded in-process queue of transfer logs drained by a pool of workers.
+
+    Websocket listeners await `put`, so a full queue stops them from reading
+    more messages until the workers catch up.
+    """
+
+    def __init__(self, network=NETWORK, num_workers=None, max_queue_size=None):
+        self.network = network
+        self.num_workers = num_workers or int(
+            os.environ.get("TRANSFER_PIPELINE_WORKERS", DEFAULT_NUM_WORKERS)
+        )
+        self.max_queue_size = max_queue_size or int(
+            os.environ.get("TRANSFER_PIPELINE_QUEUE_SIZE", DEFAULT_MAX_QUEUE_SIZE)
+        )
+
+        self.queue = None
+        self.executor = None
+        self.tasks = []
+
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        self.tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+        self.tasks.append(asyncio.create_task(self._report_stats()))
+        print(
+            f"Started transfer pipeline with {self.num_workers} workers "
+            f"(queue size {self.max_queue_size})"
+        )
+
+    async def stop(self):
+        # Let the workers finish whatever the listeners already handed over
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def put(self, transfer_event):
+        self.received += 1
+        await self.queue.put(transfer_event)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            transfer_event = await self.queue.get()
+            try:
+                await loop.run_in_executor(
+                    self.executor, self._process, transfer_event
+                )
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error processing {transfer_event.get('transactionHash')}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _process(self, transfer_event):
+        # Worker threads keep their own DB connection, so drop it if it went stale
+        close_old_connections()
+        try:
+            process_transfer_txn_event(transfer_event, network=self.network)
+        finally:
+            close_old_connections()
+
+    async def _report_stats(self):
+        last_time = time.monotonic()
+        last_received = last_processed = 0
+        while True:
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            now = time.monotonic()
+            elapsed = now - last_time
+            print(
+                f"Transfer pipeline: "
+                f"{(self.received - last_received) / elapsed:.1f} events/s received, "
+                f"{(self.processed - last_processed) / elapsed:.1f} events/s processed, "
+                f"{self.queue.qsize()} queued, {self.failed} failed total"
+            )
+            cache_stats = txn_cache.stats()
+            print(
+                f"Txn cache: {cache_stats['size']} entries, "
+                f"txn {cache_stats['txn_hit_rate']:.0%}, "
+                f"receipt {cache_stats['receipt_hit_rate']:.0%}, "
+                f"timestamp {cache_stats['timestamp_hit_rate']:.0%} hit rate"
+            )
+            last_time = now
+            last_received, last_processed = self.received, self.processed
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+DEFAULT_MAX_SIZE = 5000
+DEFAULT_CONFIRMATIONS = 12
+# Entries from blocks that could still be reorged out are only kept briefly
+UNCONFIRMED_TTL_SECONDS = 30
+HEAD_BLOCK_TTL_SECONDS = 5
+
+
+class TxnCache:
+    """
+    Bounded LRU cache for transactions, receipts and block timestamps.
+
+    A batch mint or sweep emits many transfer logs for the same transaction;
+    this lets every event after the first reuse the RPC results. Entries more
+    than `confirmations` blocks behind the head never expire (only LRU
+    eviction removes them). Pending transactions are never cached.
+    """
+
+    def __init__(self, max_size=None, confirmations=None):
+        self.max_size = max_size or int(
+            os.environ.get("TXN_CACHE_SIZE", DEFAULT_MAX_SIZE)
+        )
+        self.confirmations = confirmations or int(
+            os.environ.get("TXN_CACHE_CONFIRMATIONS", DEFAULT_CONFIRMATIONS)
+        )
+        self.entries = OrderedDict()
+        self.head_blocks = {}
+        self.hits = {"txn": 0, "receipt": 0, "timestamp": 0}
+        self.misses = {"txn": 0, "receipt": 0, "timestamp": 0}
+        self.lock = threading.Lock()
+
+    def get_transaction(self, w3, txn_id):
+        return self._get_or_fetch(
+            w3,
+            "txn",
+            _hash_key(txn_id),
+            lambda: w3.eth.get_transaction(txn_id),
+            lambda txn: txn["blockNumber"],
+        )
+
+    def get_transaction_receipt(self, w3, txn_id):
+        return self._get_or_fetch(
+            w3,
+            "receipt",
+            _hash_key(txn_id),
+            lambda: w3.eth.get_transaction_receipt(txn_id),
+            lambda receipt: receipt["blockNumber"],
+        )
+
+    def get_block_timestamp(self, w3, block_number):
+        return self._get_or_fetch(
+            w3,
+            "timestamp",
+            block_number,
+            lambda: w3.eth.getBlock(block_number).timestamp,
+            lambda _timestamp: block_number,
+        )
+
+    def stats(self):
+        with self.lock:
+            stats = {"size": len(self.entries)}
+            for kind in self.hits:
+                total = self.hits[kind] + self.misses[kind]
+                stats[f"{kind}_hit_rate"] = self.hits[kind] / total if total else 0
+            return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.head_blocks.clear()
+
+    def _get_or_fetch(self, w3, kind, key, fetch, get_block_number):
+        cache_key = (_provider_key(w3), kind, key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry and (entry[1] is None or entry[1] > now):
+                self.entries.move_to_end(cache_key)
+                self.hits[kind] += 1
+                return entry[0]
+            self.misses[kind] += 1
+
+        value = fetch()
+        block_number = get_block_number(value)
+        if block_number is None:
+            return value
+
+        if self._head_block(w3) - block_number >= self.confirmations:
+            expires_at = None
+        else:
+            expires_at = now + UNCONFIRMED_TTL_SECONDS
+
+        with self.lock:
+            self.entries[cache_key] = (value, expires_at)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+    def _head_block(self, w3):
+        provider_key = _provider_key(w3)
+        now = time.monotonic()
+        head = self.head_blocks.get(provider_key)
+        if head and head[1] > now:
+            return head[0]
+        block_number = w3.eth.block_number
+        self.head_blocks[provider_key] = (block_number, now + HEAD_BLOCK_TTL_SECONDS)
+        return block_number
+
+
+def _hash_key(txn_id):
+    if isinstance(txn_id, bytes):
+        txn_id = Web3.toHex(txn_id)
+    return txn_id.lower()
+
+
+def _provider_key(w3):
+    return getattr(w3.provider, "endpoint_uri", None) or id(w3.provider)
+
+
+txn_cache = TxnCache()
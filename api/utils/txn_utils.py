@@ -1,9 +1,10 @@
 from .constants import w3, ERC_721_SAFE_TRANSFER_TOPIC, ERC_1155_SAFE_TRANSFER_TOPIC
 from .hex_utils import HexJsonEncoder
+from .txn_cache import txn_cache
 import json
 
 def get_transfer_events_from_txn_id(txn_id):
-    receipts = w3.eth.get_transaction_receipt(txn_id)
+    receipts = txn_cache.get_transaction_receipt(w3, txn_id)
     logs = receipts['logs']
     transfer_logs = []
     for log in logs:
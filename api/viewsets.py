@@ -46,6 +46,8 @@ from .utils.filters import (
     profile_token_filters,
 )
 from .utils.L2Erc721Contract import L2Erc721Contract
+from .utils.metadata_cache import fetch_metadata
+from .utils.metadata_utils import parse_metadata
 from .utils.order_utils import create_timestamps
 from .utils.request_utils import UnsafeInputException, check_request_body
 from .utils.seaport.orders import (
@@ -1457,12 +1459,11 @@ class CollectionViewset(viewsets.GenericViewSet):
     @method_decorator(cache_page(60 * 5))  # 5 minutes
     @action(detail=False, url_path="explore", methods=["GET"])
     def explore_collections(self, request, *args, **kwargs):
-        col_ids = [
-            col.id
-            for col in self.queryset.filter(delisted=False, is_spam=False)
-            if (col.volume > 0 or col.verified)
-        ]
-        collections = self.queryset.filter(id__in=col_ids).order_by("-volume_30d")
+        collections = (
+            self.queryset.filter(delisted=False, is_spam=False)
+            .filter(Q(volume__gt=0) | Q(verified=True))
+            .order_by("-volume_30d")
+        )
         collections = self.paginate_queryset(collections)
         serializer = serializers.CollectionSerializerMedium(collections, many=True)
         return self.get_paginated_response(serializer.data)
@@ -1636,108 +1637,47 @@ class CollectionViewset(viewsets.GenericViewSet):
         else:
             reverse = False
 
-        if range == "24h":
-            col_ids = [
-                col.id
-                for col in self.queryset.filter(delisted=False)
-                if col.volume_24h > 0
-            ]
-        elif range == "7d":
-            col_ids = [
-                col.id
-                for col in self.queryset.filter(delisted=False)
-                if col.volume_7d > 0
-            ]
-        elif range == "30d":
-            col_ids = [
-                col.id
-                for col in self.queryset.filter(delisted=False)
-                if col.volume_30d > 0
-            ]
+        if range in ("24h", "7d", "30d"):
+            volume_field = "volume_" + range
+            sales_field = "sales_" + range
         else:
-            col_ids = [
-                col.id for col in self.queryset.filter(delisted=False) if col.volume > 0
-            ]
-
-        col_ids = [
-            col_id for col_id in col_ids if col_id != 5769
-        ]  # Exclude Dragonic Egg
-
-        collections = self.queryset.filter(id__in=col_ids)
+            volume_field = "volume"
+            sales_field = "sales"
+
+        # Matches the partial index for this range, so sorting and paging are
+        # done by the database however many collections there are
+        collections = self.queryset.filter(
+            delisted=False, **{volume_field + "__gt": 0}
+        ).exclude(id=5769)  # Exclude Dragonic Egg
+
+        orders = {
+            "volume": volume_field,
+            "volume_24h": "volume_change_24h",
+            "volume_7d": "volume_change_7d",
+            "floor": "floor",
+            "sales": sales_field,
+            "items": "supply",
+            "listed": "listed",
+            "owners": "owners",
+        }
+        if split_tag[0] not in orders:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        if split_tag[0] == "volume":
-            order = "volume"
+        order = F(orders[split_tag[0]])
+        if split_tag[0] in ("volume_24h", "volume_7d"):
+            # Collections without previous volume have no change and rank lowest
             if reverse:
-                order = "-" + order
-
-            if range == "24h":
-                order = order + "_" + range
-            elif range == "7d":
-                order = order + "_" + range
-            elif range == "30d":
-                order = order + "_" + range
-
-            collections = self.paginate_queryset(collections.order_by(order))
-        elif split_tag[0] == "volume_24h":
-            collections = self.paginate_queryset(
-                sorted(
-                    collections,
-                    key=lambda c: (
-                        c.volume_change_24h() is not None,
-                        c.volume_change_24h(),
-                    ),
-                    reverse=reverse,
-                )
-            )
-        elif split_tag[0] == "volume_7d":
-            collections = self.paginate_queryset(
-                sorted(
-                    collections,
-                    key=lambda c: (
-                        c.volume_change_7d() is not None,
-                        c.volume_change_7d(),
-                    ),
-                    reverse=reverse,
-                )
-            )
+                order = order.desc(nulls_last=True)
+            else:
+                order = order.asc(nulls_first=True)
         elif split_tag[0] == "floor":
-            order = "floor"
             if reverse:
-                collections = self.paginate_queryset(
-                    collections.order_by(F(order).desc(nulls_last=True))
-                )
+                order = order.desc(nulls_last=True)
             else:
-                collections = self.paginate_queryset(
-                    collections.order_by(F(order).asc(nulls_last=True))
-                )
-        elif split_tag[0] == "sales":
-            order = "sales"
-            if reverse:
-                order = "-" + order
-
-            if range == "24h":
-                order = order + "_" + range
-            elif range == "7d":
-                order = order + "_" + range
-            elif range == "30d":
-                order = order + "_" + range
-
-            collections = self.paginate_queryset(collections.order_by(order))
-        elif split_tag[0] == "items":
-            order = "supply"
-            if reverse:
-                order = "-" + order
-            collections = self.paginate_queryset(collections.order_by(order))
-        elif split_tag[0] == "listed":
-            order = "listed"
-            if reverse:
-                order = "-" + order
-            collections = self.paginate_queryset(collections.order_by(order))
-        elif split_tag[0] == "owners":
-            order = "owners"
-            if reverse:
-                order = "-" + order
-            collections = self.paginate_queryset(collections.order_by(order))
+                order = order.asc(nulls_last=True)
+        else:
+            order = order.desc() if reverse else order.asc()
+        collections = self.paginate_queryset(collections.order_by(order))
 
         if range == "24h":
             serializer = serializers.CollectionSerializerForStats24H(
@@ -1763,6 +1703,36 @@ class CollectionViewset(viewsets.GenericViewSet):
         daily_stats = collection.daily_stats()
         return Response(data=daily_stats, status=200)
 
+    @action(detail=True, url_path="hourly-stats", methods=["GET"])
+    def hourly_stats(self, request, address):
+        collection = get_object_or_404(self.queryset, address=address)
+        try:
+            hours = int(request.query_params.get("hours", 24 * 7))
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        hours = min(max(hours, 1), 24 * 30)
+        hourly_stats = collection.hourly_stats(hours)
+        return Response(data=hourly_stats, status=200)
+
+    @action(detail=True, url_path="holders", methods=["GET"])
+    def holders(self, request, address):
+        collection = get_object_or_404(self.queryset, address=address)
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+            holders, next_cursor = collection.top_holders(
+                limit, request.query_params.get("cursor")
+            )
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = serializers.CollectionHolderSerializer(holders, many=True)
+        data = {
+            **collection.holder_distribution(),
+            "holders": serializer.data,
+            "next": next_cursor,
+        }
+        return Response(data=data, status=200)
+
     # ================ COLLECTION SETTING ================
 
     @action(detail=True, url_path="settings", methods=["GET"])
@@ -2279,15 +2249,14 @@ class TokenMetadataViewset(viewsets.GenericViewSet):
                         token_metadata = json.loads(
                             base64.b64decode(token_metadata_uri), strict=False
                         )
-                    elif token_metadata_uri.startswith("ipfs://"):
-                        token_metadata_uri = token_metadata_uri.replace(
-                            "ipfs://", "https://quixotic.infura-ipfs.io/ipfs/"
-                        )
-                        r = requests.get(token_metadata_uri)
-                        token_metadata = json.loads(r.text, strict=False)
                     else:
-                        r = requests.get(token_metadata_uri)
-                        token_metadata = json.loads(r.text, strict=False)
+                        if token_metadata_uri.startswith("ipfs://"):
+                            token_metadata_uri = token_metadata_uri.replace(
+                                "ipfs://", "https://quixotic.infura-ipfs.io/ipfs/"
+                            )
+                        token_metadata = fetch_metadata(
+                            [(token_id, token_metadata_uri)], parse_metadata
+                        ).get(token_id)
                 except Exception as e:
                     print(e)
                     token_metadata = None
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2022-12-13 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjob',
+            name='num_tasks_finished',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
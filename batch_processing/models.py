@@ -7,6 +7,7 @@ class BatchJob(models.Model):
     description = models.TextField(null=True)
 
     num_stale = models.IntegerField(null=True)
+    num_tasks_finished = models.PositiveIntegerField(default=0)
     is_finished = models.BooleanField(default=False)
 
     def __str__(self):
@@ -15,6 +16,9 @@ class BatchJob(models.Model):
     def cache_key_num_stale(self):
         return f"batch-job-{self.id}-num-stale"
 
+    def progress(self):
+        return self.num_tasks_finished / self.num_tasks if self.num_tasks else 1
+
 
 class StaleOwnerRecord(models.Model):
     batch_job = models.ForeignKey(BatchJob, on_delete=models.CASCADE)
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from api.utils.ens_utils import refresh_ens_for_profiles
+
+
+@shared_task(rate_limit="10/s")
+def refresh_profile_ens(profile_ids):
+    """
+    Use internal profile ids
+    """
+    return refresh_ens_for_profiles(profile_ids)
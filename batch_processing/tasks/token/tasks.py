@@ -1,12 +1,18 @@
-from api.models import CollectionType, Contract, Erc721Token
+from collections import defaultdict
+
+from api.models import CollectionType, Contract, Erc721Token, Profile
+from api.utils.collection_stats import mark_stats_dirty, refresh_holders
 from api.utils.constants import NETWORK
+from api.utils.Erc721Contract import Erc721Contract
 from api.utils.process_transfer_ws import handle_transfer_event
 from celery import shared_task
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.core.cache import cache
 
 from api.utils.constants import IS_CELERY_PROCESSING_TXNS
-from ...models import StaleOwnerRecord
+from ...models import BatchJob, StaleOwnerRecord
 from ...utils.txn_utils import get_transfer_logs
 
 
@@ -33,6 +39,22 @@ def refresh_token(internal_id, retries=0):
     return True
 
 
+@shared_task(rate_limit="2/s")
+def refresh_token_metadata_batch(internal_ids):
+    """
+    Use internal ids not token ids
+    """
+
+    from api.utils.metadata_utils import refresh_tokens_metadata
+
+    refresh_tokens_metadata(
+        Erc721Token.objects.filter(id__in=internal_ids).select_related(
+            "smart_contract__network", "collection"
+        )
+    )
+    return True
+
+
 @shared_task(rate_limit="4/s")
 def pull_new_media_for_token(internal_id):
     """
@@ -62,6 +84,95 @@ def refresh_token_owner(self, internal_id, batch_job_id=None):
     return 1 if owner_changed else 0
 
 
+@shared_task(bind=True)
+def refresh_token_owners_chunk(self, internal_ids, batch_job_id=None):
+    """
+    Use internal ids not token ids. Reconciles ERC721 owners for a chunk of tokens
+    with batched ownerOf reads and writes only the owners that changed.
+    """
+    tokens = list(
+        Erc721Token.objects.filter(
+            id__in=internal_ids, smart_contract__type=CollectionType.ERC721
+        ).select_related("owner", "smart_contract__network")
+    )
+
+    tokens_by_contract = defaultdict(list)
+    for token in tokens:
+        tokens_by_contract[token.smart_contract].append(token)
+
+    onchain_owners = {}
+    for smart_contract, contract_tokens in tokens_by_contract.items():
+        contract = Erc721Contract(
+            smart_contract.address, smart_contract.network.network_id
+        )
+        owners = contract.owner_of_batch([t.token_id for t in contract_tokens])
+        for token in contract_tokens:
+            # Skip failed reads; reverts already come back as the zero address
+            if owners.get(token.token_id):
+                onchain_owners[token.id] = owners[token.token_id]
+
+    addresses = set(onchain_owners.values())
+    profiles = {p.address: p for p in Profile.objects.filter(address__in=addresses)}
+    missing = addresses - profiles.keys()
+    if missing:
+        Profile.objects.bulk_create(
+            [Profile(address=address) for address in missing], ignore_conflicts=True
+        )
+        profiles.update(
+            {p.address: p for p in Profile.objects.filter(address__in=missing)}
+        )
+
+    stale_tokens = []
+    stale_records = []
+    holders = set()
+    with transaction.atomic():
+        # A transfer processed since the owners were read is newer than the read,
+        # so only write tokens whose owner hasn't changed in the meantime
+        current_owner_ids = dict(
+            Erc721Token.objects.select_for_update()
+            .filter(id__in=onchain_owners.keys())
+            .order_by("id")
+            .values_list("id", "owner_id")
+        )
+        for token in tokens:
+            owner_address = onchain_owners.get(token.id)
+            if not owner_address or (
+                token.owner and token.owner.address == owner_address
+            ):
+                continue
+            if current_owner_ids.get(token.id) != token.owner_id:
+                continue
+            stale_records.append(
+                StaleOwnerRecord(
+                    batch_job_id=batch_job_id,
+                    celery_task_id=self.request.id,
+                    old_owner=token.owner.address if token.owner else "",
+                    new_owner=owner_address,
+                )
+            )
+            holders.add((token.collection_id, token.owner_id))
+            token.owner = profiles[owner_address]
+            holders.add((token.collection_id, token.owner_id))
+            stale_tokens.append(token)
+
+        Erc721Token.objects.bulk_update(stale_tokens, ["owner"])
+        if batch_job_id:
+            StaleOwnerRecord.objects.bulk_create(stale_records)
+    mark_stats_dirty({token.collection_id for token in stale_tokens})
+    refresh_holders(holders)
+
+    if batch_job_id:
+        BatchJob.objects.filter(id=batch_job_id).update(
+            num_tasks_finished=F("num_tasks_finished") + 1,
+            num_stale=Coalesce(F("num_stale"), 0) + len(stale_tokens),
+        )
+        BatchJob.objects.filter(
+            id=batch_job_id, num_tasks_finished__gte=F("num_tasks")
+        ).update(is_finished=True)
+
+    return len(stale_tokens)
+
+
 @shared_task(bind=True)
 def refresh_1155_token_owner(self, internal_id, batch_job_id=None):
     token = Erc721Token.objects.get(id=internal_id)
@@ -94,6 +205,14 @@ def queue_handle_transfer_event(json_event, network=NETWORK):
         print("This is likely an ERC20.")
 
 
+@shared_task
+def queue_handle_transfer_events_bulk(json_events, network=NETWORK):
+    cache.set(IS_CELERY_PROCESSING_TXNS, True, 60 * 10)  # Cache for 10 minutes
+    from api.utils.process_transfer_bulk import handle_transfer_events_bulk
+
+    return handle_transfer_events_bulk(json_events, network=network)
+
+
 @shared_task
 def process_all_transfers_in_txn(transfer_txn_id):
     """
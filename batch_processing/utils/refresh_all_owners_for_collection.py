@@ -1,17 +1,28 @@
 from api.models import Erc721Collection
 from ..models import BatchJob
-from ..tasks.common.tasks import num_stale
-from ..tasks.token.tasks import refresh_token_owner
-from celery import chord
+from ..tasks.token.tasks import refresh_token_owners_chunk
+from celery import group
+
+CHUNK_SIZE = 500
 
 
 def refresh_all_owners_for_collection(address):
     collection = Erc721Collection.objects.get(address=address)
-    tasks = [refresh_token_owner.s(t.id) for t in collection.erc721token_set.all()]
+    token_ids = list(
+        collection.erc721token_set.order_by("id").values_list("id", flat=True)
+    )
+    chunks = [
+        token_ids[i : i + CHUNK_SIZE] for i in range(0, len(token_ids), CHUNK_SIZE)
+    ]
     batch_job = BatchJob.objects.create(
         name=f"refresh-owners",
-        num_tasks=len(tasks)
+        num_tasks=len(chunks),
+        num_stale=0,
+        is_finished=not chunks,
     )
-    finished_callback = num_stale.subtask(kwargs={"batch_job_id": batch_job.id})
-    job = chord(tasks, finished_callback)
-    job.apply_async()
+    tasks = [
+        refresh_token_owners_chunk.s(chunk, batch_job_id=batch_job.id)
+        for chunk in chunks
+    ]
+    group(tasks).apply_async()
+    return batch_job
@@ -3,12 +3,13 @@ from api.utils.constants import w3
 import json
 from api.utils.Erc721Contract import Erc721Contract
 from api.utils.hex_utils import HexJsonEncoder
+from api.utils.txn_cache import txn_cache
 
 
 
 def get_transfer_log(txn_id):
     TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
-    transfer_txn = w3.eth.getTransactionReceipt(txn_id)
+    transfer_txn = txn_cache.get_transaction_receipt(w3, txn_id)
     transfer_log = None
     for log in transfer_txn['logs']:
         if log['topics'][0].hex() == TOPIC:
@@ -24,7 +25,7 @@ def get_transfer_log(txn_id):
 
 def get_transfer_logs(txn_id):
     TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
-    transfer_txn = w3.eth.getTransactionReceipt(txn_id)
+    transfer_txn = txn_cache.get_transaction_receipt(w3, txn_id)
     transfer_logs = []
     addr_dict = {}
     for log in transfer_txn['logs']:
@@ -44,7 +45,7 @@ def get_transfer_logs(txn_id):
 
 def get_transfer_log(txn_id):
     TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
-    transfer_txn = w3.eth.getTransactionReceipt(txn_id)
+    transfer_txn = txn_cache.get_transaction_receipt(w3, txn_id)
     transfer_logs = []
     for log in transfer_txn['logs']:
         if log['topics'][0].hex() == TOPIC:
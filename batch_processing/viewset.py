@@ -15,8 +15,8 @@ class CollectionBatchProcessingViewset(viewsets.GenericViewSet):
 
     @action(detail=True, url_path="refresh-all-token-owners", methods=["POST"])
     def refresh_all_token_owners(self, request, address, *args, **kwargs):
-        refresh_all_owners_for_collection(address)
-        return Response()
+        batch_job = refresh_all_owners_for_collection(address)
+        return Response({"batch_job_id": batch_job.id})
 
 
 router = routers.DefaultRouter()
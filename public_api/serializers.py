@@ -107,6 +107,14 @@ class PublicCollectionSerializerShort(serializers.ModelSerializer):
             return instance.profile_image_url
 
 
+class PublicHolderSerializer(serializers.ModelSerializer):
+    owner = PublicAccountSerializer()
+
+    class Meta:
+        model = models.CollectionHolder
+        fields = ["owner", "quantity"]
+
+
 class PublicTokenSerializer(serializers.ModelSerializer):
     image_url = serializers.URLField(source="image")
     collection = PublicCollectionSerializerShort()
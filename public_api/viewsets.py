@@ -201,15 +201,15 @@ class CollectionViewset(
         stats = {
             "stats": {
                 "one_day_volume": one_day_volume / 1000000000,
-                "one_day_change": collection.volume_change_24h(),
+                "one_day_change": collection.volume_change_24h,
                 "one_day_sales": one_day_sales,
                 "one_day_average_price": one_day_average_price / 1000000000,
                 "seven_day_volume": seven_day_volume / 1000000000,
-                "seven_day_change": collection.volume_change_7d(),
+                "seven_day_change": collection.volume_change_7d,
                 "seven_day_sales": seven_day_sales,
                 "seven_day_average_price": seven_day_average_price / 1000000000,
                 "thirty_day_volume": thirty_day_volume / 1000000000,
-                "thirty_day_change": collection.volume_change_30d(),
+                "thirty_day_change": collection.volume_change_30d,
                 "thirty_day_sales": thirty_day_sales,
                 "thirty_day_average_price": thirty_day_average_price / 1000000000,
                 "total_volume": collection.volume / 1000000000,
@@ -245,6 +245,38 @@ class CollectionViewset(
         print(daily_stats)
         return Response(data=daily_stats, status=200)
 
+    @method_decorator(cache_page(60))  # 1 minute
+    @action(detail=True, url_path="holders", methods=["GET"])
+    def holders(self, request, address, *args, **kwargs):
+        try:
+            collection = models.Erc721Collection.objects.get(
+                slug=address, approved=True
+            )
+        except models.Erc721Collection.DoesNotExist:
+            if address.startswith("0x"):
+                address = Web3.toChecksumAddress(address)
+                collection = get_object_or_404(
+                    self.queryset, address=address, approved=True
+                )
+            else:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+            holders, next_cursor = collection.top_holders(
+                limit, request.query_params.get("cursor")
+            )
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = serializers.PublicHolderSerializer(holders, many=True)
+        data = {
+            **collection.holder_distribution(),
+            "holders": serializer.data,
+            "next": next_cursor,
+        }
+        return Response(data=data, status=200)
+
 
 class AssetViewset(viewsets.ModelViewSet):
     queryset = models.Erc721Token.objects.filter(approved=True)
@@ -367,6 +367,7 @@ CELERY_IMPORTS = (
     "batch_processing.tasks.collection.tasks",
     "batch_processing.tasks.common.tasks",
     "batch_processing.tasks.scheduler.tasks",
+    "batch_processing.tasks.profile.tasks",
 )
 
 if DEBUG_TOOLBAR:
@@ -1,15 +1,34 @@
 import asyncio
 import json
-import subprocess
+import os
 
+import django
 import websockets
 from websockets import exceptions
 
-from api.utils.constants import ETH_ALCHEMY_WS_URL
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "quixotic_backend.settings")
+django.setup()
+
+from asgiref.sync import sync_to_async
+
+from api.models import Contract
+from api.utils.constants import ETH_ALCHEMY_WS_URL, NETWORK
+from api.utils.transfer_pipeline import TransferEventPipeline
+
+L1_NETWORK = "eth-" + NETWORK[4:]
+
+
+def get_approved_l1_contracts():
+    return [
+        (contract.address, contract.type)
+        for contract in Contract.objects.filter(
+            collection__approved=True, network__network_id=L1_NETWORK
+        )
+    ]
 
 
 # Listen for transfer events from known ERC721/1155 collections
-async def start_websocket(collection_ids_subset):
+async def start_websocket(collection_ids_subset, pipeline):
     print(f"Initializing tokens websocket")
     async with websockets.connect(ETH_ALCHEMY_WS_URL) as websocket:
         for col_id, col_type in collection_ids_subset:
@@ -43,25 +62,16 @@ async def start_websocket(collection_ids_subset):
                 params = message.get("params")
                 if params:
                     transfer_event = params["result"]
-                    subprocess.Popen(
-                        [
-                            "python",
-                            "manage.py",
-                            "process_transfer_txn_l1",
-                            json.dumps(transfer_event),
-                        ]
-                    )
+                    await pipeline.put(transfer_event)
             except Exception as e:
                 print(e)
 
 
 async def create_websockets():
-    p = subprocess.run(
-        ["python", "manage.py", "get_approved_l1_contracts"],
-        capture_output=True,
-        text=True,
-    )
-    collection_ids = json.loads(p.stdout)
+    collection_ids = await sync_to_async(get_approved_l1_contracts)()
+
+    pipeline = TransferEventPipeline(network=L1_NETWORK)
+    await pipeline.start()
 
     chunkSize = 500
     i = 0
@@ -70,9 +80,13 @@ async def create_websockets():
     while i < len(collection_ids):
         collection_ids_subset = collection_ids[i : i + chunkSize]
         print(f"Creating websocket for contracts indexed {i} through {i+chunkSize-1}")
-        websockets.append(start_websocket(collection_ids_subset))
+        websockets.append(start_websocket(collection_ids_subset, pipeline))
         i += chunkSize
-    await asyncio.gather(*websockets)
+
+    try:
+        await asyncio.gather(*websockets)
+    finally:
+        await pipeline.stop()
 
 
 try: